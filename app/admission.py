@@ -0,0 +1,250 @@
+import asyncio
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "bulk": PRIORITY_BULK}
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝；status_code 为 429（单个客户端超额）或 503（整体过载）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client_id: str, priority: int, seq: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.client_id = client_id
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop else None
+        self.event: Optional[threading.Event] = None if loop else threading.Event()
+        self.granted = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_set_result, self.future)
+        else:
+            self.event.set()
+
+
+def _set_result(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Ticket:
+    """已获准执行的请求，release 可重复调用"""
+
+    def __init__(self, controller: "AdmissionController", client_id: str):
+        self._controller = controller
+        self.client_id = client_id
+        self.started = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release(self.client_id, time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """
+    评分接口的准入控制。
+
+    - 同时执行的请求不超过 max_concurrent，排队的不超过 max_queue，超出直接返回 503
+    - 单个客户端（执行中 + 排队中）不超过 max_per_client，超出返回 429
+    - 排队按优先级（interactive 先于 bulk），同一优先级内优先放行执行中请求最少的客户端
+    - 排队超过 queue_timeout 秒返回 503，避免请求无限期堆积
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, max_per_client: int = 8, queue_timeout: float = 30.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_per_client = max(1, max_per_client)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._running = 0
+        self._waiters: List[_Waiter] = []
+        self._running_by_client: Dict[str, int] = {}
+        self._queued_by_client: Dict[str, int] = {}
+        self._avg_service = 1.0
+        # 统计信息
+        self._admitted = 0
+        self._rejected_429 = 0
+        self._rejected_503 = 0
+        self._timeouts = 0
+
+    def _retry_after(self) -> float:
+        """按平均处理时长估算排队清空所需时间"""
+        return max(1.0, self._avg_service * (len(self._waiters) + 1) / self.max_concurrent)
+
+    def _try_enter(self, client_id: str, priority: int, shed: bool, loop) -> Optional[_Waiter]:
+        """立即放行返回 None，需要排队返回 _Waiter；超额时抛出 AdmissionRejected"""
+        with self._lock:
+            in_use = self._running_by_client.get(client_id, 0) + self._queued_by_client.get(client_id, 0)
+            if shed and in_use >= self.max_per_client:
+                self._rejected_429 += 1
+                raise AdmissionRejected(
+                    f"客户端 {client_id} 同时进行的请求过多（上限 {self.max_per_client}）", 429, self._retry_after()
+                )
+            if self._running < self.max_concurrent and not any(w.priority <= priority for w in self._waiters):
+                self._start(client_id)
+                return None
+            if shed and len(self._waiters) >= self.max_queue:
+                self._rejected_503 += 1
+                raise AdmissionRejected("服务繁忙，排队已满", 503, self._retry_after())
+            waiter = _Waiter(client_id, priority, next(self._seq), loop)
+            self._waiters.append(waiter)
+            self._queued_by_client[client_id] = self._queued_by_client.get(client_id, 0) + 1
+            return waiter
+
+    def _start(self, client_id: str) -> None:
+        self._running += 1
+        self._admitted += 1
+        self._running_by_client[client_id] = self._running_by_client.get(client_id, 0) + 1
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        self._waiters.remove(waiter)
+        left = self._queued_by_client[waiter.client_id] - 1
+        if left:
+            self._queued_by_client[waiter.client_id] = left
+        else:
+            del self._queued_by_client[waiter.client_id]
+
+    def _release(self, client_id: str, duration: float) -> None:
+        with self._lock:
+            self._running -= 1
+            left = self._running_by_client.get(client_id, 1) - 1
+            if left:
+                self._running_by_client[client_id] = left
+            else:
+                self._running_by_client.pop(client_id, None)
+            self._avg_service = 0.9 * self._avg_service + 0.1 * duration
+            self._grant_next()
+
+    def _grant_next(self) -> None:
+        while self._running < self.max_concurrent and self._waiters:
+            waiter = min(
+                self._waiters,
+                key=lambda w: (w.priority, self._running_by_client.get(w.client_id, 0), w.seq),
+            )
+            self._dequeue(waiter)
+            self._start(waiter.client_id)
+            waiter.grant()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """放弃排队；若已被放行则返回 True（调用方需要释放名额）"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._dequeue(waiter)
+            return False
+
+    async def acquire(self, client_id: str, priority: int = PRIORITY_INTERACTIVE) -> Ticket:
+        waiter = self._try_enter(client_id, priority, True, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    with self._lock:
+                        self._timeouts += 1
+                        self._rejected_503 += 1
+                    raise AdmissionRejected("服务繁忙，排队超时", 503, self._retry_after())
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    Ticket(self, client_id).release()
+                raise
+        return Ticket(self, client_id)
+
+    def acquire_sync(self, client_id: str, priority: int = PRIORITY_BULK, shed: bool = False) -> Ticket:
+        """供工作线程使用；shed=False 时不受排队上限和超时限制（用于后台任务）"""
+        waiter = self._try_enter(client_id, priority, shed, None)
+        if waiter is not None:
+            timeout = self.queue_timeout if shed else None
+            if not waiter.event.wait(timeout) and not self._abandon(waiter):
+                with self._lock:
+                    self._timeouts += 1
+                    self._rejected_503 += 1
+                raise AdmissionRejected("服务繁忙，排队超时", 503, self._retry_after())
+        return Ticket(self, client_id)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[Ticket]:
+        ticket = await self.acquire(client_id, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    @contextmanager
+    def admit_sync(self, client_id: str, priority: int = PRIORITY_BULK, shed: bool = False) -> Iterator[Ticket]:
+        ticket = self.acquire_sync(client_id, priority, shed)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_per_client": self.max_per_client,
+                "admitted_total": self._admitted,
+                "rejected_429_total": self._rejected_429,
+                "rejected_503_total": self._rejected_503,
+                "queue_timeouts_total": self._timeouts,
+                "avg_service_seconds": round(self._avg_service, 3),
+            }
+
+
+# 进程内唯一的准入控制器（评分接口与检索接口各一个）
+admission_controller: Optional[AdmissionController] = None
+search_admission_controller: Optional[AdmissionController] = None
+_admission_lock = threading.Lock()
+
+
+def get_admission_controller(cfg) -> AdmissionController:
+    """获取（必要时按配置创建）准入控制器；配置中的总限额按工作进程数平分"""
+    global admission_controller
+    with _admission_lock:
+        if admission_controller is None:
+            admission_controller = AdmissionController(
+                max_concurrent=cfg.per_worker(cfg.admission_max_concurrent),
+                max_queue=cfg.per_worker(cfg.admission_max_queue),
+                max_per_client=cfg.per_worker(cfg.admission_max_per_client),
+                queue_timeout=cfg.admission_queue_timeout,
+            )
+    return admission_controller
+
+
+def get_search_admission_controller(cfg) -> AdmissionController:
+    """检索接口的准入控制器，单客户端上限与评分接口相同"""
+    global search_admission_controller
+    with _admission_lock:
+        if search_admission_controller is None:
+            search_admission_controller = AdmissionController(
+                max_concurrent=cfg.per_worker(cfg.search_max_concurrent),
+                max_queue=cfg.per_worker(cfg.search_max_queue),
+                max_per_client=cfg.per_worker(cfg.admission_max_per_client),
+                queue_timeout=cfg.search_queue_timeout,
+            )
+    return search_admission_controller
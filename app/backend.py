@@ -1,32 +1,76 @@
+import asyncio
 import json
+import logging
 import os
+import platform
+import resource
+import sys
+import threading
+import time
 from pathlib import Path
-from typing import List, Any
+from typing import Dict, List, Any, Optional, Union
 
+import anyio
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 from config import get_config
-from app.service import score_candidate, score_from_dataset  # 更新导入
+from app.serve import set_thread_env
+
+# 线程数环境变量只在 OpenMP / MKL 初始化时读取，必须在下面导入 torch / FAISS 之前设置
+load_dotenv()
+set_thread_env(get_config())
+
+from app.service import ascore_batch, ascore_first_page, ascore_next_page, ascore_resumes, asearch_candidates, score_candidate, score_from_dataset, stream_score_from_dataset  # 更新导入
+from app import metrics
+from app.admission import (
+    PRIORITIES,
+    PRIORITY_INTERACTIVE,
+    AdmissionRejected,
+    get_admission_controller,
+    get_search_admission_controller,
+)
+from app.jobs import get_job_manager
 from app.port_utils import find_free_port
+from app.ranked_cache import CursorExpired, get_ranked_cache
+from app import profiling, upload
+from app.traffic import get_traffic_recorder
+from app.request_context import RequestContextMiddleware
+from rag_system import tracing
+from rag_system.deadline import Deadline, RequestCancelled
+from rag_system.logging_utils import configure_logging, get_request_id
+from rag_system.rate_limiter import RateLimitExceeded
 from fastapi.middleware.cors import CORSMiddleware
 
 # 新增：导入 Gradio 并挂载
 # import gradio as gr  # 注释掉Gradio导入
 # from app.frontend import build_demo  # 注释掉Gradio前端导入
 
+logger = logging.getLogger(__name__)
+
+_STARTED_AT = time.time()
+
 class ScoreRequest(BaseModel):
     job_title: str = Field(..., description="岗位名称")
     requirements: str = Field("", description="特定要求/偏好")
     top_n: int = Field(3, description="返回前 N 个候选人")
+    deadline_ms: Optional[int] = Field(
+        None, gt=0, description="时间预算（毫秒），不足时依次缩小/跳过重排序、跳过大模型评估；对后台任务不生效"
+    )
+    include_timings: bool = Field(False, description="是否在响应中返回各阶段耗时")
+    categories: Optional[List[str]] = Field(
+        None, description="只检索这些类别的简历（为空时不过滤）"
+    )
 
 
 class ScoreItem(BaseModel):
     resume_index: int
-    original_id: int  # 新增：原始数据集中的ID
+    original_id: Union[int, str]  # 原始数据集中的ID；上传简历时为文件中的 id 列（没有时为序号）
     rerank_score: float  # 新增：重排序分数
     plan: dict
     parsed_resume: dict
@@ -38,6 +82,200 @@ class ScoreItem(BaseModel):
 
 class ScoreResponse(BaseModel):
     results: List[ScoreItem]
+    # 因时间预算不足而降级的阶段：rerank_depth（缩小重排序范围）、rerank（跳过重排序）、llm（跳过大模型评估）
+    degraded_stages: List[str] = []
+    # 各阶段耗时（毫秒），仅在请求 include_timings 时返回；同样的数据也在 Server-Timing 响应头中
+    timings: Optional[Dict[str, float]] = None
+    # 还有未评估的候选人时，POST /api/score/next 的游标；已无更多候选人或未启用分页时为 null
+    next_cursor: Optional[str] = None
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="查询语句（如岗位名称与要求）")
+    top_k: int = Field(10, ge=1, le=100, description="返回结果数量")
+    rerank: bool = Field(True, description="是否用交叉编码器重排序；为 false 时只做混合检索（最快）")
+    categories: Optional[List[str]] = Field(None, description="只返回这些类别的简历")
+    include_content: bool = Field(False, description="是否返回完整简历文本（默认只返回预览）")
+    deadline_ms: Optional[int] = Field(None, gt=0, description="时间预算（毫秒），不足时缩小或跳过重排序")
+    include_timings: bool = Field(False, description="是否在响应中返回各阶段耗时")
+
+
+class SearchHit(BaseModel):
+    rank: int
+    id: Union[int, str]
+    category: str
+    preview: str
+    retrieval_score: float  # 混合检索的加权倒数排名融合分数
+    rerank_score: Optional[float] = None  # 交叉编码器分数，未重排序时为 null
+    content: Optional[str] = None
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    degraded_stages: List[str] = []
+    timings: Optional[Dict[str, float]] = None
+
+
+class NextPageRequest(BaseModel):
+    cursor: str = Field(..., description="上一页响应中的 next_cursor")
+    page_size: int = Field(3, ge=1, le=50, description="本页评估的候选人数")
+    deadline_ms: Optional[int] = Field(None, gt=0, description="时间预算（毫秒），不足时跳过大模型评估")
+    include_timings: bool = Field(False, description="是否在响应中返回各阶段耗时")
+
+
+class BatchScoreRequest(BaseModel):
+    # 各岗位的 deadline_ms、include_timings 不生效，使用整批的设置
+    jobs: List[ScoreRequest] = Field(..., min_length=1, max_length=100, description="岗位列表")
+    deadline_ms: Optional[int] = Field(None, gt=0, description="整批的时间预算（毫秒），不足时跳过大模型评估")
+    include_timings: bool = Field(False, description="是否在响应中返回各阶段耗时")
+
+
+class BatchJobResult(BaseModel):
+    job_title: str
+    results: List[ScoreItem]
+    error: Optional[str] = None  # 该岗位评分失败的原因（其余岗位不受影响）
+
+
+class BatchScoreResponse(BaseModel):
+    results: List[BatchJobResult]  # 与请求中的 jobs 一一对应
+    degraded_stages: List[str] = []
+    timings: Optional[Dict[str, float]] = None
+
+
+class JobCreateResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # queued / running / succeeded / failed / cancelled
+    request: ScoreRequest
+    completed: int  # 已完成大模型评估的候选人数
+    total: int  # 候选人总数（检索完成前为0）
+    partial_results: List[ScoreItem]  # 已完成的评估，resume_index 为重排序名次
+    results: Optional[List[ScoreItem]] = None  # 完成后按综合评分排序的最终结果
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+def _to_score_item(idx: int, result: dict) -> ScoreItem:
+    """将 service 层的结构化结果转换为 ScoreItem"""
+    summary_score = result["report"]["ordered_scores"][0]["score"] if result["report"]["ordered_scores"] else 0
+    raw_resume = result.get("plan", {}).get("normalized_resume", "")
+
+    # 获取原始ID和重排序分数
+    original_id = result.get("candidate_info", {}).get("id", idx)
+    rerank_score = result.get("candidate_info", {}).get("rerank_score", 0.0)
+
+    return ScoreItem(
+        resume_index=idx,
+        original_id=original_id,  # 添加原始ID
+        rerank_score=rerank_score,  # 添加重排序分数
+        plan=result["plan"],
+        parsed_resume=result["parsed_resume"],
+        scores=result["scores"],
+        report=result["report"],
+        summary_score=summary_score,
+        raw_resume=raw_resume,
+    )
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, int(seconds + 0.999)))}
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    """请求体读取完毕后，receive 只会在客户端断开时返回 http.disconnect"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(request: Request, coro) -> Any:
+    """
+    执行 coro，客户端先断开时取消它（取消会一直传递到重排序批次和大模型请求）。
+    客户端已断开时返回 499。
+    """
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task not in done:
+        logger.info("客户端已断开，已取消评分")
+        raise HTTPException(status_code=499, detail="客户端已断开连接")
+    return task.result()
+
+
+def _timings(req: BaseModel) -> Optional[Dict[str, float]]:
+    """请求要求返回耗时时，汇总当前请求各阶段的耗时"""
+    current = tracing.current_trace()
+    if not req.include_timings or current is None:
+        return None
+    return current.timings()
+
+
+def _client_identity(request: Request, trust_client_header: bool = False) -> tuple:
+    """
+    客户端标识与优先级：已认证的用户（认证中间件写入的 scope["user"]）优先，否则使用来源地址
+    （部署在反向代理之后时需开启 uvicorn 的 proxy headers，来源地址才是真实客户端）。
+    X-Client-Id 头可由客户端任意设置，只在 trust_client_header 为 True（由前置网关认证后写入该头）时使用。
+    X-Priority 取 interactive（默认）或 bulk。
+    """
+    user = request.scope.get("user")
+    if user is not None and getattr(user, "is_authenticated", False):
+        client_id = f"user:{user.identity}"
+    elif trust_client_header and request.headers.get("x-client-id"):
+        client_id = request.headers["x-client-id"]
+    else:
+        client_id = request.client.host if request.client else "unknown"
+    priority = PRIORITIES.get((request.headers.get("x-priority") or "").lower(), PRIORITY_INTERACTIVE)
+    return client_id, priority
+
+
+def _process_info() -> Dict[str, Any]:
+    """当前进程的内存、线程与运行时长"""
+    info: Dict[str, Any] = {
+        "pid": os.getpid(),
+        "python": platform.python_version(),
+        "uptime_seconds": round(time.time() - _STARTED_AT, 1),
+        "threads": threading.active_count(),
+        # Linux 下 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+    }
+    try:
+        with open("/proc/self/statm") as f:
+            info["rss_mb"] = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except (OSError, ValueError):
+        pass
+    return info
+
+
+def _pool_info(cfg) -> Dict[str, Any]:
+    """各线程池与计算线程的配置"""
+    torch = sys.modules.get("torch")
+    return {
+        "web_workers": cfg.web_workers,
+        "worker_threads": cfg.worker_threads,
+        "cpu_executor_workers": cfg.cpu_executor_workers,
+        "stream_max_workers": cfg.stream_max_workers,
+        "fallback_max_workers": cfg.fallback_max_workers,
+        "fallback_batch_size": cfg.fallback_batch_size,
+        "job_workers": cfg.job_workers,
+        "omp_num_threads": os.environ.get("OMP_NUM_THREADS"),
+        "torch_threads": torch.get_num_threads() if torch is not None else None,
+    }
 
 
 def _write_port_file(port: int):
@@ -46,7 +284,11 @@ def _write_port_file(port: int):
 
 def create_app() -> FastAPI:
     load_dotenv()
+    # 日志配置（每个进程一次）：级别、格式与载荷采样率由 LOG_LEVEL / LOG_FORMAT / LOG_PAYLOAD_SAMPLE_RATE 控制
+    configure_logging()
     cfg = get_config()
+    admission = get_admission_controller(cfg)
+    search_admission = get_search_admission_controller(cfg)
     app = FastAPI(title="简历筛选助手 API", version="0.1.0")
     
     # 添加跨域支持
@@ -57,6 +299,19 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # 请求级指标，并为管线内部的阶段指标提供 route 标签
+    metrics.install(app, cfg.gemini_model_name)
+    # 请求ID与请求追踪：写入日志上下文，通过 X-Request-Id、Server-Timing 响应头返回
+    tracing.install(cfg.trace_export_path)
+    # 按需性能分析（PROFILING_ENABLED），位于请求上下文之内以便报告带上请求ID
+    if cfg.profiling_enabled and not cfg.profiling_token:
+        logger.warning("PROFILING_ENABLED=1 但未设置 PROFILING_TOKEN，按需性能分析与 /debug 接口不启用")
+    if cfg.profiling_enabled and cfg.profiling_token:
+        app.add_middleware(profiling.ProfilingMiddleware, cfg=cfg)
+    app.add_middleware(RequestContextMiddleware)
+    # 评分任务：每个进程启动时（多进程模式下为 fork 之后的工作进程）启动续约线程并恢复未完成的任务，
+    # 而不是等到第一次调用 /api/jobs
+    app.add_event_handler("startup", lambda: get_job_manager(cfg))
     
     # 新增：根路径重定向到前端
     @app.get("/")
@@ -69,54 +324,533 @@ def create_app() -> FastAPI:
     def health():
         return {"status": "正常"}  # 修改为中文
 
+    # 运行状态：索引类型与大小、数据集版本、模型加载耗时、缓存命中率、线程池配置、预热与准入状态，
+    # 便于容量规划；RAG 系统尚未初始化时 rag 为 null（不会因此触发初始化）
+    @app.get("/api/system")
+    def system_info():
+        from app import service
+        ranked_cache = get_ranked_cache(cfg)
+        rag = service.rag_system
+        return {
+            "process": _process_info(),
+            "rag": rag.get_system_info() if rag is not None else None,
+            "caches": {
+                "score_singleflight": service.score_flights.stats(),
+                "ranked": ranked_cache.stats() if ranked_cache is not None else None,
+                "hit_rates": metrics.cache_stats(),
+            },
+            "pools": _pool_info(cfg),
+            "admission": admission.stats(),
+            "search_admission": search_admission.stats(),
+        }
+
+    # Prometheus 指标：各阶段耗时、缓存命中、token 用量、429、降级次数、索引规模与并发请求数
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        from app import service
+        metrics.update_index_gauges(service.rag_system, cfg.gemini_model_name)
+        metrics.update_rate_limiter_gauges(cfg.gemini_model_name)
+        content, content_type = metrics.render_latest()
+        return Response(content=content, media_type=content_type)
+
     # 修改为同时支持 /api/score 和 /score 路由
+    # 使用异步处理函数：等待大模型响应期间不占用线程池
     @app.post("/api/score", response_model=ScoreResponse)
-    def score_api(req: ScoreRequest):
-        return score_impl(req)
+    async def score_api(req: ScoreRequest, request: Request):
+        return await score_impl(req, request)
 
     @app.post("/score", response_model=ScoreResponse)
-    def score(req: ScoreRequest):
-        return score_impl(req)
+    async def score(req: ScoreRequest, request: Request):
+        return await score_impl(req, request)
+
+    recorder = get_traffic_recorder(cfg)
+
+    def record(request: Request, req: BaseModel) -> None:
+        """记录评分请求（设置了 TRAFFIC_RECORD_PATH 时），供压测回放"""
+        if recorder is not None:
+            recorder.record(
+                request.method, request.url.path, request.headers, req.model_dump(exclude_none=True), get_request_id()
+            )
 
-    # 修改score_impl函数以增加更多日志
-    def score_impl(req: ScoreRequest):
-        print(f"[后端] 接收到评分请求: job_title={req.job_title}, top_n={req.top_n}")
+    async def admit(request: Request, controller=admission):
+        """按客户端与优先级排队获取执行名额，过载时快速返回 429/503"""
+        client_id, priority = _client_identity(request, cfg.trust_client_id_header)
+        try:
+            return await controller.acquire(client_id, priority)
+        except AdmissionRejected as exc:
+            logger.warning("准入控制拒绝请求: client=%s, %s", client_id, exc)
+            raise HTTPException(
+                status_code=exc.status_code, detail=str(exc), headers=_retry_after_header(exc.retry_after)
+            ) from exc
+
+    # 每个请求只输出一条 INFO 汇总日志，其余细节在 DEBUG 级别
+    async def score_impl(req: ScoreRequest, request: Request):
+        logger.debug("接收到评分请求: job_title=%s, top_n=%d", req.job_title, req.top_n)
+        record(request, req)
         if not cfg.api_key:
-            print("[后端] 错误: 缺少API密钥")
+            logger.error("缺少API密钥")
             raise HTTPException(status_code=400, detail="缺少API密钥。")
+        started = time.perf_counter()
+        # 时间预算从请求到达时开始计算，准入排队的时间也计入
+        deadline = Deadline.from_ms(req.deadline_ms)
+        ticket = await admit(request)
         try:
-            print("[后端] 开始处理评分请求...")
-            # 使用同步函数处理评分
-            ranked = score_from_dataset(req.job_title, req.requirements, req.top_n, cfg)
-            print(f"[后端] 评分处理完成，返回 {len(ranked) if ranked else 0} 个结果")
+            # 使用异步管线处理评分；客户端断开时取消仍在进行的工作
+            ranked, cursor = await _cancel_on_disconnect(
+                request,
+                ascore_first_page(req.job_title, req.requirements, req.top_n, cfg, deadline, req.categories),
+            )
+        except RateLimitExceeded as exc:
+            logger.warning("大模型调用限流，拒绝请求: %s", exc)
+            raise HTTPException(
+                status_code=503,
+                detail=f"大模型调用繁忙，请稍后重试: {exc}",
+                headers=_retry_after_header(exc.retry_after),
+            ) from exc
+        except HTTPException:
+            raise
         except Exception as exc:  # noqa: BLE001
-            print(f"[后端] 评分处理过程中发生错误: {exc}")
+            logger.error("评分处理过程中发生错误: %s", exc, exc_info=True)
             raise HTTPException(status_code=500, detail=f"搜索/评分失败: {exc}") from exc
+        finally:
+            ticket.release()
+
+        items: List[ScoreItem] = [
+            _to_score_item(idx, result) for idx, result in enumerate(ranked or [])  # 添加None检查
+        ]
+        degraded = deadline.degraded if deadline is not None else []
+        logger.info(
+            "评分完成",
+            extra={
+                "job_title": req.job_title,
+                "top_n": req.top_n,
+                "results": len(items),
+                "degraded_stages": degraded,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+        return ScoreResponse(
+            results=items,
+            degraded_stages=degraded,
+            timings=_timings(req),
+            next_cursor=cursor,
+        )
+
+    # 只检索不评分：返回重排序后的候选人（真实的检索/重排序分数、类别与预览），不调用大模型，
+    # 不经过评分接口的准入排队（计算在 SimpleRAG 的专用线程池中进行，本身有并发上限）
+    @app.post("/api/search", response_model=SearchResponse)
+    async def search_api(req: SearchRequest, request: Request):
+        return await search_impl(req, request)
 
-        items: List[ScoreItem] = []
-        for idx, result in enumerate(ranked or []):  # 添加None检查
-            summary_score = result["report"]["ordered_scores"][0]["score"] if result["report"]["ordered_scores"] else 0
-            raw_resume = result.get("plan", {}).get("normalized_resume", "")
-            
-            # 获取原始ID和重排序分数
-            original_id = result.get("candidate_info", {}).get("id", idx)
-            rerank_score = result.get("candidate_info", {}).get("rerank_score", 0.0)
-            
-            items.append(
-                ScoreItem(
-                    resume_index=idx,
-                    original_id=original_id,  # 添加原始ID
-                    rerank_score=rerank_score,  # 添加重排序分数
-                    plan=result["plan"],
-                    parsed_resume=result["parsed_resume"],
-                    scores=result["scores"],
-                    report=result["report"],
-                    summary_score=summary_score,
-                    raw_resume=raw_resume,
+    @app.get("/api/search", response_model=SearchResponse)
+    async def search_get(
+        request: Request,
+        q: str = Query(..., min_length=1, description="查询语句"),
+        top_k: int = Query(10, ge=1, le=100),
+        rerank: bool = True,
+        category: Optional[List[str]] = Query(None, description="可重复，只返回这些类别"),
+        include_content: bool = False,
+        deadline_ms: Optional[int] = Query(None, gt=0),
+        include_timings: bool = False,
+    ):
+        return await search_impl(
+            SearchRequest(
+                query=q,
+                top_k=top_k,
+                rerank=rerank,
+                categories=category,
+                include_content=include_content,
+                deadline_ms=deadline_ms,
+                include_timings=include_timings,
+            ),
+            request,
+        )
+
+    async def search_impl(req: SearchRequest, request: Request) -> SearchResponse:
+        started = time.perf_counter()
+        deadline = Deadline.from_ms(req.deadline_ms)
+        ticket = await admit(request, search_admission)
+        try:
+            candidates = await _cancel_on_disconnect(
+                request, asearch_candidates(req.query, req.top_k, cfg, req.rerank, req.categories, deadline)
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        except HTTPException:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.error("检索过程中发生错误: %s", exc, exc_info=True)
+            raise HTTPException(status_code=500, detail=f"检索失败: {exc}") from exc
+        finally:
+            ticket.release()
+
+        hits = [
+            SearchHit(
+                rank=rank,
+                id=candidate.get("id", rank),
+                category=str(candidate.get("category", "Unknown")),
+                preview=candidate.get("preview", ""),
+                retrieval_score=candidate.get("retrieval_score", 0.0),
+                rerank_score=candidate.get("rerank_score"),
+                content=candidate.get("content") if req.include_content else None,
+            )
+            for rank, candidate in enumerate(candidates)
+        ]
+        degraded = deadline.degraded if deadline is not None else []
+        logger.info(
+            "检索完成",
+            extra={
+                "top_k": req.top_k,
+                "rerank": req.rerank,
+                "results": len(hits),
+                "degraded_stages": degraded,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+        return SearchResponse(results=hits, degraded_stages=degraded, timings=_timings(req))
+
+    # 下一页：从首页缓存的重排序名单中取下一段候选人评估，resume_index 为在名单中的名次
+    @app.post("/api/score/next", response_model=ScoreResponse)
+    async def score_next(req: NextPageRequest, request: Request):
+        record(request, req)
+        if not cfg.api_key:
+            logger.error("缺少API密钥")
+            raise HTTPException(status_code=400, detail="缺少API密钥。")
+        started = time.perf_counter()
+        deadline = Deadline.from_ms(req.deadline_ms)
+        ticket = await admit(request)
+        try:
+            ranked, ranks, following = await _cancel_on_disconnect(
+                request, ascore_next_page(req.cursor, req.page_size, cfg, deadline)
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        except CursorExpired as exc:
+            raise HTTPException(status_code=410, detail=str(exc)) from exc
+        except RateLimitExceeded as exc:
+            logger.warning("大模型调用限流，拒绝请求: %s", exc)
+            raise HTTPException(
+                status_code=503,
+                detail=f"大模型调用繁忙，请稍后重试: {exc}",
+                headers=_retry_after_header(exc.retry_after),
+            ) from exc
+        except HTTPException:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.error("分页评分过程中发生错误: %s", exc, exc_info=True)
+            raise HTTPException(status_code=500, detail=f"评分失败: {exc}") from exc
+        finally:
+            ticket.release()
+
+        items = [_to_score_item(rank, result) for rank, result in zip(ranks, ranked)]
+        degraded = deadline.degraded if deadline is not None else []
+        logger.info(
+            "分页评分完成",
+            extra={
+                "cursor": req.cursor,
+                "results": len(items),
+                "degraded_stages": degraded,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+        return ScoreResponse(results=items, degraded_stages=degraded, timings=_timings(req), next_cursor=following)
+
+    # 批量评分：多个岗位共享查询嵌入、向量检索、BM25 与重排序计算，大模型评估按岗位并发进行
+    @app.post("/api/score/batch", response_model=BatchScoreResponse)
+    async def score_batch(req: BatchScoreRequest, request: Request):
+        record(request, req)
+        if not cfg.api_key:
+            logger.error("缺少API密钥")
+            raise HTTPException(status_code=400, detail="缺少API密钥。")
+        started = time.perf_counter()
+        deadline = Deadline.from_ms(req.deadline_ms)
+        ticket = await admit(request)
+        jobs = [(job.job_title, job.requirements, job.top_n, job.categories) for job in req.jobs]
+        try:
+            outcomes = await _cancel_on_disconnect(request, ascore_batch(jobs, cfg, deadline))
+        except HTTPException:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.error("批量评分过程中发生错误: %s", exc, exc_info=True)
+            raise HTTPException(status_code=500, detail=f"批量评分失败: {exc}") from exc
+        finally:
+            ticket.release()
+
+        results = [
+            BatchJobResult(
+                job_title=job.job_title,
+                results=[_to_score_item(idx, result) for idx, result in enumerate(ranked)],
+                error=error,
+            )
+            for job, (ranked, error) in zip(req.jobs, outcomes)
+        ]
+        degraded = deadline.degraded if deadline is not None else []
+        logger.info(
+            "批量评分完成",
+            extra={
+                "jobs": len(jobs),
+                "failed": sum(1 for result in results if result.error),
+                "degraded_stages": degraded,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+        return BatchScoreResponse(results=results, degraded_stages=degraded, timings=_timings(req))
+
+    # 流式评分：先返回重排序后的候选人，再逐个返回大模型评估，最后返回排序汇总
+    @app.post("/api/score/stream")
+    async def score_stream_api(req: ScoreRequest, request: Request):
+        return await score_stream_impl(req, request)
+
+    @app.get("/api/score/stream")
+    async def score_stream_get(
+        request: Request,
+        job_title: str,
+        requirements: str = "",
+        top_n: int = 3,
+        deadline_ms: Optional[int] = None,
+        include_timings: bool = False,
+        category: Optional[List[str]] = Query(None, description="可重复，只检索这些类别"),
+    ):
+        # 便于浏览器 EventSource 直接订阅
+        return await score_stream_impl(
+            ScoreRequest(
+                job_title=job_title,
+                requirements=requirements,
+                top_n=top_n,
+                deadline_ms=deadline_ms,
+                include_timings=include_timings,
+                categories=category,
+            ),
+            request,
+        )
+
+    async def score_stream_impl(req: ScoreRequest, request: Request):
+        """
+        事件依次为 candidates（List[ScoreItem]）、evaluation（ScoreItem，每个候选人一条）、
+        summary（ScoreResponse）。所有事件中的 resume_index 均为重排序名次。
+        """
+        logger.info("接收到流式评分请求", extra={"job_title": req.job_title, "top_n": req.top_n})
+        record(request, req)
+        if not cfg.api_key:
+            logger.error("缺少API密钥")
+            raise HTTPException(status_code=400, detail="缺少API密钥。")
+        # 在开始推送前完成准入；名额由响应的后台任务释放：推送结束或客户端断开后都会执行，
+        # 不依赖生成器是否开始运行
+        deadline = Deadline.from_ms(req.deadline_ms)
+        ticket = await admit(request)
+
+        def sync_event_stream():
+            try:
+                stream = stream_score_from_dataset(
+                    req.job_title, req.requirements, req.top_n, cfg, deadline, req.categories
                 )
+                for event, payload in stream:
+                    if event == "candidates":
+                        data = [_to_score_item(rank, result).model_dump() for rank, result in enumerate(payload)]
+                    elif event == "evaluation":
+                        rank, result = payload
+                        data = _to_score_item(rank, result).model_dump()
+                    else:
+                        data = ScoreResponse(
+                            results=[_to_score_item(rank, result) for rank, result in payload],
+                            degraded_stages=deadline.degraded if deadline is not None else [],
+                            timings=_timings(req),
+                        ).model_dump()
+                    yield _sse_event(event, data)
+            except RateLimitExceeded as exc:
+                logger.warning("大模型调用限流，终止流式评分: %s", exc)
+                yield _sse_event("error", {"detail": f"大模型调用繁忙，请稍后重试: {exc}", "retry_after": exc.retry_after})
+            except RequestCancelled:
+                logger.info("客户端已断开，已取消流式评分")
+            except Exception as exc:  # noqa: BLE001
+                logger.error("流式评分过程中发生错误: %s", exc, exc_info=True)
+                yield _sse_event("error", {"detail": f"搜索/评分失败: {exc}"})
+
+        async def event_stream():
+            # 客户端断开时 StreamingResponse 会取消本协程；同步生成器运行在线程池中不会随之停止，
+            # 需要立即放弃等待，并通过 deadline 通知它撤回尚未执行的重排序批次和大模型调用
+            events = sync_event_stream()
+            finished = False
+            try:
+                while True:
+                    chunk = await anyio.to_thread.run_sync(next, events, None, abandon_on_cancel=True)
+                    if chunk is None:
+                        break
+                    yield chunk
+                finished = True
+            finally:
+                if not finished:
+                    deadline.cancel()
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(ticket.release),
+        )
+
+    # 外部简历批量评分：请求体为 CSV（带表头）或 JSONL，边上传边评分，以 NDJSON 逐行返回
+    @app.post("/api/score/upload")
+    async def score_upload(
+        request: Request,
+        job_title: str,
+        requirements: str = "",
+        top_n: int = Query(10, ge=1, le=100),
+        format: Optional[str] = Query(None, description="csv 或 jsonl，默认按 Content-Type 判断"),
+    ):
+        """
+        每行一个 JSON 对象：{"type": "result", "item": ScoreItem}（resume_index 为上传文件中的序号）、
+        {"type": "error", "index", "error"}，最后一行为
+        {"type": "summary", "total", "scored", "failed", "truncated", "top": List[ScoreItem]}。
+        """
+        fmt = upload.detect_format(request.headers.get("content-type", ""), format)
+        if fmt not in upload.FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的格式: {fmt}（支持 csv、jsonl）")
+        if not cfg.api_key:
+            logger.error("缺少API密钥")
+            raise HTTPException(status_code=400, detail="缺少API密钥。")
+        ticket = await admit(request)
+        started = time.perf_counter()
+
+        def line(data: Dict[str, Any]) -> str:
+            return json.dumps(data, ensure_ascii=False) + "\n"
+
+        async def ndjson_stream():
+            scored = failed = 0
+            body = request.stream()
+            try:
+                rows = upload.iter_rows(body, fmt)
+                async for event, payload in ascore_resumes(job_title, requirements, rows, cfg, top_n):
+                    if event == "result":
+                        index, result = payload
+                        scored += 1
+                        yield line({"type": "result", "item": _to_score_item(index, result).model_dump()})
+                    elif event == "error":
+                        failed += 1
+                        yield line({"type": "error", **payload})
+                    else:
+                        yield line({
+                            "type": "summary",
+                            "total": payload["total"],
+                            "scored": scored,
+                            "failed": payload["failed"],
+                            "truncated": payload["truncated"],
+                            "top": [_to_score_item(index, result).model_dump() for index, result in payload["top"]],
+                        })
+                        if payload["truncated"]:
+                            # 超过 upload_max_rows 后不再解析，但要读完请求体：否则客户端仍在上传时连接被关闭，
+                            # 可能收不到已经输出的结果
+                            async for _ in body:
+                                pass
+            except ClientDisconnect:
+                logger.info("客户端在上传过程中断开，已停止评分")
+                return
+            except ValueError as exc:
+                yield line({"type": "error", "error": f"文件解析失败: {exc}"})
+            except Exception as exc:  # noqa: BLE001
+                logger.error("上传简历评分过程中发生错误: %s", exc, exc_info=True)
+                yield line({"type": "error", "error": f"评分失败: {exc}"})
+            logger.info(
+                "上传简历评分完成",
+                extra={
+                    "job_title": job_title,
+                    "scored": scored,
+                    "failed": failed,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
             )
-        print(f"[后端] 返回 {len(items)} 个评分项")
-        return ScoreResponse(results=items)
+
+        return upload.BodyStreamingResponse(
+            ndjson_stream(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(ticket.release),
+        )
+
+    # 异步评分任务：提交后立即返回任务ID，通过轮询获取进度与结果
+    @app.post("/api/jobs", response_model=JobCreateResponse, status_code=202)
+    def create_job(req: ScoreRequest, request: Request):
+        record(request, req)
+        if not cfg.api_key:
+            logger.error("缺少API密钥")
+            raise HTTPException(status_code=400, detail="缺少API密钥。")
+        job_id = get_job_manager(cfg).submit(req.job_title, req.requirements, req.top_n, req.categories)
+        return JobCreateResponse(job_id=job_id, status="queued")
+
+    @app.get("/api/jobs/{job_id}", response_model=JobStatusResponse)
+    def get_job(job_id: str):
+        job = get_job_manager(cfg).get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+        return _job_status(job)
+
+    # 取消排队中或运行中的任务，运行中的重排序与大模型调用会尽快停止
+    @app.post("/api/jobs/{job_id}/cancel", response_model=JobStatusResponse)
+    def cancel_job(job_id: str):
+        job = get_job_manager(cfg).cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+        return _job_status(job)
+
+    def _job_status(job: dict) -> JobStatusResponse:
+        results = None
+        if job["result"] is not None:
+            results = [_to_score_item(rank, result) for rank, result in job["result"]]
+        return JobStatusResponse(
+            job_id=job["id"],
+            status=job["status"],
+            request=ScoreRequest(**job["request"]),
+            completed=len(job["partial"]),
+            total=job["total"],
+            partial_results=[_to_score_item(rank, result) for rank, result in job["partial"]],
+            results=results,
+            error=job["error"],
+            created_at=job["created_at"],
+            updated_at=job["updated_at"],
+        )
+
+    # 调试接口：最近的性能分析报告与 tracemalloc 内存快照，仅在 PROFILING_ENABLED 且设置了 PROFILING_TOKEN 时提供
+    if cfg.profiling_enabled and cfg.profiling_token:
+
+        def require_profiling_token(request: Request) -> None:
+            if not profiling.token_ok(cfg, request.headers.get(profiling.TOKEN_HEADER)):
+                raise HTTPException(status_code=403, detail="缺少或错误的 X-Profile-Token")
+
+        debug = [Depends(require_profiling_token)]
+
+        @app.get("/debug/profile", dependencies=debug, include_in_schema=False)
+        def list_profiles():
+            return {"mode": cfg.profiling_mode, "profiles": profiling.get_profile_store(cfg).list()}
+
+        @app.get("/debug/profile/{profile_id}", dependencies=debug, include_in_schema=False)
+        def get_profile(profile_id: str, format: str = "text", limit: int = Query(40, ge=1, le=500)):
+            report = profiling.get_profile_store(cfg).get(profile_id)
+            if report is None:
+                raise HTTPException(status_code=404, detail=f"分析报告不存在: {profile_id}")
+            if format not in report.profiler.formats:
+                raise HTTPException(
+                    status_code=400, detail=f"{report.profiler.mode} 报告支持的格式: {', '.join(report.profiler.formats)}"
+                )
+            content = report.profiler.render(format, limit)
+            if format == "html":
+                return HTMLResponse(content)
+            return PlainTextResponse(content)
+
+        # 第一次请求开始跟踪，之后每次返回分配最多的位置；diff=true 时返回相对上一次快照的增量
+        @app.get("/debug/tracemalloc", dependencies=debug, include_in_schema=False)
+        def tracemalloc_snapshot(
+            limit: int = Query(30, ge=1, le=500),
+            group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+            include: str = "",
+            diff: bool = False,
+            frames: int = Query(25, ge=1, le=100),
+        ):
+            return profiling.tracemalloc_snapshot(frames, limit, group_by, include, diff)
+
+        @app.delete("/debug/tracemalloc", dependencies=debug, include_in_schema=False)
+        def stop_tracemalloc():
+            profiling.stop_tracemalloc()
+            return {"tracing": False}
 
     # 新增：挂载 Gradio 前端，确保路径正确
     # gradio_app = build_demo()  # 注释掉Gradio应用创建
@@ -154,6 +888,13 @@ def run():
     
     # 修正：绑定到 0.0.0.0 而不是 127.0.0.1
     host = "0.0.0.0"
+
+    # 多进程模式：主进程预加载模型和索引后 fork 工作进程
+    cfg = get_config()
+    if cfg.web_workers > 1:
+        from app.serve import run_prefork
+        run_prefork(app, host, port, cfg)
+        return
     
     print(f"[后端] 运行在 http://{host}:{port}")  # 修正显示信息
     
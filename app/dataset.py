@@ -1,8 +1,9 @@
 import csv
+import logging
 import re
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import sys
 import os
 import requests
@@ -17,6 +18,8 @@ try:
 except ImportError:
     SimpleRAG = None
 
+logger = logging.getLogger(__name__)
+
 # 使用项目中的CSV文件或远程数据源
 DATASET_PATH = Path("rag_system/UpdatedResumeDataSet.csv")
 
@@ -31,17 +34,17 @@ def init_rag_system():
     
     # 在Vercel环境中，我们使用简化版本或跳过RAG初始化
     if os.environ.get("VERCEL") == "1":
-        print("在Vercel环境中，跳过RAG系统初始化")
+        logger.info("在Vercel环境中，跳过RAG系统初始化")
         return None
     
     try:
         if DATASET_PATH.exists():
             rag_system = SimpleRAG(str(DATASET_PATH))
-            print("RAG系统初始化成功")
+            logger.info("RAG系统初始化成功")
         else:
-            print(f"数据文件不存在: {DATASET_PATH}")
+            logger.warning("数据文件不存在: %s", DATASET_PATH)
     except Exception as e:
-        print(f"RAG系统初始化失败: {e}")
+        logger.error("RAG系统初始化失败: %s", e)
         rag_system = None
     
     return rag_system
@@ -55,7 +58,7 @@ def load_dataset() -> List[Tuple[str, str]]:
     # 在Vercel环境中，返回空数据集或使用远程数据源
     if os.environ.get("VERCEL") == "1":
         # 可以在这里实现从远程API获取数据的逻辑
-        print("在Vercel环境中，返回示例数据")
+        logger.info("在Vercel环境中，返回示例数据")
         return [
             ("Data Scientist", "Experienced data scientist with Python, machine learning, and deep learning expertise. 5 years of experience in building predictive models."),
             ("Software Engineer", "Senior software engineer with expertise in Java, Python, and cloud technologies. 8 years of experience in backend development."),
@@ -77,26 +80,13 @@ def load_dataset() -> List[Tuple[str, str]]:
 def _tokenize(text: str) -> List[str]:
     return re.findall(r"[a-zA-Z0-9]+", text.lower())
 
-def search_resumes(query: str, top_k: int = 5) -> List[str]:
+def search_resumes(query: str, top_k: int = 5, categories: Optional[List[str]] = None) -> List[Tuple[str, str]]:
     """
-    使用RAG系统搜索简历
+    使用RAG系统搜索简历，返回 [(类别, 简历文本)]；categories 不为空时只返回这些类别的简历
     """
     # 在Vercel环境中，使用简化的方法
     if os.environ.get("VERCEL") == "1":
-        corpus = load_dataset()
-        if not corpus:
-            return []
-        query_tokens = set(_tokenize(query))
-        scored: List[Tuple[float, str]] = []
-        for _, resume in corpus:
-            text_tokens = _tokenize(resume)
-            if not text_tokens:
-                continue
-            overlap = len(query_tokens.intersection(text_tokens))
-            if overlap > 0:
-                scored.append((overlap, resume))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [r for _, r in scored[:top_k]]
+        return _keyword_search(query, top_k, categories)
     
     # 初始化RAG系统（如果尚未初始化）
     init_rag_system()
@@ -104,24 +94,32 @@ def search_resumes(query: str, top_k: int = 5) -> List[str]:
     # 如果RAG系统可用，使用它进行搜索
     if rag_system is not None:
         try:
-            results = rag_system.search(query, top_k=top_k)
+            results = rag_system.search(query, top_k=top_k, categories=categories)
             # 提取简历内容
-            return [result['content'] for result in results]
+            return [(result.get('category', ''), result['content']) for result in results]
         except Exception as e:
-            print(f"RAG搜索失败，回退到关键词匹配: {e}")
+            logger.warning("RAG搜索失败，回退到关键词匹配: %s", e)
     
     # 回退到原来的关键词匹配方法
+    return _keyword_search(query, top_k, categories)
+
+
+def _keyword_search(query: str, top_k: int, categories: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """按查询词与简历的重合词数排序"""
     corpus = load_dataset()
     if not corpus:
         return []
+    allowed = set(categories) if categories else None
     query_tokens = set(_tokenize(query))
-    scored: List[Tuple[float, str]] = []
-    for _, resume in corpus:
+    scored: List[Tuple[float, str, str]] = []
+    for category, resume in corpus:
+        if allowed is not None and category not in allowed:
+            continue
         text_tokens = _tokenize(resume)
         if not text_tokens:
             continue
         overlap = len(query_tokens.intersection(text_tokens))
         if overlap > 0:
-            scored.append((overlap, resume))
+            scored.append((overlap, category, resume))
     scored.sort(key=lambda x: x[0], reverse=True)
-    return [r for _, r in scored[:top_k]]
\ No newline at end of file
+    return [(category, resume) for _, category, resume in scored[:top_k]]
\ No newline at end of file
@@ -79,8 +79,8 @@ def call_backend(job_title: str, requirements: str, top_n: int = 10) -> str:
         # 构造完整的API URL
         api_url = f"{BACKEND_URL}/api/score"
         
-        logger.info(f"发送请求到后端: {api_url}")
-        logger.info(f"请求数据: {payload}")
+        logger.info("发送请求到后端: %s", api_url)
+        logger.info("请求数据: %s", payload)
         
         # 发送POST请求到后端
         response = requests.post(
@@ -90,7 +90,7 @@ def call_backend(job_title: str, requirements: str, top_n: int = 10) -> str:
             timeout=300  # 5分钟超时
         )
         
-        logger.info(f"后端响应状态码: {response.status_code}")
+        logger.info("后端响应状态码: %d", response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -104,7 +104,7 @@ def call_backend(job_title: str, requirements: str, top_n: int = 10) -> str:
                 logger.error(error_msg)
                 return f"<p style='color: red;'>错误: {error_msg}</p>"
 
-            logger.info(f"收到 {len(results)} 个评分结果")
+            logger.info("收到 %d 个评分结果", len(results))
             
             # 检查是否有结果
             if not results:
@@ -0,0 +1,359 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from config import AgentConfig
+from app.admission import PRIORITY_BULK, get_admission_controller
+from app.service import stream_score_from_dataset
+from rag_system import instrumentation, tracing
+from rag_system.deadline import Deadline, RequestCancelled
+from rag_system.logging_utils import reset_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    partial TEXT NOT NULL DEFAULT '[]',
+    total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# 旧版任务表缺少的列（owner 为执行该任务的进程，lease_until 为租约到期时间）
+_MIGRATIONS = {
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+}
+
+
+class JobStore:
+    """
+    基于 SQLite 的任务表，进程重启后已完成的任务结果依然可查。
+
+    多个工作进程共用同一个任务表：任务由某个进程原子地认领（写入 owner 与租约到期时间），
+    执行期间定期续约；进程退出后租约过期，其他进程才会把任务重新排队。
+    取消只修改任务行的状态，执行任务的进程在续约时读到后停止。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, job_id: str, request: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, request, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(request, ensure_ascii=False), now, now),
+            )
+
+    def update(self, job_id: str, owner: Optional[str] = None, **fields: Any) -> bool:
+        """
+        更新任务字段，partial/result 会被序列化为 JSON。
+        指定 owner 时只在任务仍由该进程运行时更新（已被取消或租约已被接管时返回 False）
+        """
+        for key in ("partial", "result"):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        sql = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        params: List[Any] = [*fields.values(), job_id]
+        if owner is not None:
+            sql += " AND owner = ? AND status = ?"
+            params += [owner, JOB_RUNNING]
+        with self._lock, self._connect() as conn:
+            return conn.execute(sql, params).rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["partial"] = json.loads(job["partial"] or "[]")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def queued(self) -> List[str]:
+        """返回排队中的任务ID（按创建时间排序）"""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (JOB_QUEUED,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def claim(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """原子地认领排队中的任务；任务已被其他进程认领、已取消或不存在时返回 False"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (JOB_RUNNING, owner, now + lease_seconds, now, job_id, JOB_QUEUED),
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, owner: str, job_ids: List[str], lease_seconds: float) -> List[str]:
+        """为本进程运行中的任务续约，返回其中已不再由本进程运行的任务（已取消或租约已被接管）"""
+        if not job_ids:
+            return []
+        now = time.time()
+        lost = []
+        with self._lock, self._connect() as conn:
+            for job_id in job_ids:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                    (now + lease_seconds, job_id, owner, JOB_RUNNING),
+                )
+                if cursor.rowcount != 1:
+                    lost.append(job_id)
+        return lost
+
+    def requeue_expired(self) -> List[str]:
+        """把租约已过期（执行进程已退出）的运行中任务重新排队，返回这些任务ID"""
+        now = time.time()
+        requeued = []
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND lease_until < ? ORDER BY created_at", (JOB_RUNNING, now)
+            ).fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, partial = '[]', total = 0, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND lease_until < ?",
+                    (JOB_QUEUED, now, row["id"], JOB_RUNNING, now),
+                )
+                if cursor.rowcount == 1:
+                    requeued.append(row["id"])
+        return requeued
+
+    def cancel(self, job_id: str) -> bool:
+        """把排队中或运行中的任务标记为已取消；任务已结束或不存在时返回 False"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED, JOB_RUNNING),
+            )
+            return cursor.rowcount == 1
+
+
+class JobManager:
+    """评分任务队列：任务提交到本进程的线程池执行，状态与结果写入 JobStore（多个工作进程共用）"""
+
+    def __init__(self, cfg: AgentConfig):
+        self.cfg = cfg
+        self.store = JobStore(cfg.job_db_path)
+        # 本进程的标识，写入所认领任务的 owner 列
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = max(1.0, cfg.job_lease_seconds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 本进程运行中任务的取消信号，以及已提交到本进程线程池、尚未结束的任务
+        self._running: Dict[str, Deadline] = {}
+        self._pending: Set[str] = set()
+        self._state_lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+        self.pid = os.getpid()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # 线程池与续约线程在 start() 或首次提交任务时创建
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.cfg.job_workers), thread_name_prefix="score-job"
+                )
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="score-job-lease", daemon=True)
+                self._heartbeat.start()
+            return self._executor
+
+    def _heartbeat_loop(self) -> None:
+        """定期为运行中的任务续约，停止已在任务表中取消的任务，并接管租约过期的任务"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                with self._state_lock:
+                    running = dict(self._running)
+                for job_id in self.store.renew(self.owner, list(running), self.lease_seconds):
+                    running[job_id].cancel()
+                    logger.info("评分任务已在任务表中取消或被接管，停止执行: %s", job_id)
+                self.resume_unfinished()
+            except Exception as e:  # noqa: BLE001
+                logger.warning("评分任务续约失败: %s", e)
+
+    def start(self) -> None:
+        """启动线程池与续约线程并恢复未完成任务；续约线程随后持续接管其他进程退出后留下的任务"""
+        self._get_executor()
+        self.resume_unfinished()
+
+    def resume_unfinished(self) -> None:
+        """重新排队租约已过期的任务（执行进程已退出），并提交所有排队中的任务；认领是原子的，不会重复执行"""
+        requeued = self.store.requeue_expired()
+        if requeued:
+            logger.info("重新排队 %d 个租约过期的评分任务", len(requeued))
+        for job_id in self.store.queued():
+            self._submit(job_id)
+
+    def _submit(self, job_id: str) -> None:
+        with self._state_lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self._get_executor().submit(self._run, job_id)
+
+    def submit(self, job_title: str, requirements: str, top_n: int, categories: Optional[List[str]] = None) -> str:
+        job_id = uuid.uuid4().hex
+        request = {"job_title": job_title, "requirements": requirements, "top_n": top_n}
+        if categories:
+            request["categories"] = categories
+        self.store.create(job_id, request)
+        self._submit(job_id)
+        logger.info("评分任务已提交: %s, 岗位: %s, 数量: %d", job_id, job_title, top_n)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取消排队中或运行中的任务：排队中的任务不再执行，运行中的任务撤回尚未执行的重排序批次
+        与大模型调用（由其他工作进程运行的任务在下次续约时停止）。已结束的任务保持原状态。
+        任务不存在时返回 None
+        """
+        if self.store.cancel(job_id):
+            with self._state_lock:
+                deadline = self._running.get(job_id)
+            if deadline is not None:
+                deadline.cancel()
+            logger.info("评分任务已取消: %s", job_id)
+        return self.store.get(job_id)
+
+    def _run(self, job_id: str) -> None:
+        try:
+            self._run_claimed(job_id)
+        finally:
+            with self._state_lock:
+                self._pending.discard(job_id)
+
+    def _run_claimed(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job["status"] != JOB_QUEUED:
+            return
+        request = job["request"]
+        partial: List[Any] = []
+        deadline = Deadline()  # 后台任务不限时，仅用于取消
+        admission = get_admission_controller(self.cfg)
+        route_token = instrumentation.set_route("jobs")
+        # 任务线程中的日志以任务ID作为请求ID
+        request_token = set_request_id(job_id)
+        try:
+            # 后台任务以 bulk 优先级排队，交互式请求优先执行
+            with admission.admit_sync("jobs", PRIORITY_BULK):
+                with self._state_lock:
+                    # 排队等待期间可能已被取消或被其他进程认领
+                    if not self.store.claim(job_id, self.owner, self.lease_seconds):
+                        return
+                    self._running[job_id] = deadline
+                with tracing.trace("score_job", kind=tracing.SPAN_KIND_INTERNAL, **{"job.id": job_id}):
+                    self._run_stream(job_id, request, partial, deadline)
+            logger.info("评分任务完成: %s", job_id)
+        except RequestCancelled:
+            logger.info("评分任务已停止: %s", job_id)
+        except Exception as e:  # noqa: BLE001
+            logger.error("评分任务失败: %s: %s", job_id, e, exc_info=True)
+            self.store.update(job_id, owner=self.owner, status=JOB_FAILED, error=str(e))
+        finally:
+            reset_request_id(request_token)
+            instrumentation.reset_route(route_token)
+            with self._state_lock:
+                self._running.pop(job_id, None)
+
+    def _run_stream(self, job_id: str, request: Dict[str, Any], partial: List[Any], deadline: Deadline) -> None:
+        """
+        执行评分并写入进度。每次写入 partial 都要重写整个列表，因此按 job_progress_interval 限制写入频率，
+        两次写入之间的取消由续约线程（以及本进程的 cancel）通过 deadline 通知
+        """
+        flushed_at = time.monotonic()
+        for event, payload in stream_score_from_dataset(
+            request["job_title"],
+            request["requirements"],
+            request["top_n"],
+            self.cfg,
+            deadline,
+            request.get("categories"),
+        ):
+            deadline.check()
+            if event == "candidates":
+                updated = self.store.update(job_id, owner=self.owner, total=len(payload))
+            elif event == "evaluation":
+                partial.append(list(payload))
+                if time.monotonic() - flushed_at < self.cfg.job_progress_interval:
+                    continue
+                updated = self.store.update(job_id, owner=self.owner, partial=partial)
+                flushed_at = time.monotonic()
+            elif event == "summary":
+                updated = self.store.update(
+                    job_id,
+                    owner=self.owner,
+                    status=JOB_SUCCEEDED,
+                    partial=partial,
+                    result=[list(item) for item in payload],
+                    total=len(payload),
+                )
+            else:
+                continue
+            if not updated:
+                # 任务已在任务表中取消（可能由其他工作进程取消）或租约已被接管
+                raise RequestCancelled("评分任务已取消")
+
+
+# 进程内唯一的任务管理器
+job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager(cfg: AgentConfig) -> JobManager:
+    """
+    获取（必要时创建并启动）本进程的任务管理器。应用启动时调用（见 create_app），
+    多进程模式下每个工作进程在 fork 之后各自创建；fork 前创建的实例属于父进程，其线程不会带到子进程
+    """
+    global job_manager
+    with _job_manager_lock:
+        if job_manager is None or job_manager.pid != os.getpid():
+            job_manager = JobManager(cfg)
+            job_manager.start()
+    return job_manager
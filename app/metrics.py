@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from fastapi import Depends, Request
+
+from rag_system import instrumentation, rate_limiter
+
+# 各阶段耗时的分桶：覆盖毫秒级的检索到数十秒的大模型调用
+_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "各管线阶段耗时", ["stage", "route", "model"], buckets=_STAGE_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total", "缓存（含请求合并）查询次数", ["cache", "result", "route", "model"]
+)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "大模型 token 用量", ["direction", "route", "model"])
+LLM_RATE_LIMITED = Counter("rag_llm_rate_limited_total", "大模型返回 429 的次数", ["route", "model"])
+FALLBACKS = Counter("rag_fallbacks_total", "降级返回的次数", ["kind", "route", "model"])
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP 请求数", ["route", "method", "status", "model"])
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时", ["route", "method", "model"], buckets=_STAGE_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "正在处理的 HTTP 请求数", ["route", "model"], multiprocess_mode="livesum"
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "rag_llm_queue_depth", "排队等待大模型调用额度的请求数", ["model"], multiprocess_mode="livesum"
+)
+LLM_QUEUE_WAIT = Histogram(
+    "rag_llm_queue_wait_seconds", "排队等待大模型调用额度的耗时（只计入需要排队的调用）", ["route", "model"],
+    buckets=_STAGE_BUCKETS,
+)
+LLM_QUEUE_SHED = Counter("rag_llm_queue_shed_total", "限流器直接拒绝的大模型调用次数", ["route", "model"])
+LLM_RATE_FACTOR = Gauge(
+    "rag_llm_rate_factor", "限流器当前的速率系数（收到 429 后降低，随时间恢复到 1）", ["model"],
+    multiprocess_mode="livemin",
+)
+INDEX_DOCUMENTS = Gauge(
+    "rag_index_documents", "索引中的文档数", ["index", "model"], multiprocess_mode="max"
+)
+
+# 不计入指标的路由（避免抓取本身产生噪声）
+_SKIP_ROUTES = {"/metrics"}
+
+
+class PrometheusListener:
+    """把 rag_system.instrumentation 的阶段耗时和计数事件写入 Prometheus 指标"""
+
+    def __init__(self, model: str):
+        self.model = model or "unknown"
+        # 本进程内各缓存的命中/未命中次数，供 /api/system 计算命中率
+        self.cache_counts: Dict[str, Dict[str, float]] = {}
+        self._cache_lock = threading.Lock()
+
+    def on_stage(self, stage: str, seconds: float, route: str) -> None:
+        STAGE_SECONDS.labels(stage, route or "internal", self.model).observe(seconds)
+
+    def on_event(self, name: str, amount: float, route: str, labels: Dict[str, Optional[str]]) -> None:
+        route = route or "internal"
+        if name == "cache":
+            CACHE_REQUESTS.labels(labels.get("cache"), labels.get("result"), route, self.model).inc(amount)
+            cache, result = labels.get("cache") or "unknown", labels.get("result") or "unknown"
+            with self._cache_lock:
+                counts = self.cache_counts.setdefault(cache, {})
+                counts[result] = counts.get(result, 0) + amount
+        elif name == "llm_tokens":
+            LLM_TOKENS.labels(labels.get("direction"), route, self.model).inc(amount)
+        elif name == "llm_rate_limited":
+            LLM_RATE_LIMITED.labels(route, self.model).inc(amount)
+        elif name == "fallback":
+            FALLBACKS.labels(labels.get("kind"), route, self.model).inc(amount)
+        elif name == "llm_queue":
+            LLM_QUEUE_DEPTH.labels(labels.get("model") or self.model).inc(amount)
+        elif name == "llm_queue_wait":
+            LLM_QUEUE_WAIT.labels(route, labels.get("model") or self.model).observe(amount)
+        elif name == "llm_queue_shed":
+            LLM_QUEUE_SHED.labels(route, labels.get("model") or self.model).inc(amount)
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._cache_lock:
+            snapshot = {cache: dict(counts) for cache, counts in self.cache_counts.items()}
+        stats = {}
+        for cache, counts in snapshot.items():
+            total = sum(counts.values())
+            stats[cache] = {
+                **{result: int(count) for result, count in counts.items()},
+                "hit_ratio": round(counts.get("hit", 0) / total, 3) if total else 0.0,
+            }
+        return stats
+
+
+# 请求级指标状态在 ASGI scope 中的键
+_SCOPE_KEY = "rag.metrics"
+
+
+def _route_template(scope: Dict[str, Any]) -> str:
+    """
+    返回匹配到的路由模板（如 /api/jobs/{job_id}），避免按原始路径产生过多标签值。
+    路由在中间件之后才匹配：FastAPI 的路由匹配时把自身写入 scope["route"]；
+    Starlette 的普通路由（/docs 等）没有路径参数，直接用原始路径
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", scope["path"])
+    if "endpoint" in scope:
+        return scope["path"]
+    return "unmatched"
+
+
+async def _track_route(request: Request) -> None:
+    """
+    全局依赖（路由匹配之后、处理函数之前执行）：把路由模板写入上下文，并计入并发数。
+    并发数由 MetricsMiddleware 在请求（含流式响应）结束时减回
+    """
+    state = request.scope.get(_SCOPE_KEY)
+    if state is None or "in_flight" in state:
+        return
+    route = _route_template(request.scope)
+    if route in _SKIP_ROUTES:
+        return
+    instrumentation.set_route(route)
+    in_flight = IN_FLIGHT.labels(route, state["model"])
+    in_flight.inc()
+    state["in_flight"] = in_flight
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：统计请求数、耗时与并发数，并把路由写入上下文，
+    使管线内部的阶段指标也带上 route 标签（路由模板由 _track_route 在匹配后写入）。
+    """
+
+    def __init__(self, app, model: str = ""):
+        self.app = app
+        self.model = model or "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        state: Dict[str, Any] = {"model": self.model}
+        scope[_SCOPE_KEY] = state
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = instrumentation.set_route("unmatched")
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight = state.get("in_flight")
+            if in_flight is not None:
+                in_flight.dec()
+            route = _route_template(scope)
+            if route not in _SKIP_ROUTES:
+                HTTP_SECONDS.labels(route, method, self.model).observe(time.perf_counter() - start)
+                HTTP_REQUESTS.labels(route, method, str(status["code"]), self.model).inc()
+            instrumentation.reset_route(token)
+
+
+# 进程内唯一的指标监听器
+_listener: Optional[PrometheusListener] = None
+
+
+def install(app, model: str) -> None:
+    """注册指标监听（每个进程一次）、中间件与全局依赖；需在声明路由之前调用，依赖才会加到各路由上"""
+    global _listener
+    if _listener is None:
+        _listener = PrometheusListener(model)
+        instrumentation.add_listener(_listener)
+    app.add_middleware(MetricsMiddleware, model=model)
+    app.router.dependencies.append(Depends(_track_route))
+
+
+def update_index_gauges(rag, model: str) -> None:
+    """抓取时刷新索引规模"""
+    if rag is None:
+        return
+    model = model or "unknown"
+    INDEX_DOCUMENTS.labels("documents", model).set(len(rag.documents))
+    vectorstore = getattr(rag, "vectorstore", None)
+    if vectorstore is not None:
+        INDEX_DOCUMENTS.labels("faiss", model).set(vectorstore.index.ntotal)
+    bm25 = getattr(rag, "bm25_retriever", None)
+    if bm25 is not None:
+        INDEX_DOCUMENTS.labels("bm25", model).set(len(bm25.docs))
+
+
+def update_rate_limiter_gauges(model: str) -> None:
+    """抓取时刷新各模型限流器的速率系数（排队人数、等待耗时与拒绝次数随事件实时更新）"""
+    for name, limiter in rate_limiter.all_rate_limiters().items():
+        LLM_RATE_FACTOR.labels(name or model or "unknown").set(limiter.stats()["rate_factor"])
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """本进程内各缓存的命中次数与命中率（多进程部署时只反映处理该请求的工作进程）"""
+    return _listener.cache_stats() if _listener is not None else {}
+
+
+def render_latest() -> tuple:
+    """
+    返回 (内容, Content-Type)。多进程模式下（设置了 PROMETHEUS_MULTIPROC_DIR）汇总所有工作进程的指标
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,412 @@
+import asyncio
+import collections
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from config import AgentConfig
+from rag_system.logging_utils import get_request_id
+
+try:
+    from pyinstrument import Profiler as _PyinstrumentProfiler
+except ImportError:
+    _PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+TOKEN_HEADER = "x-profile-token"
+_TRUE = ("1", "true", "yes")
+
+# 叶子帧位于这些文件中的线程视为空闲（等待队列、锁、IO 多路复用）
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_ROOT + os.sep):
+        return filename[len(_ROOT) + 1:]
+    _, marker, rest = filename.rpartition("site-packages" + os.sep)
+    return rest if marker else os.path.basename(filename)
+
+
+def _thread_group(name: str) -> str:
+    # 线程池中的线程（如 rag-cpu_0、rag-cpu_1）合并统计
+    return re.sub(r"[_-]\d+$", "", name)
+
+
+class SamplingProfiler:
+    """
+    标准库实现的采样分析器：按固定间隔读取所有线程的调用栈（sys._current_frames），
+    因此能看到 SimpleRAG 在计算线程池中执行的嵌入、检索与重排序。
+
+    统计的是整个进程在请求期间的调用栈，并发请求会混在一起；等待中的线程计为空闲，不计入调用栈。
+    """
+
+    mode = "sampling"
+    formats = ("text", "folded")
+    # stop 要等待采样线程结束，在事件循环上调用时放到线程中执行
+    blocking_stop = True
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self.stacks: Dict[Tuple[str, ...], int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    self.idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident, str(ident))))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def render(self, fmt: str, limit: int = 40) -> str:
+        if fmt == "folded":
+            # 折叠栈格式，可直接交给 flamegraph.pl 或 speedscope
+            return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.items())
+
+        busy = sum(self.stacks.values())
+        inclusive: Dict[str, int] = collections.Counter()
+        own: Dict[str, int] = collections.Counter()
+        threads: Dict[str, int] = collections.Counter()
+        for stack, count in self.stacks.items():
+            threads[stack[0]] += count
+            own[stack[-1]] += count
+            # 递归调用只计一次
+            for name in set(stack[1:]):
+                inclusive[name] += count
+
+        def table(title: str, counter: Dict[str, int]) -> List[str]:
+            lines = [title]
+            for name, count in sorted(counter.items(), key=lambda item: -item[1])[:limit]:
+                lines.append(f"{count:8d} {count / busy:6.1%}  {name}")
+            return lines + [""]
+
+        lines = [
+            f"采样间隔 {self.interval * 1000:g}ms，采样 {self.samples} 次，活跃线程栈 {busy} 个，空闲线程栈 {self.idle} 个",
+            "",
+        ]
+        if not busy:
+            return "\n".join(lines + ["请求期间没有采到活跃的调用栈"]) + "\n"
+        lines += table("== 按线程 ==", threads)
+        lines += table("== 按函数（含子调用） ==", inclusive)
+        lines += table("== 按函数（自身） ==", own)
+        return "\n".join(lines)
+
+
+class CProfileProfiler:
+    """cProfile 确定性分析：只记录事件循环线程，线程池中执行的部分只体现为等待时间"""
+
+    mode = "cprofile"
+    formats = ("text",)
+    # 启停都作用于调用线程，必须在事件循环线程上调用
+    blocking_stop = False
+
+    def __init__(self, interval: float = 0.0):
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def render(self, fmt: str, limit: int = 40) -> str:
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+class PyinstrumentProfiler:
+    """pyinstrument 采样分析（可选依赖），跟随协程跨 await 统计，同样只采样事件循环线程"""
+
+    mode = "pyinstrument"
+    formats = ("text", "html")
+    blocking_stop = False
+
+    def __init__(self, interval: float = 0.001):
+        self._profiler = _PyinstrumentProfiler(interval=interval, async_mode="enabled")
+
+    def start(self) -> None:
+        self._profiler.start()
+
+    def stop(self) -> None:
+        self._profiler.stop()
+
+    def render(self, fmt: str, limit: int = 40) -> str:
+        if fmt == "html":
+            return self._profiler.output_html()
+        return self._profiler.output_text(unicode=True, color=False)
+
+
+_PROFILERS = {"sampling": SamplingProfiler, "cprofile": CProfileProfiler, "pyinstrument": PyinstrumentProfiler}
+
+
+def make_profiler(mode: str, interval: float):
+    if mode == "pyinstrument" and _PyinstrumentProfiler is None:
+        logger.warning("未安装 pyinstrument，改用标准库采样分析")
+        mode = "sampling"
+    return _PROFILERS.get(mode, SamplingProfiler)(interval)
+
+
+@dataclass
+class ProfileReport:
+    id: str
+    request_id: str
+    method: str
+    path: str
+    started_at: float
+    duration_ms: float
+    status: Optional[int]
+    profiler: Any
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "mode": self.profiler.mode,
+            "formats": list(self.profiler.formats),
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(self.duration_ms, 1),
+            "status": self.status,
+        }
+
+
+class ProfileStore:
+    """进程内最近的分析报告（多进程部署时每个工作进程各自保存）"""
+
+    def __init__(self, max_reports: int = 20):
+        self._reports: Deque[ProfileReport] = collections.deque(maxlen=max(1, max_reports))
+        self._lock = threading.Lock()
+
+    def add(self, report: ProfileReport) -> None:
+        with self._lock:
+            self._reports.append(report)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [report.summary() for report in reversed(self._reports)]
+
+    def get(self, profile_id: str) -> Optional[ProfileReport]:
+        with self._lock:
+            for report in self._reports:
+                if report.id == profile_id:
+                    return report
+        return None
+
+
+def token_ok(cfg: AgentConfig, token: Optional[str]) -> bool:
+    """未配置 PROFILING_TOKEN 时一律拒绝（调试接口与按需分析都不启用）"""
+    if not cfg.profiling_token:
+        return False
+    return bool(token) and hmac.compare_digest(token.encode("utf-8"), cfg.profiling_token.encode("utf-8"))
+
+
+class ProfilingMiddleware:
+    """
+    纯 ASGI 中间件：请求带 X-Profile: 1 请求头或 ?profile=1 参数时，用分析器执行该请求并保存报告，
+    响应头 X-Profile-Id 为报告ID，通过 /debug/profile/{id} 获取。
+
+    还需在 X-Profile-Token 请求头中提供 PROFILING_TOKEN（令牌只从请求头读取，避免出现在访问日志与代理日志的 URL 中）。
+    同一时间只分析一个请求，其余带标记的请求照常处理、不分析。
+    """
+
+    def __init__(self, app, cfg: AgentConfig):
+        self.app = app
+        self.cfg = cfg
+        self.store = get_profile_store(cfg)
+        self._busy = threading.Lock()
+
+    def _requested(self, scope) -> bool:
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        flag = headers.get(PROFILE_HEADER.decode()) or (query.get("profile") or [""])[0]
+        if flag.lower() not in _TRUE:
+            return False
+        return token_ok(self.cfg, headers.get(TOKEN_HEADER))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            logger.info("已有请求正在分析，本次请求不分析: %s", scope["path"])
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:16]
+        status: List[Optional[int]] = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = make_profiler(self.cfg.profiling_mode, self.cfg.profiling_interval_ms / 1000.0)
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler.blocking_stop:
+                await asyncio.to_thread(profiler.stop)
+            else:
+                profiler.stop()
+            self._busy.release()
+            duration_ms = (time.perf_counter() - start) * 1000
+            self.store.add(ProfileReport(
+                id=profile_id,
+                request_id=get_request_id(),
+                method=scope["method"],
+                path=scope["path"],
+                started_at=started_at,
+                duration_ms=duration_ms,
+                status=status[0],
+                profiler=profiler,
+            ))
+            logger.info(
+                "已保存性能分析报告",
+                extra={"profile_id": profile_id, "path": scope["path"], "duration_ms": round(duration_ms, 1)},
+            )
+
+
+# 进程内唯一的报告存储
+_store: Optional[ProfileStore] = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store(cfg: AgentConfig) -> ProfileStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore(cfg.profiling_max_reports)
+    return _store
+
+
+# 上一次的 tracemalloc 快照，用于计算增量
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+# 排除 tracemalloc 自身与导入机制的分配
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def tracemalloc_snapshot(
+    frames: int = 25,
+    limit: int = 30,
+    group_by: str = "lineno",
+    include: str = "",
+    diff: bool = False,
+) -> Dict[str, Any]:
+    """
+    未开始跟踪时开始跟踪并返回（开始之前的分配不会被记录），之后每次调用返回当前快照中分配最多的位置。
+
+    include 为文件名通配（如 *rag_system*）时只统计匹配的分配；diff 为 True 时返回相对上一次快照的增量。
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return {"tracing": True, "started": True, "frames": frames}
+
+    with _snapshot_lock:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        previous, _last_snapshot = _last_snapshot, snapshot
+    if include:
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(True, include),))
+        if previous is not None:
+            previous = previous.filter_traces((tracemalloc.Filter(True, include),))
+
+    current, peak = tracemalloc.get_traced_memory()
+    result: Dict[str, Any] = {
+        "tracing": True,
+        "started": False,
+        "traced_mb": round(current / 1e6, 2),
+        "peak_mb": round(peak / 1e6, 2),
+        "overhead_mb": round(tracemalloc.get_tracemalloc_memory() / 1e6, 2),
+        "group_by": group_by,
+        "diff": diff and previous is not None,
+    }
+    if diff and previous is not None:
+        stats = snapshot.compare_to(previous, group_by)
+        result["top"] = [
+            {
+                "location": _format_traceback(stat.traceback, group_by),
+                "size_kb": round(stat.size / 1e3, 1),
+                "size_diff_kb": round(stat.size_diff / 1e3, 1),
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ]
+    else:
+        stats = snapshot.statistics(group_by)
+        result["top"] = [
+            {
+                "location": _format_traceback(stat.traceback, group_by),
+                "size_kb": round(stat.size / 1e3, 1),
+                "count": stat.count,
+            }
+            for stat in stats[:limit]
+        ]
+    result["total_kb"] = round(sum(stat.size for stat in stats) / 1e3, 1)
+    return result
+
+
+def _format_traceback(traceback: tracemalloc.Traceback, group_by: str) -> Any:
+    frames = [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in traceback]
+    if group_by == "traceback":
+        return frames
+    return frames[0] if group_by == "lineno" else _short_path(traceback[0].filename)
+
+
+def stop_tracemalloc() -> None:
+    """停止跟踪并释放跟踪数据"""
+    global _last_snapshot
+    with _snapshot_lock:
+        _last_snapshot = None
+    tracemalloc.stop()
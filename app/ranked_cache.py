@@ -0,0 +1,166 @@
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from config import AgentConfig
+from rag_system import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class CursorExpired(LookupError):
+    """游标对应的名单不存在（已过期、被淘汰、数据集已更新或来自其他进程）"""
+
+
+@dataclass
+class RankedList:
+    """一次检索重排序得到的完整候选人名单（按重排序顺序），供后续分页只评估下一段"""
+
+    list_id: str
+    job_title: str
+    requirements: str
+    dataset_version: str
+    candidates: List[Dict[str, Any]]
+    size_bytes: int
+    expires_at: float
+
+    def page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """返回名单中的一段（深拷贝，评估时写入的字段不影响缓存）"""
+        return copy.deepcopy(self.candidates[offset:offset + limit])
+
+
+def list_id_for(key: Hashable) -> str:
+    """相同岗位、要求与数据集版本得到相同的名单ID，重复的首页请求复用同一份名单"""
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20]
+
+
+def encode_cursor(list_id: str, offset: int) -> str:
+    return f"{list_id}.{offset}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析游标，格式不正确时抛出 ValueError"""
+    list_id, sep, offset = (cursor or "").partition(".")
+    if not sep or not list_id or not offset.isdigit():
+        raise ValueError(f"无效的游标: {cursor!r}")
+    return list_id, int(offset)
+
+
+def _estimate_bytes(candidates: List[Dict[str, Any]]) -> int:
+    """粗略估计名单占用的内存：以简历文本为主，每个候选人另计固定开销"""
+    return sum(len(str(c.get("content", ""))) + len(str(c.get("preview", ""))) + 256 for c in candidates)
+
+
+class RankedListCache:
+    """
+    进程内的已排序名单缓存：条目在 TTL 后过期，总大小超过 max_bytes 时淘汰最久未使用的条目。
+
+    游标只在生成它的进程内有效，因此只在单进程部署（WEB_WORKERS=1）时启用分页，见 get_ranked_cache。
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, RankedList]" = OrderedDict()
+        self._bytes = 0
+        self._evicted = 0
+        self._expired = 0
+
+    def put(
+        self, key: Hashable, job_title: str, requirements: str, dataset_version: str, candidates: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        """缓存名单并返回名单ID；单个名单超过内存上限时不缓存，返回 None"""
+        size = _estimate_bytes(candidates)
+        if size > self.max_bytes:
+            return None
+        list_id = list_id_for(key)
+        entry = RankedList(
+            list_id=list_id,
+            job_title=job_title,
+            requirements=requirements,
+            dataset_version=dataset_version,
+            candidates=copy.deepcopy(candidates),
+            size_bytes=size,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            previous = self._entries.pop(list_id, None)
+            if previous is not None:
+                self._bytes -= previous.size_bytes
+            self._entries[list_id] = entry
+            self._bytes += size
+            self._evict_locked()
+        return list_id
+
+    def get(self, list_id: str) -> Optional[RankedList]:
+        """取出未过期的名单；不存在或已过期时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(list_id)
+            if entry is not None and entry.expires_at <= now:
+                self._drop_locked(list_id)
+                self._expired += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(list_id)
+        instrumentation.event("cache", cache="ranked", result="hit" if entry is not None else "miss")
+        return entry
+
+    def has_more(self, list_id: str, offset: int) -> bool:
+        """名单存在、未过期且 offset 之后还有候选人（不计入命中率）"""
+        with self._lock:
+            entry = self._entries.get(list_id)
+            return entry is not None and entry.expires_at > time.monotonic() and offset < len(entry.candidates)
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        for list_id in [list_id for list_id, entry in self._entries.items() if entry.expires_at <= now]:
+            self._drop_locked(list_id)
+            self._expired += 1
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop_locked(next(iter(self._entries)))
+            self._evicted += 1
+
+    def _drop_locked(self, list_id: str) -> None:
+        entry = self._entries.pop(list_id)
+        self._bytes -= entry.size_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evicted_total": self._evicted,
+                "expired_total": self._expired,
+            }
+
+
+# 进程内唯一的名单缓存；RANKED_CACHE_MAX_MB 为 0 或多进程部署时为 None（不分页）
+_cache: Optional[RankedListCache] = None
+_cache_lock = threading.Lock()
+_multi_worker_warned = False
+
+
+def get_ranked_cache(cfg: AgentConfig) -> Optional[RankedListCache]:
+    global _cache, _multi_worker_warned
+    if cfg.ranked_cache_max_mb <= 0 or cfg.ranked_cache_ttl_seconds <= 0:
+        return None
+    if cfg.web_workers > 1:
+        # 下一页请求会被分配到任意工作进程，而名单只缓存在生成它的进程中，大部分游标都会失效；
+        # 多进程部署时不分页（首页的 next_cursor 为空）
+        if not _multi_worker_warned:
+            _multi_worker_warned = True
+            logger.warning("WEB_WORKERS=%d，名单缓存只在进程内有效，已关闭评分结果分页", cfg.web_workers)
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RankedListCache(cfg.ranked_cache_ttl_seconds, int(cfg.ranked_cache_max_mb * 1024 * 1024))
+    return _cache
@@ -0,0 +1,52 @@
+import uuid
+
+from rag_system import tracing
+from rag_system.logging_utils import reset_payload_sample, reset_request_id, sample_payload, set_request_id
+
+_HEADER = b"x-request-id"
+
+
+class RequestContextMiddleware:
+    """
+    纯 ASGI 中间件：为每个请求分配请求ID（沿用客户端传入的 X-Request-Id），
+    写入日志上下文并在响应头中返回；同时按采样率决定该请求是否记录详细日志载荷。
+
+    每个请求对应一个 Trace，响应头中的 Server-Timing 为响应开始时已完成各阶段的耗时
+    （普通接口即完整的分阶段耗时，流式接口只包含推送开始前的部分）。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = ""
+        for name, value in scope.get("headers", []):
+            if name == _HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        id_token = set_request_id(request_id)
+        sample_token = sample_payload()
+        try:
+            with tracing.trace(
+                f"{scope['method']} {scope['path']}",
+                **{"http.method": scope["method"], "http.target": scope["path"], "request.id": request_id},
+            ) as current:
+
+                async def send_wrapper(message):
+                    if message["type"] == "http.response.start":
+                        current.root.set_attribute("http.status_code", message["status"])
+                        message["headers"] = list(message.get("headers", [])) + [
+                            (_HEADER, request_id.encode("latin-1")),
+                            (b"server-timing", current.server_timing().encode("latin-1")),
+                        ]
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            reset_payload_sample(sample_token)
+            reset_request_id(id_token)
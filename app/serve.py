@@ -0,0 +1,180 @@
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+from config import AgentConfig
+
+
+def _thread_budget(cfg: AgentConfig) -> int:
+    """每个工作进程可用的计算线程数，默认按 CPU 核数平均分配"""
+    if cfg.worker_threads > 0:
+        return cfg.worker_threads
+    return max(1, (os.cpu_count() or 1) // max(1, cfg.web_workers))
+
+
+def set_thread_env(cfg: AgentConfig) -> None:
+    """
+    按线程预算设置 OpenMP / MKL / OpenBLAS 的环境变量。
+
+    这些变量只在相应运行库初始化时读取一次，必须在导入 torch、FAISS、numpy 之前调用
+    （见 app/backend.py 的开头）；单进程且未配置 WORKER_THREADS 时不做修改
+    """
+    if cfg.web_workers <= 1 and cfg.worker_threads <= 0:
+        return
+    threads = str(_thread_budget(cfg))
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = threads
+    # 分词器的并行线程在 fork 后会报警告并可能死锁
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+
+def limit_compute_threads(threads: int) -> None:
+    """
+    限制已加载的 torch / FAISS 的线程数，避免多个工作进程争抢 CPU；
+    BLAS 的线程数由导入前设置的环境变量决定（见 set_thread_env）
+    """
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:  # noqa: BLE001
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    except Exception:  # noqa: BLE001
+        pass
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker_main(app, sock: socket.socket, cfg: AgentConfig, threads: int) -> None:
+    """子进程入口：重新设置线程预算后在共享的监听套接字上运行 uvicorn"""
+    limit_compute_threads(threads)
+    max_requests = None
+    if cfg.worker_max_requests > 0:
+        # 加入随机抖动，避免所有工作进程同时回收
+        max_requests = cfg.worker_max_requests + random.randint(0, max(1, cfg.worker_max_requests // 10))
+    config = uvicorn.Config(
+        app,
+        log_level="info",
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=cfg.worker_graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_prefork(app, host: str, port: int, cfg: AgentConfig) -> None:
+    """
+    预加载 + 多进程模式。
+
+    主进程先加载模型、构建索引，再 fork 出 cfg.web_workers 个工作进程（写时复制共享内存）。
+    工作进程达到 worker_max_requests 后自动退出并由主进程重新 fork；
+    SIGHUP 逐个平滑重启工作进程，SIGTERM/SIGINT 平滑关闭全部进程。
+    """
+    from app.service import init_rag_system
+
+    threads = _thread_budget(cfg)
+    limit_compute_threads(threads)
+
+    print(f"[后端] 主进程 {os.getpid()} 预加载模型与索引...")
+    start = time.time()
+    init_rag_system(cfg)
+    print(f"[后端] 预加载完成，耗时 {time.time() - start:.1f} 秒")
+
+    sock = _bind_socket(host, port)
+    workers: Dict[int, float] = {}
+    state = {"stopping": False, "recycle": []}
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # SIGHUP 只由主进程处理
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            code = 0
+            try:
+                _worker_main(app, sock, cfg, threads)
+            except BaseException:  # noqa: BLE001
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = time.time()
+        print(f"[后端] 启动工作进程 {pid}（计算线程 {threads}）")
+
+    def handle_stop(signum, frame):
+        state["stopping"] = True
+        for pid in list(workers):
+            _kill(pid, signal.SIGTERM)
+
+    def handle_hup(signum, frame):
+        # 逐个回收：每次只终止一个，待其退出并重新 fork 后再终止下一个
+        state["recycle"] = list(workers)
+        if state["recycle"]:
+            _kill(state["recycle"].pop(0), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGHUP, handle_hup)
+
+    for _ in range(max(1, cfg.web_workers)):
+        spawn()
+
+    print(f"[后端] 运行在 http://{host}:{port}（{len(workers)} 个工作进程）")
+    deadline = None
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if state["stopping"]:
+                deadline = deadline or time.time() + cfg.worker_graceful_timeout + 5
+                if time.time() > deadline:
+                    for remaining in list(workers):
+                        _kill(remaining, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+        started_at = workers.pop(pid, time.time())
+        _mark_metrics_dead(pid)
+        if state["stopping"]:
+            continue
+        print(f"[后端] 工作进程 {pid} 已退出（状态 {status}），重新启动")
+        if time.time() - started_at < 1:
+            # 启动即退出，稍等再重启，避免无限快速重启
+            time.sleep(1)
+        spawn()
+        if state["recycle"]:
+            _kill(state["recycle"].pop(0), signal.SIGTERM)
+
+    sock.close()
+    print("[后端] 所有工作进程已退出")
+    sys.exit(0)
+
+
+def _mark_metrics_dead(pid: int) -> None:
+    """多进程指标模式下清理已退出工作进程的 livesum 指标"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(pid)
+
+
+def _kill(pid: int, sig: int) -> None:
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
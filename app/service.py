@@ -1,25 +1,36 @@
+import asyncio
+import contextvars
+import heapq
 import sys
 import time
 import logging
 import json
 import re
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Dict, List, Any, Iterator, Optional, Tuple
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from config import AgentConfig
 # 直接从rag_system导入SimpleRAG，替代原来的pipeline
 from rag_system.llama_rag_system import SimpleRAG
+from rag_system.rate_limiter import RateLimitExceeded, configure_rate_limiter, is_rate_limit_error
+from rag_system.circuit_breaker import CircuitOpenError
+from rag_system import instrumentation, tracing
+from rag_system.deadline import STAGE_LLM, Deadline, DeadlineExceeded, RequestCancelled
 from app.dataset import search_resumes
+from app.ranked_cache import CursorExpired, decode_cursor, encode_cursor, get_ranked_cache
+from app.singleflight import SingleFlight
 
-# 添加日志配置
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 初始化RAG系统实例
 rag_system = None
 
+# 合并同时进行的相同评分请求
+score_flights = SingleFlight()
 
-def init_rag_system():
+
+def init_rag_system(cfg: Optional[AgentConfig] = None):
     """初始化RAG系统"""
     global rag_system
     if rag_system is None:
@@ -27,12 +38,22 @@ def init_rag_system():
             from pathlib import Path
             dataset_path = Path("rag_system/UpdatedResumeDataSet.csv")
             if dataset_path.exists():
-                rag_system = SimpleRAG(str(dataset_path))
+                # 按配置设置该模型的进程级限流器
+                rate_limiter = None
+                if cfg is not None:
+                    rate_limiter = configure_rate_limiter(
+                        cfg.gemini_model_name, **cfg.rate_limits_for(cfg.gemini_model_name)
+                    )
+                rag_system = SimpleRAG(
+                    str(dataset_path),
+                    rate_limiter=rate_limiter,
+                    cpu_workers=cfg.cpu_executor_workers if cfg is not None else None,
+                )
                 logger.info("RAG系统初始化成功")
             else:
-                logger.warning(f"数据集文件不存在: {dataset_path}")
+                logger.warning("数据集文件不存在: %s", dataset_path)
         except Exception as e:
-            logger.error(f"RAG系统初始化失败: {e}")
+            logger.error("RAG系统初始化失败: %s", e)
             rag_system = None
 
 
@@ -47,13 +68,6 @@ def truncate_text(text: str, max_tokens: int = 3000) -> str:
     return text[:max_chars] + "...(内容已截断)"
 
 
-# 定义需要重试的异常类型
-def is_rate_limit_error(exception):
-    """判断是否为速率限制错误"""
-    error_str = str(exception).lower()
-    return "429" in error_str or "rate limit" in error_str or "rate-limit" in error_str
-
-
 @retry(
     stop=stop_after_attempt(3),  # 最多重试3次
     wait=wait_exponential(multiplier=1, min=4, max=10),  # 指数退避等待
@@ -64,12 +78,12 @@ def score_candidate_with_retry(job_title: str, requirements: str, resume_text: s
     """
     带重试机制的候选人评分函数
     """
-    logger.info(f"开始处理候选人: {job_title}")
-    logger.debug(f"输入参数 - job_title: {job_title}, requirements: {requirements}, resume_text长度: {len(resume_text)}")
+    logger.info("开始处理候选人: %s", job_title)
+    logger.debug("输入参数 - job_title: %s, requirements: %s, resume_text长度: %d", job_title, requirements, len(resume_text))
     
     try:
         # 初始化RAG系统（如果尚未初始化）
-        init_rag_system()
+        init_rag_system(cfg)
         
         # 对输入文本进行截断以避免token超限
         job_title = truncate_text(job_title, 100)
@@ -82,12 +96,12 @@ def score_candidate_with_retry(job_title: str, requirements: str, resume_text: s
         
         logger.info("开始运行处理管道")
         
-        # 使用RAG系统进行评分
+        # 使用RAG系统进行评分：直接评估传入的简历，而不是检索数据集
         if rag_system is not None:
             try:
-                # 构造查询和要求
-                query = f"{job_title} {requirements}"
-                score_results = rag_system.score_candidates(query, requirements, top_k=1)
+                score_results = rag_system.evaluate_candidates(
+                    _job_requirements(job_title, requirements), [_external_candidate(resume_text)]
+                )
                 
                 # 如果有评分结果，使用第一个候选人的评分
                 if score_results and len(score_results) > 0:
@@ -139,12 +153,12 @@ def score_candidate_with_retry(job_title: str, requirements: str, resume_text: s
                         }
                     }
                 
-                logger.info(f"成功处理候选人: {job_title}")
-                logger.debug(f"处理结果类型: {type(result)}")
+                logger.info("成功处理候选人: %s", job_title)
+                logger.debug("处理结果类型: %s", type(result))
                 return result
                 
             except Exception as e:
-                logger.error(f"使用RAG系统评分失败: {str(e)}")
+                logger.error("使用RAG系统评分失败: %s", e)
                 # 回退到模拟结果
                 result = {
                     "plan": {
@@ -191,12 +205,8 @@ def score_candidate_with_retry(job_title: str, requirements: str, resume_text: s
             return result
             
     except Exception as e:
-        logger.error(f"处理候选人 {job_title} 失败: {str(e)}", exc_info=True)
-        error_msg = str(e).lower()
-        if "429" in error_msg or "rate limit" in error_msg:
-            logger.warning(f"候选人 {job_title} 达到速率限制，将重试...")
-            # 在重试前添加延迟
-            time.sleep(5)
+        logger.error("处理候选人 %s 失败: %s", job_title, e, exc_info=True)
+        # 速率限制的等待由 SimpleRAG 内的共享限流器统一处理，这里不再单独 sleep
         raise
 
 
@@ -204,122 +214,831 @@ def score_candidate(job_title: str, requirements: str, resume_text: str, cfg: Ag
     """
     将岗位信息与简历拼接，交给原有管线进行处理。
     """
-    logger.info(f"调用score_candidate函数处理: {job_title}")
+    logger.info("调用score_candidate函数处理: %s", job_title)
     result = score_candidate_with_retry(job_title, requirements, resume_text, cfg)
-    logger.info(f"score_candidate函数执行完成: {job_title}")
+    logger.info("score_candidate函数执行完成: %s", job_title)
     return result
 
 
-def score_from_dataset(job_title: str, requirements: str, top_n: int, cfg: AgentConfig) -> List[Dict[str, Any]]:
-    logger.info(f"开始从数据集中评分，岗位: {job_title}, 数量: {top_n}")
-    
+def _job_requirements(job_title: str, requirements: str) -> str:
+    """外部简历不经过检索，评估提示词中同时给出岗位名称与要求"""
+    return f"岗位：{job_title}\n{requirements}".strip()
+
+
+def _external_candidate(text: str, candidate_id: Any = 0, category: str = "上传简历") -> Dict[str, Any]:
+    """把外部简历包装成与检索结果相同结构的候选人"""
+    return {"id": candidate_id, "category": category, "content": text}
+
+
+def _build_result(score_result: Dict[str, Any], candidate_info: Dict[str, Any]) -> Dict[str, Any]:
+    """将 SimpleRAG 的评估结果转换为前端展示所需的结构化结果"""
+    content = candidate_info.get("content", "")
+    return {
+        "candidate_info": candidate_info,  # 添加candidate_info字段
+        "plan": {
+            "normalized_resume": content[:200] + "..." if len(content) > 200 else content
+        },
+        "parsed_resume": {
+            "name": "未知",
+            "years_experience": str(score_result.get("years_experience", "未知")),
+            "skills": [skill.strip() for skill in str(score_result.get("skills", "")).split(",") if skill.strip()]
+        },
+        "scores": [
+            {"dimension": "技术能力", "score": score_result.get("technical_score", 0)},
+            {"dimension": "经验匹配", "score": score_result.get("experience_score", 0)}
+        ],
+        "report": {
+            "ordered_scores": [
+                {
+                    "dimension": "综合评分",
+                    "score": score_result.get("overall_score", 0),
+                    "reasoning": f"技术能力: {score_result.get('technical_score', 0)}/10, 经验匹配: {score_result.get('experience_score', 0)}/10, 主要优势: {score_result.get('strengths', '')}, 主要不足: {score_result.get('weaknesses', '')}"
+                }
+            ]
+        }
+    }
+
+
+def _summary_score(result: Dict[str, Any]) -> float:
+    """取结构化结果中的综合评分，用于排序"""
+    return result.get("report", {}).get("ordered_scores", [{}])[0].get("score", 0)
+
+
+# 熔断时附在结果中的说明
+_LLM_UNAVAILABLE_NOTE = {"strengths": "大模型服务暂不可用，仅按检索重排序结果返回"}
+# 时间预算不足、跳过大模型评估时附在结果中的说明
+_DEADLINE_NOTE = {"strengths": "剩余时间不足，跳过大模型评估，仅按检索重排序结果返回"}
+
+
+def _retrieval_only_results(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """大模型熔断时，直接按重排序顺序返回检索结果（不含大模型评分）"""
+    instrumentation.event("fallback", kind="retrieval_only")
+    return [_build_result(_LLM_UNAVAILABLE_NOTE, candidate) for candidate in candidates]
+
+
+def _collect_results(score_results: Any, top_n: int) -> List[Dict[str, Any]]:
+    """把 SimpleRAG 的评分结果转换为结构化结果并按综合评分排序；结果无效时返回空列表"""
+    # 添加类型检查和安全处理
+    if not isinstance(score_results, list):
+        logger.error("RAG系统返回了非列表类型: %s", type(score_results))
+        return []
+
+    results: List[Dict[str, Any]] = []
+    for i, score_result in enumerate(score_results):
+        # 检查每个结果是否为字典类型
+        if not isinstance(score_result, dict):
+            logger.warning("第 %d 个结果不是字典类型: %s，跳过", i + 1, type(score_result))
+            continue
+
+        # 安全地获取candidate_info
+        candidate_info = score_result.get("candidate_info", {})
+        if not isinstance(candidate_info, dict):
+            candidate_info = {}
+
+        # 构造符合前端展示要求的结构化结果
+        results.append(_build_result(score_result, candidate_info))
+
+    # 按综合评分排序
+    results.sort(key=_summary_score, reverse=True)
+    return results[:top_n]
+
+
+def _canonical(text: str) -> str:
+    """规范化文本：去除首尾空白、合并连续空白并忽略大小写"""
+    return " ".join((text or "").split()).casefold()
+
+
+def _flight_key(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> Tuple[str, str, int, str, Optional[float], Tuple[str, ...]]:
+    """相同岗位、要求、数量、时间预算、类别过滤且数据集版本相同的请求视为同一请求"""
+    dataset_version = rag_system.dataset_version if rag_system is not None else ""
+    budget_ms = deadline.budget_ms if deadline is not None else None
+    return (_canonical(job_title), _canonical(requirements), top_n, dataset_version, budget_ms, _category_key(categories))
+
+
+def _category_key(categories: Optional[List[str]]) -> Tuple[str, ...]:
+    return tuple(sorted(set(categories or ())))
+
+
+def _with_degraded(page: "_Page", deadline: Optional[Deadline]) -> Tuple["_Page", List[str]]:
+    """把降级的阶段随结果一起返回，使合并的请求也能拿到"""
+    return page, list(deadline.degraded) if deadline is not None else []
+
+
+# (评分结果, 缓存的重排序名单ID)；名单未缓存时ID为 None
+_Page = Tuple[List[Dict[str, Any]], Optional[str]]
+
+
+def score_from_dataset(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    从数据集中检索并评分候选人。
+
+    deadline 为请求的时间预算：剩余时间不足时依次缩小重排序范围、跳过重排序、
+    跳过大模型评估（仅返回检索重排序结果），降级的阶段记录在 deadline.degraded 中。
+    categories 不为空时只检索这些类别的简历。
+    """
     # 初始化RAG系统（如果尚未初始化）
-    init_rag_system()
+    init_rag_system(cfg)
+    categories = list(_category_key(categories)) or None
+    key = _flight_key(job_title, requirements, top_n, deadline, categories)
+    with tracing.span("score_from_dataset", top_n=top_n) as span:
+        ((results, _), degraded), shared = score_flights.do(
+            key,
+            lambda: _with_degraded(
+                _score_from_dataset(job_title, requirements, top_n, cfg, deadline, categories), deadline
+            ),
+        )
+        if span is not None:
+            span.set_attribute("singleflight.shared", shared)
+    instrumentation.event("cache", cache="singleflight", result="hit" if shared else "miss")
+    if shared:
+        logger.debug("复用同时进行的相同评分请求结果，岗位: %s", job_title)
+        if deadline is not None:
+            deadline.degrade(*degraded)
+    return results
+
+
+def _score_from_dataset(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> _Page:
+    logger.debug("开始从数据集中评分，岗位: %s, 数量: %d", job_title, top_n)
+    query = f"{job_title} {requirements}"
     
+    # 大模型熔断时跳过评分和回退方法，直接返回检索重排序结果
+    if rag_system is not None and not rag_system.llm_available():
+        logger.warning("大模型服务熔断中，仅返回检索重排序结果")
+        return _retrieval_only_results(
+            rag_system.search(query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories)
+        ), None
+
     # 使用RAG系统直接评分数据集中的候选人
     if rag_system is not None:
         try:
-            query = f"{job_title} {requirements}"
-            score_results = rag_system.score_candidates(query, requirements, top_k=top_n)
-            
-            # 添加类型检查和安全处理
-            if not isinstance(score_results, list):
-                logger.error(f"RAG系统返回了非列表类型: {type(score_results)}")
-                # 回退到原来的方法
-                return _fallback_to_original_method(job_title, requirements, top_n, cfg)
-            
-            results: List[Dict[str, Any]] = []
-            for i, score_result in enumerate(score_results):
-                # 检查每个结果是否为字典类型
-                if not isinstance(score_result, dict):
-                    logger.warning(f"第 {i+1} 个结果不是字典类型: {type(score_result)}，跳过")
-                    continue
-                
-                # 安全地获取candidate_info
-                candidate_info = score_result.get("candidate_info", {})
-                if not isinstance(candidate_info, dict):
-                    candidate_info = {}
-                
-                # 构造符合前端展示要求的结构化结果
-                result = {
-                    "candidate_info": candidate_info,  # 添加candidate_info字段
-                    "plan": {
-                        "normalized_resume": candidate_info.get("content", "")[:200] + "..." if len(candidate_info.get("content", "")) > 200 else candidate_info.get("content", "")
-                    },
-                    "parsed_resume": {
-                        "name": "未知",
-                        "years_experience": str(score_result.get("years_experience", "未知")),
-                        "skills": [skill.strip() for skill in score_result.get("skills", "").split(",") if skill.strip()]
-                    },
-                    "scores": [
-                        {"dimension": "技术能力", "score": score_result.get("technical_score", 0)},
-                        {"dimension": "经验匹配", "score": score_result.get("experience_score", 0)}
-                    ],
-                    "report": {
-                        "ordered_scores": [
-                            {
-                                "dimension": "综合评分", 
-                                "score": score_result.get("overall_score", 0), 
-                                "reasoning": f"技术能力: {score_result.get('technical_score', 0)}/10, 经验匹配: {score_result.get('experience_score', 0)}/10, 主要优势: {score_result.get('strengths', '')}, 主要不足: {score_result.get('weaknesses', '')}"
-                            }
-                        ]
-                    }
-                }
-                results.append(result)
-            
+            score_results, ranked = rag_system.score_ranked(
+                query, requirements, top_n, _ranked_pool(top_n, cfg), deadline=deadline, categories=categories
+            )
+            list_id = _cache_ranked(job_title, requirements, top_n, ranked, cfg, categories)
+            results = _collect_results(score_results, top_n)
             if results:
-                # 按综合评分排序
-                results.sort(
-                    key=lambda r: r.get("report", {})
-                    .get("ordered_scores", [{}])[0]
-                    .get("score", 0),
-                    reverse=True,
-                )
-                
-                logger.info(f"RAG评分完成，返回前 {top_n} 个结果")
-                return results[:top_n]
-            else:
-                logger.warning("RAG系统未返回有效结果，回退到原始方法")
-                return _fallback_to_original_method(job_title, requirements, top_n, cfg)
-            
+                logger.debug("RAG评分完成，返回前 %d 个结果", top_n)
+                return results, list_id
+            logger.warning("RAG系统未返回有效结果，回退到原始方法")
+            return _fallback_to_original_method(
+                job_title, requirements, top_n, cfg, deadline, categories, candidates=ranked
+            ), None
+
+        except (RateLimitExceeded, RequestCancelled):
+            # 限流器已满时快速失败，回退方法同样需要调用大模型，只会加剧拥堵；已取消的请求不再回退
+            raise
+        except CircuitOpenError as e:
+            logger.warning("大模型服务在评分过程中熔断，仅返回检索重排序结果")
+            ranked = e.ranked
+            if ranked is None:
+                ranked = rag_system.search(query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories)
+            return _retrieval_only_results(ranked[:top_n]), None
         except Exception as e:
-            logger.error(f"使用RAG系统评分数据集失败: {e}", exc_info=True)
-            return _fallback_to_original_method(job_title, requirements, top_n, cfg)
+            logger.error("使用RAG系统评分数据集失败: %s", e, exc_info=True)
+            return _fallback_to_original_method(job_title, requirements, top_n, cfg, deadline, categories), None
     
     # 如果RAG系统不可用或评分失败，回退到原来的方法
     logger.warning("RAG系统不可用，回退到原来的数据集评分方法")
-    return _fallback_to_original_method(job_title, requirements, top_n, cfg)
+    return _fallback_to_original_method(job_title, requirements, top_n, cfg, deadline, categories), None
 
 
-def _fallback_to_original_method(job_title: str, requirements: str, top_n: int, cfg: AgentConfig) -> List[Dict[str, Any]]:
-    """回退到原始的数据集评分方法"""
-    logger.info("使用回退方法进行评分")
+async def ascore_from_dataset(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    score_from_dataset 的协程版本：检索/重排序在 SimpleRAG 的专用线程池中执行，
+    大模型调用使用 ainvoke，等待期间不占用任何线程。
+
+    协程被取消（如客户端断开）时，合并的计算在最后一个等待方离开后被取消：
+    正在进行的大模型 HTTP 请求随之中断，线程池中的检索/重排序在下一个检查点停止。
+    """
+    results, _ = await ascore_first_page(job_title, requirements, top_n, cfg, deadline, categories)
+    return results
+
+
+async def ascore_first_page(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """与 ascore_from_dataset 相同，另外返回下一页的游标（重排序名单已缓存且比首页长时），否则为 None"""
+    if rag_system is None:
+        # 首次初始化需要加载模型和构建索引，放到线程中执行
+        await asyncio.to_thread(init_rag_system, cfg)
+    categories = list(_category_key(categories)) or None
+    key = _flight_key(job_title, requirements, top_n, deadline, categories)
+    # 合并的计算使用首个请求的 Deadline，只有共享计算被取消时才取消它
+    shared_deadline = deadline if deadline is not None else Deadline()
+
+    async def run():
+        try:
+            page = await _ascore_from_dataset(job_title, requirements, top_n, cfg, shared_deadline, categories)
+        except asyncio.CancelledError:
+            shared_deadline.cancel()
+            raise
+        return _with_degraded(page, shared_deadline)
+
+    with tracing.span("score_from_dataset", top_n=top_n) as span:
+        ((results, list_id), degraded), shared = await score_flights.ado(key, run)
+        if span is not None:
+            span.set_attribute("singleflight.shared", shared)
+    instrumentation.event("cache", cache="singleflight", result="hit" if shared else "miss")
+    if shared:
+        logger.debug("复用同时进行的相同评分请求结果，岗位: %s", job_title)
+        if deadline is not None:
+            deadline.degrade(*degraded)
+    return results, encode_cursor(list_id, top_n) if list_id is not None else None
+
+
+async def _ascore_from_dataset(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> _Page:
+    logger.debug("开始从数据集中异步评分，岗位: %s, 数量: %d", job_title, top_n)
     query = f"{job_title} {requirements}"
-    candidates = search_resumes(query, top_k=max(top_n * 2, top_n))  # 取更大的池子再排序
-    logger.info(f"找到 {len(candidates)} 个候选简历")
-    
-    results: List[Dict[str, Any]] = []
-    
-    # 移除线程池并发处理，改为顺序处理
-    for i, resume_text in enumerate(candidates):
+
+    if rag_system is not None and not rag_system.llm_available():
+        logger.warning("大模型服务熔断中，仅返回检索重排序结果")
+        return _retrieval_only_results(
+            await rag_system.asearch(query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories)
+        ), None
+
+    retrieved: Optional[List[Dict[str, Any]]] = None
+    if rag_system is not None:
         try:
-            logger.info(f"处理第 {i+1} 个候选人")
-            # 对简历文本进行截断
-            truncated_resume = truncate_text(resume_text, 2000)
-            # 调用评分函数处理候选人
-            result = score_candidate(job_title, requirements, truncated_resume, cfg)
-            results.append(result)
-            logger.info(f"第 {i+1} 个候选人处理完成")
+            score_results, ranked = await rag_system.ascore_ranked(
+                query, requirements, top_n, _ranked_pool(top_n, cfg), deadline=deadline, categories=categories
+            )
+            list_id = _cache_ranked(job_title, requirements, top_n, ranked, cfg, categories)
+            results = _collect_results(score_results, top_n)
+            if results:
+                logger.debug("RAG评分完成，返回前 %d 个结果", top_n)
+                return results, list_id
+            logger.warning("RAG系统未返回有效结果，回退到原始方法")
+            # 复用已检索的名单，回退方法不再重新检索
+            retrieved = ranked
+        except (RateLimitExceeded, RequestCancelled):
+            raise
+        except CircuitOpenError as e:
+            logger.warning("大模型服务在评分过程中熔断，仅返回检索重排序结果")
+            ranked = e.ranked
+            if ranked is None:
+                ranked = await rag_system.asearch(
+                    query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories
+                )
+            return _retrieval_only_results(ranked[:top_n]), None
         except Exception as e:
-            logger.error(f"处理候选人 {i} 失败: {e}", exc_info=True)
-            # 即使某个候选人处理失败，也继续处理下一个
-    
-    # 按综合评分排序
+            logger.error("使用RAG系统评分数据集失败: %s", e, exc_info=True)
+    else:
+        logger.warning("RAG系统不可用，回退到原来的数据集评分方法")
+
+    # 回退方法为同步实现，放到线程中执行
+    return await asyncio.to_thread(
+        _fallback_to_original_method, job_title, requirements, top_n, cfg, deadline, categories, retrieved
+    ), None
+
+
+async def ascore_batch(
+    jobs: List[Tuple[str, str, int, Optional[List[str]]]], cfg: AgentConfig, deadline: Optional[Deadline] = None
+) -> List[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    批量评分多个岗位 [(岗位名称, 要求, 数量, 类别过滤)]。
+
+    检索与重排序通过 SimpleRAG.search_batch 一次完成（查询嵌入、向量检索、BM25 与重排序共享计算，
+    类别过滤不同的岗位分组检索），各岗位的大模型评估并发进行（受共享限流器约束）；相同的岗位只计算一次。
+
+    Returns:
+        与 jobs 一一对应的 (结果, 错误信息)，单个岗位（或一组岗位的检索）失败不影响其他岗位
+    """
+    if rag_system is None:
+        await asyncio.to_thread(init_rag_system, cfg)
+    if rag_system is None:
+        # 没有 RAG 系统时逐个岗位走原有的回退流程
+        outcomes = await asyncio.gather(
+            *(
+                ascore_from_dataset(title, requirements, top_n, cfg, deadline, categories)
+                for title, requirements, top_n, categories in jobs
+            ),
+            return_exceptions=True,
+        )
+        return [_batch_outcome(outcome) for outcome in outcomes]
+
+    def job_key(job: Tuple[str, str, int, Optional[List[str]]]) -> Tuple[str, str, int, Tuple[str, ...]]:
+        title, requirements, top_n, categories = job
+        return _canonical(title), _canonical(requirements), top_n, _category_key(categories)
+
+    index: Dict[Tuple[str, str, int, Tuple[str, ...]], int] = {}
+    unique_jobs: List[Tuple[str, str, int, Tuple[str, ...]]] = []
+    for job in jobs:
+        key = job_key(job)
+        if key not in index:
+            index[key] = len(unique_jobs)
+            unique_jobs.append((job[0], job[1], job[2], key[3]))
+    # 检索按类别过滤分组，每组一次批量检索
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for position, (_, _, _, categories) in enumerate(unique_jobs):
+        groups.setdefault(categories, []).append(position)
+    logger.debug("批量评分: %d 个岗位（去重后 %d 个，%d 组类别过滤）", len(jobs), len(unique_jobs), len(groups))
+
+    async def search_group(categories: Tuple[str, ...], positions: List[int]) -> List[List[Dict[str, Any]]]:
+        return await rag_system.asearch_batch(
+            [f"{unique_jobs[i][0]} {unique_jobs[i][1]}" for i in positions],
+            [unique_jobs[i][2] for i in positions],
+            use_rerank=True,
+            deadline=deadline,
+            categories=list(categories) or None,
+        )
+
+    async def evaluate(position: int) -> List[Dict[str, Any]]:
+        candidates = candidate_lists[position]
+        if isinstance(candidates, BaseException):
+            raise candidates
+        _, requirements, top_n, _ = unique_jobs[position]
+        return await _aevaluate_retrieved(requirements, candidates, top_n, deadline)
+
+    with tracing.span("score_batch", jobs=len(jobs), unique_jobs=len(unique_jobs)):
+        group_results = await asyncio.gather(
+            *(search_group(categories, positions) for categories, positions in groups.items()),
+            return_exceptions=True,
+        )
+        # 某组检索失败时，该组的岗位都以这个异常作为结果（见 _batch_outcome）
+        candidate_lists: List[Any] = [[] for _ in unique_jobs]
+        for positions, lists in zip(groups.values(), group_results):
+            if isinstance(lists, BaseException):
+                lists = [lists] * len(positions)
+            for position, candidates in zip(positions, lists):
+                candidate_lists[position] = candidates
+        outcomes = await asyncio.gather(
+            *(evaluate(position) for position in range(len(unique_jobs))), return_exceptions=True
+        )
+    results = [_batch_outcome(outcome) for outcome in outcomes]
+    return [results[index[job_key(job)]] for job in jobs]
+
+
+async def _aevaluate_retrieved(
+    requirements: str, candidates: List[Dict[str, Any]], top_n: int, deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """让大模型评估已检索好的候选人；熔断或时间不足时按检索重排序顺序返回"""
+    if not candidates:
+        return []
+    if not rag_system.llm_available():
+        return _retrieval_only_results(candidates)
+    try:
+        return _collect_results(await rag_system.aevaluate_candidates(requirements, candidates, deadline), top_n)
+    except CircuitOpenError:
+        return _retrieval_only_results(candidates)
+    except DeadlineExceeded as e:
+        logger.info("跳过大模型评估: %s", e)
+        deadline.degrade(STAGE_LLM)
+        return [_build_result(_DEADLINE_NOTE, candidate) for candidate in candidates]
+
+
+def _ranked_key(
+    job_title: str, requirements: str, categories: Optional[List[str]] = None
+) -> Tuple[str, str, str, Tuple[str, ...]]:
+    return (_canonical(job_title), _canonical(requirements), rag_system.dataset_version, _category_key(categories))
+
+
+def _ranked_pool(top_n: int, cfg: AgentConfig) -> int:
+    """首页检索重排序的名单长度；不分页时与 top_n 相同"""
+    if get_ranked_cache(cfg) is None:
+        return top_n
+    return max(top_n, cfg.ranked_cache_depth or rag_system.retrieval_k)
+
+
+def _cache_ranked(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    ranked: List[Dict[str, Any]],
+    cfg: AgentConfig,
+    categories: Optional[List[str]] = None,
+) -> Optional[str]:
+    """名单比首页长时缓存起来（下一页直接从中取候选人评估），返回名单ID；未缓存时返回 None"""
+    cache = get_ranked_cache(cfg)
+    if cache is None or len(ranked) <= top_n:
+        return None
+    key = _ranked_key(job_title, requirements, categories)
+    return cache.put(key, job_title, requirements, rag_system.dataset_version, ranked)
+
+
+async def ascore_next_page(
+    cursor: str, page_size: int, cfg: AgentConfig, deadline: Optional[Deadline] = None
+) -> Tuple[List[Dict[str, Any]], List[int], Optional[str]]:
+    """
+    按游标评估缓存名单中的下一段候选人，不重新检索、重排序，也不重新评估之前的候选人。
+
+    返回 (按综合评分排序的结果, 各结果在名单中的名次, 再下一页的游标)。
+    游标格式错误时抛出 ValueError，名单已过期、被淘汰或数据集已更新时抛出 CursorExpired。
+    """
+    list_id, offset = decode_cursor(cursor)
+    cache = get_ranked_cache(cfg)
+    entry = cache.get(list_id) if cache is not None else None
+    if entry is None or rag_system is None or entry.dataset_version != rag_system.dataset_version:
+        raise CursorExpired("游标已过期，请重新发起评分请求")
+    candidates = entry.page(offset, page_size)
+    end = offset + len(candidates)
+    following = encode_cursor(list_id, end) if end < len(entry.candidates) else None
+    with tracing.span("score_page", offset=offset, page_size=len(candidates)):
+        results = await _aevaluate_retrieved(entry.requirements, candidates, page_size, deadline)
+    # 评估结果按综合评分重新排序过，按候选人ID找回各自在名单中的名次
+    positions = {candidate.get("id"): offset + i for i, candidate in enumerate(candidates)}
+    ranks = [
+        positions.get(result.get("candidate_info", {}).get("id"), offset + i) for i, result in enumerate(results)
+    ]
+    logger.debug("分页评分完成，岗位: %s, 名单第 %d-%d 个", entry.job_title, offset, end)
+    return results, ranks, following
+
+
+def _batch_outcome(outcome: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """批量评分中单个岗位的结果；请求被取消时整批停止"""
+    if isinstance(outcome, RequestCancelled):
+        raise outcome
+    if isinstance(outcome, RateLimitExceeded):
+        return [], f"大模型调用繁忙，请稍后重试: {outcome}"
+    if isinstance(outcome, BaseException):
+        logger.error("批量评分中的岗位评分失败: %s", outcome, exc_info=outcome)
+        return [], f"评分失败: {outcome}"
+    return outcome, None
+
+
+async def asearch_candidates(
+    query: str,
+    top_k: int,
+    cfg: AgentConfig,
+    use_rerank: bool = True,
+    categories: Optional[List[str]] = None,
+    deadline: Optional[Deadline] = None,
+) -> List[Dict[str, Any]]:
+    """只检索（可选重排序），不调用大模型；用于输入联想、相似候选人与预筛选等低延迟场景"""
+    if rag_system is None:
+        await asyncio.to_thread(init_rag_system, cfg)
+    if rag_system is None:
+        raise RuntimeError("RAG系统不可用")
+    return await rag_system.asearch(
+        query, top_k=top_k, use_rerank=use_rerank, deadline=deadline, categories=categories or None
+    )
+
+
+async def ascore_resumes(
+    job_title: str,
+    requirements: str,
+    rows: AsyncIterator[Dict[str, Any]],
+    cfg: AgentConfig,
+    top_n: int = 10,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    为上传的外部简历评分（不检索数据集），rows 为 app.upload.iter_rows 产出的记录。依次产出：
+
+    - ("result", (index, result))：一条简历评分完成，按完成顺序
+    - ("error", {"index", "error"})：该条记录解析或评分失败（包括大模型重试后仍未返回该简历的评估）
+    - ("summary", {...})：最后一条，含总数、失败数、是否因超过 upload_max_rows 截断，以及综合评分前 top_n 名
+
+    每 upload_batch_size 条简历一次大模型调用（同时用交叉编码器计算与岗位的相关度），
+    最多 upload_max_concurrency 批同时进行；在途批次已满时暂停读取上传内容，
+    内存中只保留在途的批次和前 top_n 名。
+    """
+    if rag_system is None:
+        await asyncio.to_thread(init_rag_system, cfg)
+    if rag_system is None:
+        raise RuntimeError("RAG系统不可用")
+
+    query = f"{job_title} {requirements}"
+    job_requirements = _job_requirements(job_title, requirements)
+    batch_size = max(1, cfg.upload_batch_size)
+    max_concurrency = max(1, cfg.upload_max_concurrency)
+
+    async def evaluate(batch: List[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        candidates = [
+            _external_candidate(truncate_text(row["text"], 2000), row["id"], row["category"]) for row in batch
+        ]
+        scores = await rag_system.ascore_relevance(query, [candidate["content"] for candidate in candidates])
+        for candidate, score in zip(candidates, scores or []):
+            candidate["rerank_score"] = float(score)
+        score_results, missing_note = [], {}
+        if not rag_system.llm_available():
+            missing_note = _LLM_UNAVAILABLE_NOTE
+        else:
+            try:
+                score_results = await rag_system.aevaluate_candidates(job_requirements, candidates)
+            except CircuitOpenError:
+                missing_note = _LLM_UNAVAILABLE_NOTE
+        # evaluate_candidates 返回的 candidate_info 就是传入的候选人对象
+        evaluated = {id(r.get("candidate_info")): r for r in score_results if isinstance(r, dict)}
+        missing = [candidate for candidate in candidates if id(candidate) not in evaluated]
+        if missing and not missing_note:
+            # 大模型的回复漏掉了部分简历：只为这些简历重试一次，仍然缺少的作为错误返回而不是记 0 分
+            logger.info("大模型未返回 %d/%d 份上传简历的评估，重试一次", len(missing), len(candidates))
+            try:
+                retried = await rag_system.aevaluate_candidates(job_requirements, missing)
+            except CircuitOpenError:
+                retried = []
+            evaluated.update((id(r.get("candidate_info")), r) for r in retried if isinstance(r, dict))
+        outcomes: List[Tuple[str, Any]] = []
+        for row, candidate in zip(batch, candidates):
+            evaluation = evaluated.get(id(candidate))
+            if evaluation is None and not missing_note:
+                outcomes.append(("error", {"index": row["index"], "error": "大模型未返回该简历的评估"}))
+            else:
+                outcomes.append(("result", (row["index"], _build_result(evaluation or missing_note, candidate))))
+        return outcomes
+
+    total = failed = 0
+    truncated = exhausted = False
+    # 小顶堆保存前 top_n 名：(综合评分, 相关度, -序号)，同分时序号小的在前
+    top: List[Tuple[Tuple[float, float, int], Dict[str, Any]]] = []
+    pending: Dict[asyncio.Future, List[Dict[str, Any]]] = {}
+    try:
+        while True:
+            while not exhausted and len(pending) < max_concurrency:
+                batch: List[Dict[str, Any]] = []
+                while len(batch) < batch_size:
+                    try:
+                        row = await rows.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if "error" in row:
+                        failed += 1
+                        yield "error", row
+                        continue
+                    if total >= cfg.upload_max_rows:
+                        truncated = exhausted = True
+                        break
+                    total += 1
+                    batch.append(row)
+                if batch:
+                    pending[asyncio.ensure_future(evaluate(batch))] = batch
+            if not pending:
+                break
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch = pending.pop(task)
+                try:
+                    outcomes = task.result()
+                except Exception as e:  # noqa: BLE001
+                    logger.warning("上传简历评分失败（%d 条）: %s", len(batch), e)
+                    for row in batch:
+                        failed += 1
+                        yield "error", {"index": row["index"], "error": f"评分失败: {e}"}
+                    continue
+                for event, payload in outcomes:
+                    if event == "error":
+                        failed += 1
+                        yield event, payload
+                        continue
+                    index, result = payload
+                    key = (_summary_score(result), result["candidate_info"].get("rerank_score", 0.0), -index)
+                    if len(top) < top_n:
+                        heapq.heappush(top, (key, result))
+                    elif key > top[0][0]:
+                        heapq.heapreplace(top, (key, result))
+                    yield "result", (index, result)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if truncated:
+        logger.warning("上传的简历超过 %d 条，其余未评分", cfg.upload_max_rows)
+    yield "summary", {
+        "total": total,
+        "failed": failed,
+        "truncated": truncated,
+        "top": [(-key[2], result) for key, result in sorted(top, key=lambda item: item[0], reverse=True)],
+    }
+
+
+def _submit_in_context(pool: ThreadPoolExecutor, fn, *args):
+    """提交到线程池并保留当前上下文变量（请求路由、请求ID等）"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _completed_or_cancel(futures) -> Iterator[Any]:
+    """
+    按完成顺序产出 Future；调用方中途退出（异常、请求取消或生成器被关闭）时撤回尚未开始的任务，
+    避免线程池退出时还要等它们逐个执行完
+    """
+    try:
+        yield from as_completed(futures)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+@tracing.traced("fallback_method")
+def _fallback_to_original_method(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+    candidates: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    回退到原始的数据集评分方法
+
+    只做一次检索（取 2*top_n 的候选池，复用检索时已算好的重排序分数），
+    再把候选人按 fallback_batch_size 分批，以有限并发交给大模型评估。
+    categories 不为空时只检索这些类别的简历；candidates 为调用方已检索好的名单时不再重新检索。
+    """
+    logger.info("使用回退方法进行评分")
+    instrumentation.event("fallback", kind="fallback_method")
+    query = f"{job_title} {requirements}"
+    pool_size = max(top_n * 2, top_n)  # 取更大的池子再排序
+
+    if rag_system is None:
+        # 没有RAG系统时只能做关键词匹配，也无法调用大模型
+        matches = search_resumes(query, top_k=pool_size, categories=categories)
+        logger.warning("RAG系统不可用，回退方法按关键词匹配返回 %d 个候选简历", len(matches))
+        candidates = [
+            {"id": i, "category": category or "Unknown", "content": truncate_text(text, 2000)}
+            for i, (category, text) in enumerate(matches)
+        ]
+        note = {"strengths": "RAG系统不可用，仅按关键词匹配结果返回"}
+        return [_build_result(note, candidate) for candidate in candidates[:top_n]]
+
+    if not rag_system.llm_available():
+        logger.warning("大模型服务熔断中，回退方法仅返回检索重排序结果")
+        if candidates is None:
+            candidates = rag_system.search(
+                query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories
+            )
+        return _retrieval_only_results(candidates[:top_n])
+
+    if candidates is None:
+        candidates = rag_system.search(
+            query, top_k=pool_size, use_rerank=True, deadline=deadline, categories=categories
+        )
+    candidates = candidates[:pool_size]
+    logger.info("找到 %d 个候选简历", len(candidates))
+    # 各批并发评估，按一批的人数估计耗时
+    batch_size = max(1, cfg.fallback_batch_size)
+    if deadline is not None and not deadline.affords("llm_per_candidate", min(len(candidates), batch_size)):
+        logger.warning("剩余时间不足，回退方法跳过大模型评估")
+        deadline.degrade(STAGE_LLM)
+        return [_build_result(_DEADLINE_NOTE, candidate) for candidate in candidates[:top_n]]
+    # 对简历文本进行截断（复制后修改，不影响调用方与缓存中的名单）
+    candidates = [
+        dict(candidate, content=truncate_text(candidate.get("content", ""), 2000)) for candidate in candidates
+    ]
+
+    batches = [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
+
+    results: List[Dict[str, Any]] = []
+    if batches:
+        max_workers = max(1, min(len(batches), cfg.fallback_max_workers))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fallback-eval") as pool:
+            futures = {
+                _submit_in_context(pool, rag_system.evaluate_candidates, requirements, batch, deadline): batch
+                for batch in batches
+            }
+            for future in _completed_or_cancel(futures):
+                batch = futures[future]
+                missing_note = {"strengths": "大模型未返回该候选人的评估"}
+                try:
+                    score_results = future.result()
+                except RequestCancelled:
+                    raise
+                except (RateLimitExceeded, CircuitOpenError) as e:
+                    # 即使某批候选人评估失败，也保留其检索结果
+                    logger.warning("批量评估 %d 个候选人被跳过: %s", len(batch), e)
+                    score_results, missing_note = [], _LLM_UNAVAILABLE_NOTE
+                except DeadlineExceeded as e:
+                    logger.warning("批量评估 %d 个候选人超出时间预算: %s", len(batch), e)
+                    deadline.degrade(STAGE_LLM)
+                    score_results, missing_note = [], _DEADLINE_NOTE
+                except Exception as e:
+                    logger.error("批量评估 %d 个候选人失败: %s", len(batch), e, exc_info=True)
+                    score_results, missing_note = [], {"strengths": f"评估失败: {e}"}
+                # evaluate_candidates 返回的 candidate_info 就是传入的候选人对象
+                evaluated = {
+                    id(r.get("candidate_info")): r for r in score_results if isinstance(r, dict)
+                }
+                for candidate in batch:
+                    score_result = evaluated.get(id(candidate), missing_note)
+                    results.append(_build_result(score_result, candidate))
+
+    # 按综合评分排序，同分时按重排序分数
     results.sort(
-        key=lambda r: r.get("report", {})
-        .get("ordered_scores", [{}])[0]
-        .get("score", 0),
+        key=lambda r: (_summary_score(r), r.get("candidate_info", {}).get("rerank_score", 0.0)),
         reverse=True,
     )
-    logger.info(f"回退方法评分完成，返回前 {top_n} 个结果")
-    return results[:top_n]
\ No newline at end of file
+    logger.info("回退方法评分完成，返回前 %d 个结果", top_n)
+    return results[:top_n]
+
+
+def stream_score_from_dataset(
+    job_title: str,
+    requirements: str,
+    top_n: int,
+    cfg: AgentConfig,
+    deadline: Optional[Deadline] = None,
+    categories: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    渐进式评分：依次产出 (事件名, 数据)。
+
+    - ("candidates", List[result])：重排序后的候选人列表，评分尚未完成（均为0）
+    - ("evaluation", (rank, result))：某个候选人的大模型评估完成
+    - ("summary", List[(rank, result)])：全部完成后按综合评分排序的结果
+
+    rank 为候选人在重排序列表中的位置，客户端可据此把评估结果对应回候选人。
+    设置了 deadline 时，来不及完成的评估以零分结果返回，降级的阶段记录在 deadline.degraded 中。
+    categories 不为空时只检索这些类别的简历。
+    """
+    logger.info("开始流式评分，岗位: %s, 数量: %d", job_title, top_n)
+    init_rag_system(cfg)
+    categories = list(_category_key(categories)) or None
+
+    if rag_system is None:
+        # RAG系统不可用时无法提前给出候选人列表，直接返回回退方法的最终结果
+        logger.warning("RAG系统不可用，流式评分回退到原来的数据集评分方法")
+        ranked = _fallback_to_original_method(job_title, requirements, top_n, cfg, deadline, categories)
+        yield "summary", list(enumerate(ranked))
+        return
+
+    query = f"{job_title} {requirements}"
+    candidates = rag_system.search(query, top_k=top_n, use_rerank=True, deadline=deadline, categories=categories)
+    yield "candidates", [_build_result({}, candidate) for candidate in candidates]
+
+    if not rag_system.llm_available():
+        logger.warning("大模型服务熔断中，流式评分仅返回检索重排序结果")
+        yield "summary", list(enumerate(_retrieval_only_results(candidates)))
+        return
+
+    # 每个候选人单独评估、并发进行，只需够评估一个候选人的时间
+    if deadline is not None and candidates and not deadline.affords("llm_per_candidate"):
+        logger.warning("剩余时间不足，流式评分跳过大模型评估")
+        deadline.degrade(STAGE_LLM)
+        yield "summary", [(rank, _build_result(_DEADLINE_NOTE, c)) for rank, c in enumerate(candidates)]
+        return
+
+    evaluated: List[Tuple[int, Dict[str, Any]]] = []
+    if candidates:
+        # 每个候选人单独调用一次大模型，谁先完成谁先返回
+        max_workers = max(1, min(len(candidates), cfg.stream_max_workers))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stream-eval") as pool:
+            futures = {
+                _submit_in_context(pool, rag_system.evaluate_candidates, requirements, [candidate], deadline): (
+                    rank, candidate
+                )
+                for rank, candidate in enumerate(candidates)
+            }
+            for future in _completed_or_cancel(futures):
+                rank, candidate = futures[future]
+                try:
+                    score_results = future.result()
+                    score_result = score_results[0] if score_results else {}
+                except (RateLimitExceeded, RequestCancelled):
+                    raise
+                except CircuitOpenError:
+                    score_result = _LLM_UNAVAILABLE_NOTE
+                except DeadlineExceeded:
+                    deadline.degrade(STAGE_LLM)
+                    score_result = _DEADLINE_NOTE
+                except Exception as e:
+                    logger.error("评估第 %d 个候选人失败: %s", rank + 1, e, exc_info=True)
+                    score_result = {"strengths": f"评估失败: {e}"}
+                if not isinstance(score_result, dict):
+                    score_result = {}
+                result = _build_result(score_result, candidate)
+                evaluated.append((rank, result))
+                yield "evaluation", (rank, result)
+
+    evaluated.sort(key=lambda item: _summary_score(item[1]), reverse=True)
+    logger.info("流式评分完成，返回 %d 个结果", len(evaluated))
+    yield "summary", evaluated
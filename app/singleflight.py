@@ -0,0 +1,93 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    合并同时进行的相同请求：同一个 key 在计算完成前只执行一次，
+    其余调用方等待并共享同一份结果（返回深拷贝，互不影响）。
+
+    同步调用（do）与协程调用（ado）各自合并，协程的共享计算在所有等待方都取消后才会被取消。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, Tuple[asyncio.Task, list]] = {}
+        self._leaders = 0
+        self._shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """返回 (结果, 是否复用了其他调用方的计算)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self._leaders += 1
+            else:
+                self._shared += 1
+
+        if not leader:
+            return copy.deepcopy(future.result()), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """do 的协程版本，fn 为返回协程的函数"""
+        with self._lock:
+            entry = self._tasks.get(key)
+            leader = entry is None
+            if leader:
+                task = asyncio.ensure_future(fn())
+                entry = (task, [0])
+                self._tasks[key] = entry
+                self._leaders += 1
+                task.add_done_callback(lambda _: self._forget(key, task))
+            else:
+                self._shared += 1
+            task, waiters = entry
+            waiters[0] += 1
+
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # 只有最后一个等待方离开时才取消共享的计算
+            with self._lock:
+                waiters[0] -= 1
+                if waiters[0] == 0 and not task.done():
+                    task.cancel()
+            raise
+        with self._lock:
+            waiters[0] -= 1
+        return (result, False) if leader else (copy.deepcopy(result), True)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is not None and entry[0] is task:
+                del self._tasks[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._leaders + self._shared
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "computed_total": self._leaders,
+                "coalesced_total": self._shared,
+                "coalesced_ratio": round(self._shared / total, 3) if total else 0.0,
+            }
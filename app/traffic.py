@@ -0,0 +1,81 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import AgentConfig
+
+logger = logging.getLogger(__name__)
+
+# 随请求一起记录的请求头（影响准入与优先级）
+_RECORDED_HEADERS = ("x-client-id", "x-priority")
+
+
+class TrafficRecorder:
+    """
+    把线上的评分请求按 JSONL 追加写入文件，供 benchmarks.loadgen 回放。
+
+    每行：{"ts", "method", "path", "headers", "body", "request_id"}，body 为 ScoreRequest。
+    写文件在后台线程中进行，不阻塞事件循环；队列满时丢弃记录而不是拖慢请求。
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, max_pending: int = 10000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_pending)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._write_loop, name="traffic-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, method: str, path: str, headers: Any, body: Dict[str, Any], request_id: str = "") -> None:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        entry = {
+            "ts": round(time.time(), 3),
+            "method": method,
+            "path": path,
+            "headers": {name: headers[name] for name in _RECORDED_HEADERS if name in headers},
+            "body": body,
+            "request_id": request_id,
+        }
+        try:
+            self._queue.put_nowait(json.dumps(entry, ensure_ascii=False))
+        except queue.Full:
+            self._dropped += 1
+
+    def _write_loop(self) -> None:
+        while True:
+            lines = [self._queue.get()]
+            # 一次写入队列中已有的所有记录
+            while len(lines) < 1000:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.warning("写入流量记录失败: %s", e)
+            if self._dropped:
+                logger.warning("流量记录队列已满，丢弃 %d 条记录", self._dropped)
+                self._dropped = 0
+
+
+# 进程内唯一的记录器；未配置路径时为 None
+_recorder: Optional[TrafficRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_traffic_recorder(cfg: AgentConfig) -> Optional[TrafficRecorder]:
+    """未设置 TRAFFIC_RECORD_PATH 时返回 None（不记录）"""
+    global _recorder
+    if not cfg.traffic_record_path:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = TrafficRecorder(cfg.traffic_record_path, cfg.traffic_record_sample_rate)
+    return _recorder
@@ -0,0 +1,149 @@
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from starlette.responses import StreamingResponse
+
+# 单条记录（CSV 中可能跨多行）的最大字符数，防止引号不配对时把整个文件读进内存
+MAX_RECORD_CHARS = 1_000_000
+
+# 支持的上传格式
+FORMATS = ("csv", "jsonl")
+
+# 列名（不区分大小写）：简历文本、候选人ID、类别
+_TEXT_KEYS = ("resume", "resume_text", "text", "content")
+_ID_KEYS = ("id", "candidate_id", "name")
+_CATEGORY_KEYS = ("category",)
+
+
+def detect_format(content_type: str, fmt: Optional[str] = None) -> str:
+    """显式指定的格式优先，否则按 Content-Type 判断，默认 CSV"""
+    if fmt:
+        return fmt.lower()
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "jsonl"
+    return "csv"
+
+
+def _pick(record: Dict[str, Any], keys: tuple) -> Any:
+    lowered = {str(key).strip().lower(): value for key, value in record.items()}
+    for key in keys:
+        value = lowered.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _to_row(index: int, record: Any) -> Dict[str, Any]:
+    """把一条记录转换为 {"index", "id", "category", "text"}，缺少简历文本时为 {"index", "error"}"""
+    if isinstance(record, str):
+        record = {"resume": record}
+    if not isinstance(record, dict):
+        return {"index": index, "error": "记录必须是对象或字符串"}
+    text = _pick(record, _TEXT_KEYS)
+    if text is None and len(record) == 1:
+        text = next(iter(record.values()))
+    if not isinstance(text, str) or not text.strip():
+        return {"index": index, "error": "缺少简历文本（resume/resume_text/text/content 列）"}
+    candidate_id = _pick(record, _ID_KEYS)
+    return {
+        "index": index,
+        "id": candidate_id if candidate_id is not None else index,
+        "category": str(_pick(record, _CATEGORY_KEYS) or "上传简历"),
+        "text": text.strip(),
+    }
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """按换行符逐行产出请求体（保留行尾），增量解码 UTF-8，不把整个请求体读入内存"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        start = 0
+        while True:
+            end = buffer.find("\n", start)
+            if end < 0:
+                break
+            yield buffer[start:end + 1]
+            start = end + 1
+        # 剩余的是不完整的一行
+        buffer = buffer[start:]
+        if len(buffer) > MAX_RECORD_CHARS:
+            raise ValueError(f"单行超过 {MAX_RECORD_CHARS} 个字符")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def _csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """逐条解析 CSV：带引号的字段可以跨行，引号配对后才算一条完整记录"""
+    parts: List[str] = []
+    size = 0
+    quotes = 0
+    async for line in _lines(chunks):
+        parts.append(line)
+        size += len(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if size > MAX_RECORD_CHARS:
+                raise ValueError(f"单条记录超过 {MAX_RECORD_CHARS} 个字符（可能是引号不配对）")
+            continue
+        record = "".join(parts)
+        parts, size, quotes = [], 0, 0
+        if record.strip():
+            yield next(csv.reader([record]))
+    if parts and "".join(parts).strip():
+        raise ValueError("文件末尾的记录引号不配对")
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str = "csv") -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式解析上传的简历文件，逐条产出 {"index", "id", "category", "text"}；
+    无法解析的记录产出 {"index", "error"}，不中断后续记录。
+
+    - csv：第一行为表头，简历文本列为 Resume/resume_text/text/content（只有一列时直接使用该列），
+      可选 id/name 与 Category 列
+    - jsonl：每行一个 JSON 对象（字段同上）或字符串
+    """
+    index = 0
+    if fmt == "csv":
+        header: Optional[List[str]] = None
+        async for values in _csv_records(chunks):
+            if header is None:
+                header = values
+                continue
+            yield _to_row(index, dict(zip(header, values)))
+            index += 1
+    elif fmt == "jsonl":
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"index": index, "error": f"JSON 解析失败: {e}"}
+            else:
+                yield _to_row(index, record)
+            index += 1
+    else:
+        raise ValueError(f"不支持的格式: {fmt}（支持 {'、'.join(FORMATS)}）")
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    边读取请求体边输出的流式响应。
+
+    StreamingResponse 会并发调用 receive 监听客户端断开，与读取请求体争抢消息，这里只负责输出：
+    读取请求体期间客户端断开时 request.stream() 抛出 ClientDisconnect；请求体读完之后才断开的，
+    只会把在途的批次执行完。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        finally:
+            if self.background is not None:
+                await self.background()
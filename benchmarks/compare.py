@@ -0,0 +1,82 @@
+"""
+对比两次基准测试结果，列出各指标的变化并标记超过阈值的退化。
+
+用法：
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json --threshold 10
+
+存在退化时退出码为 1，便于在 CI 中使用。
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+# 越大越好的指标（其余数值指标视为越小越好）
+_HIGHER_IS_BETTER = ("per_second",)
+# 不参与对比的字段
+_SKIP = ("count", "rows", "corpus_mb", "corpus_generate_seconds", "vectors", "dimensions", "errors", "fallbacks")
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = float(value)
+    return flat
+
+
+def _by_scale(report: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    return {result["scale"]: flatten(result) for result in report.get("results", [])}
+
+
+def compare(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """打印对比表，返回退化的指标"""
+    regressions = []
+    base_scales, current_scales = _by_scale(base), _by_scale(current)
+    print(f"基准: {base['meta'].get('commit')}  当前: {current['meta'].get('commit')}")
+    for scale in current_scales:
+        if scale not in base_scales:
+            continue
+        print(f"\n== {scale} ==")
+        for metric, value in sorted(current_scales[scale].items()):
+            if any(part in _SKIP for part in metric.split(".")) or metric not in base_scales[scale]:
+                continue
+            baseline = base_scales[scale][metric]
+            change = _change(baseline, value)
+            marker = ""
+            if change is not None:
+                worse = -change if metric.endswith(_HIGHER_IS_BETTER) else change
+                if worse > threshold:
+                    marker = "  <-- 退化"
+                    regressions.append(f"{scale}.{metric}")
+            change_text = f"{change:+.1f}%" if change is not None else "n/a"
+            print(f"{metric:40s} {baseline:>12.3f} {value:>12.3f} {change_text:>9s}{marker}")
+    return regressions
+
+
+def _change(baseline: float, value: float) -> Optional[float]:
+    if baseline == 0:
+        return None
+    return (value - baseline) / abs(baseline) * 100
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("base")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="退化阈值（百分比）")
+    args = parser.parse_args(argv)
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(base, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项指标退化超过 {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+合成简历数据集生成器：输出与线上数据相同的 Category,Resume 两列 CSV。
+
+内容按类别从技能、职位、行业词表中随机组合，包含教育背景、工作经历、项目与技能等段落，
+长度约 0.6k~2k 字符；相同的 seed 生成完全相同的文件，便于在不同提交间对比。
+
+用法：
+    python -m benchmarks.corpus --rows 100k --out benchmarks/data/resumes_100k.csv
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+# 类别 -> (职位名称, 核心技能)
+CATEGORIES: Dict[str, Tuple[List[str], List[str]]] = {
+    "Data Science": (
+        ["Data Scientist", "Machine Learning Engineer", "Data Analyst"],
+        ["Python", "pandas", "scikit-learn", "TensorFlow", "PyTorch", "SQL", "statistics", "NLP", "XGBoost", "Spark"],
+    ),
+    "Python Developer": (
+        ["Python Developer", "Backend Engineer", "Software Engineer"],
+        ["Python", "Django", "Flask", "FastAPI", "PostgreSQL", "Redis", "Celery", "REST API", "Docker", "asyncio"],
+    ),
+    "Java Developer": (
+        ["Java Developer", "Backend Engineer", "Senior Software Engineer"],
+        ["Java", "Spring Boot", "Hibernate", "Microservices", "Kafka", "MySQL", "Maven", "JUnit", "Kubernetes", "JVM tuning"],
+    ),
+    "Web Designing": (
+        ["Web Designer", "Frontend Developer", "UI Engineer"],
+        ["HTML", "CSS", "JavaScript", "React", "Vue", "TypeScript", "Figma", "Bootstrap", "responsive design", "Webpack"],
+    ),
+    "DevOps Engineer": (
+        ["DevOps Engineer", "Site Reliability Engineer", "Cloud Engineer"],
+        ["AWS", "Terraform", "Kubernetes", "Docker", "Jenkins", "Ansible", "Prometheus", "Linux", "CI/CD", "Helm"],
+    ),
+    "Testing": (
+        ["QA Engineer", "Test Automation Engineer", "SDET"],
+        ["Selenium", "pytest", "JMeter", "Postman", "test planning", "regression testing", "Cucumber", "Appium", "JIRA", "TestNG"],
+    ),
+    "Database": (
+        ["Database Administrator", "Data Engineer", "ETL Developer"],
+        ["Oracle", "MySQL", "PostgreSQL", "MongoDB", "query tuning", "backup and recovery", "PL/SQL", "Airflow", "Informatica", "replication"],
+    ),
+    "HR": (
+        ["HR Manager", "Recruiter", "HR Business Partner"],
+        ["talent acquisition", "onboarding", "employee relations", "payroll", "HRIS", "performance management", "compensation", "labor law", "interviewing", "training"],
+    ),
+    "Sales": (
+        ["Sales Executive", "Account Manager", "Business Development Manager"],
+        ["B2B sales", "CRM", "Salesforce", "negotiation", "lead generation", "key accounts", "forecasting", "market research", "cold calling", "presentations"],
+    ),
+    "Mechanical Engineer": (
+        ["Mechanical Engineer", "Design Engineer", "Production Engineer"],
+        ["AutoCAD", "SolidWorks", "CATIA", "ANSYS", "GD&T", "manufacturing", "lean", "thermodynamics", "CNC", "quality control"],
+    ),
+    "Network Security Engineer": (
+        ["Network Security Engineer", "Security Analyst", "Network Engineer"],
+        ["firewalls", "Cisco", "IDS/IPS", "SIEM", "VPN", "penetration testing", "TCP/IP", "incident response", "ISO 27001", "Wireshark"],
+    ),
+    "Business Analyst": (
+        ["Business Analyst", "Product Analyst", "Product Manager"],
+        ["requirements gathering", "UML", "Agile", "Scrum", "Power BI", "Tableau", "stakeholder management", "user stories", "SQL", "process modeling"],
+    ),
+}
+
+_DEGREES = ["B.Tech", "B.Sc", "M.Sc", "MBA", "M.Tech", "B.E", "PhD", "BCA", "MCA"]
+_SCHOOLS = ["State University", "Institute of Technology", "National College", "City University", "Polytechnic Institute"]
+_COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Ltd", "Hooli", "Stark Industries", "Wayne Enterprises",
+              "Soylent", "Cyberdyne", "Tyrell", "Wonka Labs", "Vandelay Industries"]
+_VERBS = ["Designed", "Implemented", "Led", "Optimized", "Maintained", "Migrated", "Automated", "Delivered", "Built", "Improved"]
+_OUTCOMES = ["reducing latency by {n}%", "serving {n}k daily users", "cutting costs by {n}%", "improving accuracy by {n}%",
+             "shortening release cycles by {n}%", "supporting a team of {n} people"]
+_SOFT = ["communication", "teamwork", "leadership", "problem solving", "time management", "mentoring", "ownership"]
+
+# 规模别名
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_rows(value: str) -> int:
+    """支持 1k/100k/1m 等别名或直接写行数"""
+    value = value.strip().lower()
+    return SCALES[value] if value in SCALES else int(value)
+
+
+def _resume(rng: random.Random, category: str) -> str:
+    titles, skills = CATEGORIES[category]
+    years = rng.randint(1, 15)
+    title = rng.choice(titles)
+    core = rng.sample(skills, k=rng.randint(5, len(skills)))
+    # 少量跨类别技能，使 BM25 与向量检索的区分度更接近真实数据
+    other = CATEGORIES[rng.choice(list(CATEGORIES))][1]
+    extra = rng.sample(other, k=rng.randint(0, 3))
+
+    parts = [
+        f"{title} with {years} years of experience in {', '.join(core[:3])}.",
+        f"Skills: {', '.join(core + extra)}; {', '.join(rng.sample(_SOFT, k=3))}.",
+        f"Education: {rng.choice(_DEGREES)}, {rng.choice(_SCHOOLS)} ({rng.randint(1995, 2022)}).",
+        "Experience:",
+    ]
+    for _ in range(rng.randint(2, 5)):
+        start = rng.randint(2005, 2021)
+        parts.append(
+            f"{rng.choice(titles)} at {rng.choice(_COMPANIES)} ({start}-{start + rng.randint(1, 4)}):"
+        )
+        for _ in range(rng.randint(2, 4)):
+            outcome = rng.choice(_OUTCOMES).format(n=rng.randint(5, 80))
+            parts.append(f"- {rng.choice(_VERBS)} {rng.choice(core)} solutions, {outcome}.")
+    parts.append("Projects:")
+    for _ in range(rng.randint(1, 3)):
+        parts.append(
+            f"- {rng.choice(_VERBS)} a {rng.choice(core)} based system using {', '.join(rng.sample(core, k=2))}."
+        )
+    return "\n".join(parts)
+
+
+def generate(rows: int, seed: int = 42) -> Iterator[Tuple[str, str]]:
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    for _ in range(rows):
+        category = rng.choice(categories)
+        yield category, _resume(rng, category)
+
+
+def write_csv(path: str, rows: int, seed: int = 42) -> str:
+    """逐行写出（不在内存中保存整个数据集），文件已存在时直接复用"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Category", "Resume"])
+        writer.writerows(generate(rows, seed))
+    os.replace(tmp_path, path)
+    return path
+
+
+def sample_queries(count: int, seed: int = 7) -> List[Tuple[str, str]]:
+    """与语料同分布的 (岗位名称, 岗位要求) 查询"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        titles, skills = CATEGORIES[rng.choice(list(CATEGORIES))]
+        requirements = f"{rng.randint(2, 8)}+ years, {', '.join(rng.sample(skills, k=3))}"
+        queries.append((rng.choice(titles), requirements))
+    return queries
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="生成合成简历数据集（Category,Resume）")
+    parser.add_argument("--rows", default="1k", help="行数，支持 1k/10k/100k/1m")
+    parser.add_argument("--out", default=None, help="输出路径，默认 benchmarks/data/resumes_<rows>.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    rows = parse_rows(args.rows)
+    out = args.out or os.path.join(os.path.dirname(__file__), "data", f"resumes_{args.rows.lower()}.csv")
+    write_csv(out, rows, args.seed)
+    print(f"已生成 {rows} 行: {out} ({os.path.getsize(out) / 1e6:.1f} MB)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+流量回放与压测工具。
+
+请求文件为 JSONL，每行 {"ts", "method", "path", "headers", "body"}，body 为 ScoreRequest：
+- 线上记录：后端设置 TRAFFIC_RECORD_PATH 后自动写入（见 app/traffic.py）
+- 合成：python -m benchmarks.loadgen synth traffic.jsonl --count 500 --repeat-ratio 0.3
+
+回放：
+    # 开环：按固定速率（或 --poisson 泊松到达）发送，不等待前一个请求完成
+    python -m benchmarks.loadgen replay traffic.jsonl --mode open --rate 20 --duration 60
+    # 开环：按记录中的时间间隔发送，--time-warp 10 表示加速 10 倍
+    python -m benchmarks.loadgen replay traffic.jsonl --mode open --time-warp 10
+    # 闭环：固定并发数，每个并发完成一个请求后立即发送下一个
+    python -m benchmarks.loadgen replay traffic.jsonl --mode closed --concurrency 16 --requests 1000
+
+报告吞吐、延迟分位数、状态码与错误率、降级比例，以及从 /metrics 前后差值计算的缓存（请求合并）命中率。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks import corpus
+from benchmarks.run import latency_summary
+
+
+def load_requests(path: str) -> List[Dict[str, Any]]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and entry.get("path") and isinstance(entry.get("body"), dict):
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry.get("ts", 0))
+    return entries
+
+
+def synthesize(
+    path: str, count: int, repeat_ratio: float, rate: float, path_name: str, clients: int, seed: int
+) -> None:
+    """
+    生成合成流量；repeat_ratio 为重复之前某个请求的比例（用于观察请求合并/缓存），
+    请求随机分配给 clients 个客户端（X-Client-Id，被测服务需设置 TRUST_CLIENT_ID_HEADER=1 才按该头区分客户端），
+    避免全部落在同一个客户端的准入上限内
+    """
+    rng = random.Random(seed)
+    queries = corpus.sample_queries(max(1, count), seed=seed)
+    ts = time.time()
+    sent: List[Dict[str, Any]] = []
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            if sent and rng.random() < repeat_ratio:
+                body = dict(rng.choice(sent))
+            else:
+                job_title, requirements = queries[i]
+                body = {"job_title": job_title, "requirements": requirements, "top_n": rng.choice([3, 5, 10])}
+                sent.append(body)
+            ts += rng.expovariate(rate)
+            headers = {"x-client-id": f"client-{rng.randrange(clients)}"} if clients > 0 else {}
+            entry = {"ts": round(ts, 3), "method": "POST", "path": path_name, "headers": headers, "body": body}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class Results:
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.degraded = 0
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        completed = sum(self.statuses.values())
+        successes = len(self.latencies)
+        failures = completed - successes + sum(self.errors.values())
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "completed": completed,
+            "duration_s": round(wall_seconds, 3),
+            "throughput_rps": round(completed / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+            "success_rps": round(successes / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+            "latency": latency_summary(self.latencies, wall_seconds),
+            "status_codes": dict(sorted(self.statuses.items())),
+            "errors": dict(self.errors),
+            "error_rate": round(failures / self.sent, 4) if self.sent else 0.0,
+            "degraded_rate": round(self.degraded / successes, 4) if successes else 0.0,
+        }
+
+
+async def send(client: httpx.AsyncClient, entry: Dict[str, Any], results: Results) -> None:
+    """发送一个请求；延迟只统计成功（2xx）的响应"""
+    results.sent += 1
+    method = entry.get("method", "POST").upper()
+    headers = entry.get("headers") or {}
+    start = time.perf_counter()
+    try:
+        if method == "GET":
+            response = await client.get(entry["path"], params=entry["body"], headers=headers)
+        else:
+            response = await client.post(entry["path"], json=entry["body"], headers=headers)
+    except httpx.HTTPError as e:
+        results.errors[type(e).__name__] += 1
+        return
+    elapsed = time.perf_counter() - start
+    results.statuses[str(response.status_code)] += 1
+    if 200 <= response.status_code < 300:
+        results.latencies.append(elapsed)
+        if response.headers.get("content-type", "").startswith("application/json"):
+            try:
+                if response.json().get("degraded_stages"):
+                    results.degraded += 1
+            except (ValueError, AttributeError):
+                pass
+
+
+def _entries(entries: List[Dict[str, Any]], loop: bool, limit: Optional[int]) -> Iterator[Dict[str, Any]]:
+    stream = itertools.cycle(entries) if loop else iter(entries)
+    return itertools.islice(stream, limit) if limit else stream
+
+
+def _gaps(entries: List[Dict[str, Any]], time_warp: float) -> Iterator[float]:
+    """按记录的时间戳计算到达间隔（循环回放时重复使用同一组间隔）"""
+    stamps = [entry.get("ts", 0) for entry in entries]
+    gaps = [0.0] + [max(0.0, (b - a) / time_warp) for a, b in zip(stamps, stamps[1:])]
+    return itertools.cycle(gaps)
+
+
+async def open_loop(client, entries, args, results: Results) -> None:
+    """开环：到达时间与响应无关；在途请求达到 --max-in-flight 时丢弃新请求并计入 dropped"""
+    rng = random.Random(args.seed)
+    gaps = _gaps(entries, args.time_warp) if not args.rate else None
+    tasks = set()
+    start = time.perf_counter()
+    next_at = 0.0
+    for entry in _entries(entries, args.loop, args.requests):
+        if args.rate:
+            next_at += rng.expovariate(args.rate) if args.poisson else 1.0 / args.rate
+        else:
+            next_at += next(gaps)
+        if args.duration and next_at > args.duration:
+            break
+        delay = start + next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if args.max_in_flight and len(tasks) >= args.max_in_flight:
+            results.dropped += 1
+            continue
+        task = asyncio.ensure_future(send(client, entry, results))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def closed_loop(client, entries, args, results: Results) -> None:
+    """闭环：--concurrency 个并发各自串行发送"""
+    source = _entries(entries, args.loop, args.requests)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def worker():
+        for entry in source:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            await send(client, entry, results)
+            if args.think_time:
+                await asyncio.sleep(args.think_time)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+async def scrape_cache_counters(client: httpx.AsyncClient) -> Optional[Counter]:
+    """读取 /metrics 中的 rag_cache_requests_total，按 (cache, result) 汇总"""
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    counters: Counter = Counter()
+    for family in text_string_to_metric_families(response.text):
+        if family.name != "rag_cache_requests":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_total"):
+                counters[(sample.labels.get("cache"), sample.labels.get("result"))] += sample.value
+    return counters
+
+
+def cache_ratios(before: Optional[Counter], after: Optional[Counter]) -> Optional[Dict[str, Any]]:
+    if before is None or after is None:
+        return None
+    delta = after - before
+    ratios: Dict[str, Any] = {}
+    for cache in sorted({cache for cache, _ in delta}):
+        hits, misses = delta[(cache, "hit")], delta[(cache, "miss")]
+        total = hits + misses
+        ratios[cache] = {"hits": int(hits), "misses": int(misses), "hit_ratio": round(hits / total, 4) if total else 0.0}
+    return ratios
+
+
+async def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    entries = load_requests(args.file)
+    if not entries:
+        raise SystemExit(f"请求文件中没有可回放的请求: {args.file}")
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.max_in_flight or 0, 100))
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        before = await scrape_cache_counters(client)
+        results = Results()
+        start = time.perf_counter()
+        if args.mode == "open":
+            await open_loop(client, entries, args, results)
+        else:
+            await closed_loop(client, entries, args, results)
+        wall = time.perf_counter() - start
+        after = await scrape_cache_counters(client)
+
+    report = results.report(wall)
+    report["cache"] = cache_ratios(before, after)
+    report["meta"] = {
+        "file": args.file,
+        "base_url": args.base_url,
+        "mode": args.mode,
+        "rate": args.rate,
+        "poisson": args.poisson,
+        "time_warp": args.time_warp,
+        "concurrency": args.concurrency,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return report
+
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(
+        f"发送 {report['sent']}，完成 {report['completed']}，丢弃 {report['dropped']}，"
+        f"耗时 {report['duration_s']}s，吞吐 {report['throughput_rps']} req/s",
+        file=sys.stderr,
+    )
+    print(
+        f"延迟 p50={latency['p50_ms']}ms p90={latency['p90_ms']}ms p99={latency['p99_ms']}ms max={latency['max_ms']}ms",
+        file=sys.stderr,
+    )
+    print(f"状态码 {report['status_codes']}，错误 {report['errors']}，错误率 {report['error_rate']:.2%}", file=sys.stderr)
+    if report["cache"] is not None:
+        for cache, stats in report["cache"].items():
+            print(f"缓存 {cache}: 命中率 {stats['hit_ratio']:.2%} ({stats['hits']}/{stats['hits'] + stats['misses']})",
+                  file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="流量回放与压测工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rp = sub.add_parser("replay", help="回放请求文件")
+    rp.add_argument("file")
+    rp.add_argument("--base-url", default="http://127.0.0.1:8000")
+    rp.add_argument("--mode", choices=("open", "closed"), default="closed")
+    rp.add_argument("--rate", type=float, default=0.0, help="开环发送速率（req/s）；为 0 时按记录的时间间隔发送")
+    rp.add_argument("--poisson", action="store_true", help="开环到达间隔服从指数分布，而不是固定间隔")
+    rp.add_argument("--time-warp", type=float, default=1.0, help="按记录时间回放时的加速倍数")
+    rp.add_argument("--max-in-flight", type=int, default=0, help="开环在途请求上限，超过时丢弃（0 表示不限制）")
+    rp.add_argument("--concurrency", type=int, default=8, help="闭环并发数")
+    rp.add_argument("--think-time", type=float, default=0.0, help="闭环中每个请求完成后的等待秒数")
+    rp.add_argument("--requests", type=int, default=0, help="最多发送的请求数（0 表示不限制）")
+    rp.add_argument("--duration", type=float, default=0.0, help="最长运行秒数（0 表示不限制）")
+    rp.add_argument("--loop", action="store_true", help="请求文件用完后从头循环")
+    rp.add_argument("--timeout", type=float, default=120.0)
+    rp.add_argument("--seed", type=int, default=42)
+    rp.add_argument("--output", default=None, help="JSON 报告路径")
+
+    sp = sub.add_parser("synth", help="生成合成请求文件")
+    sp.add_argument("out")
+    sp.add_argument("--count", type=int, default=500)
+    sp.add_argument("--repeat-ratio", type=float, default=0.2)
+    sp.add_argument("--rate", type=float, default=5.0, help="记录中的平均到达速率（req/s）")
+    sp.add_argument("--path", default="/api/score")
+    sp.add_argument("--clients", type=int, default=20, help="客户端数量（0 表示不设置 X-Client-Id）")
+    sp.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args(argv)
+    if args.command == "synth":
+        synthesize(args.out, args.count, args.repeat_ratio, args.rate, args.path, args.clients, args.seed)
+        print(f"已生成 {args.count} 个请求: {args.out}", file=sys.stderr)
+        return
+
+    if args.mode == "open" and args.time_warp <= 0:
+        parser.error("--time-warp 必须大于 0")
+    report = asyncio.run(replay(args))
+    _print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+检索/评分管线基准测试。
+
+每个规模在独立子进程中运行（内存数据互不干扰），依次测量：
+- 数据加载（ingest）耗时与吞吐、索引构建耗时、模型初始化耗时
+- 建索引后的常驻内存增量与进程峰值内存
+- search() 在不重排序 / 重排序两种模式下的 p50/p90/p99 延迟与吞吐
+- 可选（--score）：score_from_dataset 端到端延迟，需要可用的大模型服务；
+  加 --stub-llm 时改用本地模拟服务（benchmarks.stub_llm），不产生调用费用
+
+用法：
+    python -m benchmarks.run --scales 1k,100k --queries 50
+    python -m benchmarks.run --scales 1k --score --score-queries 10 --stub-llm lognormal:0.0,0.5
+
+结果为 JSON，默认写入 benchmarks/results/<时间>-<提交>.json，可用 benchmarks.compare 对比两次结果。
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks import corpus
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 影响结果的环境变量，随结果一起记录
+_ENV_KEYS = (
+    "HF_EMBEDDING_MODEL",
+    "RAG_CPU_WORKERS",
+    "RAG_BATCH_MAX_LATENCY_MS",
+    "RAG_EMBED_BATCH_SIZE",
+    "RAG_RERANK_BATCH_SIZE",
+    "Gemini_Base_Url",
+    "Gemini_Model_Name",
+)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(samples: List[float], wall_seconds: float) -> Dict[str, float]:
+    """samples 为秒，输出毫秒"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+        "per_second": round(len(samples) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+    }
+
+
+def _rss_mb() -> float:
+    """当前常驻内存（Linux 读取 /proc，其余平台退化为峰值内存）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _timed_searches(rag, queries: List[str], iterations: int, use_rerank: bool, top_k: int) -> Dict[str, float]:
+    samples = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        rag.search(queries[i % len(queries)], top_k=top_k, use_rerank=use_rerank)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples, time.perf_counter() - wall_start)
+
+
+def bench_scale(scale: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """在当前进程中测量一个规模"""
+    rows = corpus.parse_rows(scale)
+    path = os.path.join(args.data_dir, f"resumes_{scale.lower()}.csv")
+    result: Dict[str, Any] = {"scale": scale, "rows": rows}
+
+    start = time.perf_counter()
+    generated = not os.path.exists(path)
+    corpus.write_csv(path, rows, seed=args.seed)
+    if generated:
+        result["corpus_generate_seconds"] = round(time.perf_counter() - start, 3)
+    result["corpus_mb"] = round(os.path.getsize(path) / 1e6, 2)
+
+    # 在导入重量级依赖之后再记录基线内存，内存增量只反映数据与索引
+    from rag_system.llama_rag_system import SimpleRAG
+
+    rss_before = _rss_mb()
+    rag = SimpleRAG(path, top_n=args.retrieval_k)
+    load_times = rag.load_times
+    result["init_components_seconds"] = load_times.get("init_components")
+    result["ingest"] = {
+        "seconds": load_times.get("load_data"),
+        "rows_per_second": round(rows / load_times["load_data"], 1) if load_times.get("load_data") else None,
+    }
+    result["index_build_seconds"] = load_times.get("build_retriever")
+    result["memory"] = {
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    if rag.vectorstore is not None:
+        result["index"] = {"vectors": rag.vectorstore.index.ntotal, "dimensions": rag.vectorstore.index.d}
+
+    queries = [f"{title} {requirements}" for title, requirements in corpus.sample_queries(args.queries)]
+    for query in queries[: args.warmup]:
+        rag.search(query, top_k=args.top_k, use_rerank=True)
+    result["search"] = {
+        "no_rerank": _timed_searches(rag, queries, args.iterations, use_rerank=False, top_k=args.top_k),
+        "rerank": _timed_searches(rag, queries, args.iterations, use_rerank=True, top_k=args.top_k),
+    }
+
+    if args.score:
+        result["score_from_dataset"] = _bench_score(rag, path, args)
+    return result
+
+
+class _FallbackCounter:
+    """统计评分过程中的降级事件（instrumentation 监听器），结果中据此区分正常评分与回退路径"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def on_event(self, name: str, amount: float, route: str, labels: Dict[str, Optional[str]]) -> None:
+        if name == "fallback":
+            kind = labels.get("kind") or "unknown"
+            self.counts[kind] = self.counts.get(kind, 0) + int(amount)
+
+
+@contextlib.contextmanager
+def _use_benchmark_dataset(rag, path: str) -> Iterator[None]:
+    """
+    评分期间让 app.service 与 app.dataset 都使用基准数据集：回退路径（app.dataset.search_resumes）
+    默认会加载并检索真实数据集，结果就不再反映被测的管线
+    """
+    from pathlib import Path
+
+    from app import dataset, service
+
+    saved = (service.rag_system, dataset.rag_system, dataset.DATASET_PATH)
+    service.rag_system = rag
+    dataset.rag_system = rag
+    dataset.DATASET_PATH = Path(path)
+    dataset.load_dataset.cache_clear()
+    try:
+        yield
+    finally:
+        service.rag_system, dataset.rag_system, dataset.DATASET_PATH = saved
+        dataset.load_dataset.cache_clear()
+
+
+def _bench_score(rag, path: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """端到端评分（检索 + 重排序 + 大模型评估），依次执行以免请求合并影响结果"""
+    from app import service
+    from config import get_config
+    from rag_system import instrumentation
+
+    cfg = get_config()
+    fallbacks = _FallbackCounter()
+    samples = []
+    errors = 0
+    instrumentation.add_listener(fallbacks)
+    try:
+        with _use_benchmark_dataset(rag, path):
+            wall_start = time.perf_counter()
+            for job_title, requirements in corpus.sample_queries(args.score_queries, seed=args.seed + 1):
+                start = time.perf_counter()
+                try:
+                    service.score_from_dataset(job_title, requirements, args.top_k, cfg)
+                except Exception as e:  # noqa: BLE001
+                    errors += 1
+                    print(f"[bench] 评分失败: {e}", file=sys.stderr)
+                    continue
+                samples.append(time.perf_counter() - start)
+            wall_seconds = time.perf_counter() - wall_start
+    finally:
+        instrumentation.remove_listener(fallbacks)
+    summary = latency_summary(samples, wall_seconds)
+    summary["errors"] = errors
+    summary["fallbacks"] = fallbacks.counts
+    return summary
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=_ROOT, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def metadata() -> Dict[str, Any]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {key: os.environ[key] for key in _ENV_KEYS if key in os.environ},
+    }
+
+
+def _run_isolated(scale: str, argv: List[str]) -> Optional[Dict[str, Any]]:
+    """在子进程中运行单个规模，返回其结果"""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out_path = f.name
+    try:
+        cmd = [sys.executable, "-m", "benchmarks.run", *argv, "--scales", scale, "--no-isolate", "--output", out_path]
+        completed = subprocess.run(cmd, cwd=_ROOT)
+        if completed.returncode != 0:
+            print(f"[bench] 规模 {scale} 运行失败（退出码 {completed.returncode}）", file=sys.stderr)
+            return None
+        with open(out_path, encoding="utf-8") as f:
+            return json.load(f)["results"][0]
+    finally:
+        os.unlink(out_path)
+
+
+def _child_argv(args: argparse.Namespace) -> List[str]:
+    argv = [
+        "--queries", str(args.queries),
+        "--iterations", str(args.iterations),
+        "--warmup", str(args.warmup),
+        "--top-k", str(args.top_k),
+        "--retrieval-k", str(args.retrieval_k),
+        "--seed", str(args.seed),
+        "--data-dir", args.data_dir,
+        "--score-queries", str(args.score_queries),
+    ]
+    if args.score:
+        argv.append("--score")
+    if args.stub_llm:
+        argv += ["--stub-llm", args.stub_llm]
+    return argv
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="检索/评分管线基准测试")
+    parser.add_argument("--scales", default="1k", help="逗号分隔的规模，如 1k,100k,1m")
+    parser.add_argument("--queries", type=int, default=50, help="不同查询的数量")
+    parser.add_argument("--iterations", type=int, default=200, help="每种搜索模式的调用次数")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--retrieval-k", type=int, default=20, help="融合后的候选池大小（SimpleRAG 的 top_n）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=_DATA_DIR, help="合成数据集目录（生成后复用）")
+    parser.add_argument("--score", action="store_true", help="同时测量 score_from_dataset（会调用大模型）")
+    parser.add_argument("--score-queries", type=int, default=10)
+    parser.add_argument(
+        "--stub-llm", default=None, metavar="LATENCY",
+        help="启动本地模拟大模型服务代替真实服务，参数为延迟分布（如 lognormal:0.0,0.5），见 benchmarks.stub_llm",
+    )
+    parser.add_argument("--output", default=None, help="结果文件路径")
+    parser.add_argument("--no-isolate", action="store_true", help="所有规模在当前进程中运行")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, _ROOT)
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    results = []
+    with contextlib.ExitStack() as stack:
+        if args.stub_llm and args.no_isolate:
+            # SimpleRAG 在初始化时读取这些环境变量，必须在构建之前设置
+            from benchmarks.stub_llm import serve_in_thread
+
+            os.environ["Gemini_Base_Url"] = stack.enter_context(serve_in_thread(latency=args.stub_llm, seed=args.seed))
+            os.environ.setdefault("Gemini_Api_Key", "stub")
+            os.environ.setdefault("Gemini_Model_Name", "stub")
+        for scale in scales:
+            print(f"[bench] 规模 {scale} ...", file=sys.stderr)
+            if args.no_isolate:
+                results.append(bench_scale(scale, args))
+            else:
+                result = _run_isolated(scale, _child_argv(args))
+                if result is not None:
+                    results.append(result)
+
+    report = {"meta": metadata(), "results": results}
+    if args.stub_llm:
+        report["meta"]["stub_llm"] = args.stub_llm
+    output = args.output
+    if output is None:
+        os.makedirs(_RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(_RESULTS_DIR, f"{stamp}-{report['meta']['commit']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[bench] 结果已写入 {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+本地 OpenAI 兼容的模拟大模型服务，用于离线压测和测试。
+
+实现 /v1/chat/completions（含 stream=true 的 SSE 输出）与 /v1/models：
+- 延迟：首 token 延迟按 --latency 指定的分布采样，之后按 --tokens-per-second 逐步输出
+- 429 注入：按 --rate-429 的概率返回 429（带 Retry-After），或并发超过 --max-concurrency 时返回 429
+- 对评估提示词（SimpleRAG._build_prompt 的格式）返回确定性的 JSON 评估结果：
+  分数由岗位要求与简历的关键词重合度和候选人ID决定，同样的输入总是得到同样的输出
+
+用法：
+    python -m benchmarks.stub_llm --port 9000 --latency lognormal:0.0,0.5 --rate-429 0.02
+    export Gemini_Base_Url=http://127.0.0.1:9000/v1 Gemini_Api_Key=stub
+
+测试中可以直接在后台线程启动：
+    with serve_in_thread(latency="fixed:0.05") as base_url:
+        os.environ["Gemini_Base_Url"] = base_url
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_CANDIDATE_HEADER = re.compile(r"候选人(\d+) \(ID: ([^,]*), 类别: ([^)]*)\):")
+_WORD = re.compile(r"[A-Za-z][A-Za-z+#./-]*|[一-鿿]{2,}")
+_YEARS = re.compile(r"(\d+)\+? years")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    延迟分布（秒）：fixed:0.5、uniform:0.2,1.0、normal:0.8,0.2、lognormal:mu,sigma、exp:0.5
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+def _stable_int(*parts: str) -> int:
+    return int(hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _words(text: str) -> set:
+    return {word.lower() for word in _WORD.findall(text)}
+
+
+def evaluate_prompt(prompt: str) -> Optional[str]:
+    """评估提示词返回 JSON 数组文本；其他提示词返回 None"""
+    if "## 候选人信息：" not in prompt:
+        return None
+    head, _, body = prompt.partition("## 候选人信息：")
+    requirements = head.partition("## 岗位要求：")[2].strip()
+    body = body.partition("## 评估要求：")[0]
+    wanted = _words(requirements)
+
+    matches = list(_CANDIDATE_HEADER.finditer(body))
+    evaluations = []
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(body)
+        resume = body[match.end():end]
+        candidate_id, category = match.group(2).strip(), match.group(3).strip()
+        overlap = len(wanted & _words(resume)) / len(wanted) if wanted else 0.0
+        jitter = _stable_int(requirements, candidate_id) % 3
+        technical = min(10, round(overlap * 8) + jitter)
+        years = _YEARS.search(resume)
+        years_experience = int(years.group(1)) if years else _stable_int(candidate_id) % 10 + 1
+        experience = min(10, years_experience + jitter // 2)
+        skills_line = re.search(r"Skills: ([^;\n]*)", resume)
+        skills = skills_line.group(1) if skills_line else category
+        overall = round((technical * 0.6 + experience * 0.4), 1)
+        evaluations.append({
+            "candidate_id": f"候选人{match.group(1)}",
+            "technical_score": technical,
+            "experience_score": experience,
+            "overall_score": overall,
+            "years_experience": years_experience,
+            "skills": ",".join(skill.strip() for skill in skills.split(",")[:5]),
+            "strengths": f"{category} 方向经验，与岗位要求关键词重合 {overlap:.0%}",
+            "weaknesses": "部分岗位要求在简历中未体现" if overlap < 0.8 else "无明显不足",
+            "recommendation": "是" if overall >= 6 else "否",
+        })
+    return json.dumps(evaluations, ensure_ascii=False)
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def _tokens(text: str) -> int:
+    # 与 SimpleRAG._estimate_tokens 相同的估算方式
+    return max(1, len(text) // 4)
+
+
+def _rate_limited(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+        headers={"Retry-After": f"{retry_after:g}"},
+    )
+
+
+def create_app(
+    latency: str = "fixed:0.2",
+    tokens_per_second: float = 0.0,
+    rate_429: float = 0.0,
+    retry_after: float = 1.0,
+    max_concurrency: int = 0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """
+    latency 为首 token 延迟分布；tokens_per_second 为输出速度（0 表示一次性输出）；
+    rate_429 为随机返回 429 的概率；max_concurrency > 0 时超出并发的请求返回 429
+    """
+    app = FastAPI(title="Stub LLM")
+    sample_latency = parse_latency(latency)
+    rng = random.Random(seed)
+    stats = {"requests": 0, "rate_limited": 0, "in_flight": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    app.state.stats = stats
+
+    def reply_for(prompt: str) -> str:
+        return evaluate_prompt(prompt) or "pong"
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if (rate_429 and rng.random() < rate_429) or (max_concurrency and stats["in_flight"] >= max_concurrency):
+            stats["rate_limited"] += 1
+            return _rate_limited(retry_after)
+
+        prompt = _prompt_text(body.get("messages", []))
+        text = reply_for(prompt)
+        finish_reason = "stop"
+        if body.get("max_tokens") and len(text) > int(body["max_tokens"]) * 4:
+            # 与真实服务一致：按 max_tokens 截断输出
+            text = text[: int(body["max_tokens"]) * 4]
+            finish_reason = "length"
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(text)
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        model = body.get("model") or "stub"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        if body.get("stream"):
+            return StreamingResponse(
+                _stream(text, finish_reason, completion_id, created, model, usage, body),
+                media_type="text/event-stream",
+            )
+
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(sample_latency(rng))
+            if tokens_per_second > 0:
+                await asyncio.sleep(completion_tokens / tokens_per_second)
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    async def _stream(text, finish_reason, completion_id, created, model, usage, body) -> AsyncIterator[str]:
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(sample_latency(rng))
+            yield chunk({"role": "assistant", "content": ""})
+            # 每 4 个字符约一个 token
+            step = 4
+            delay = step / 4 / tokens_per_second if tokens_per_second > 0 else 0.0
+            for start in range(0, len(text), step):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk({"content": text[start:start + step]})
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            yield chunk({}, finish_reason, **({"usage": usage} if include_usage else {}))
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return app
+
+
+@contextmanager
+def serve_in_thread(host: str = "127.0.0.1", port: int = 0, **options: Any) -> Iterator[str]:
+    """在后台线程中启动模拟服务，产出 base_url（如 http://127.0.0.1:54321/v1），退出时关闭"""
+    import socket
+
+    if port == 0:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(**options), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="stub-llm", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("模拟大模型服务启动失败")
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="fixed:0.2", help="首 token 延迟分布，如 lognormal:0.0,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="输出速度，0 表示一次性输出")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="随机返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应中的 Retry-After 秒数")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="超过该并发时返回 429，0 表示不限制")
+    parser.add_argument("--seed", type=int, default=None, help="延迟与 429 注入的随机种子")
+    args = parser.parse_args(argv)
+    app = create_app(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+    print(f"[stub-llm] 运行在 http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
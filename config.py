@@ -1,6 +1,8 @@
+import json
+import math
 import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import Any, Dict, List
 
 
 @dataclass
@@ -24,12 +26,112 @@ class AgentConfig:
     max_input_tokens: int = 3000  # 添加最大输入token限制
     language: str = "zh"
 
+    # 流式评分：并发评估候选人的线程数
+    stream_max_workers: int = 4
+
+    # 评分接口准入控制：同时执行数、排队上限、单客户端上限、排队超时（秒）；
+    # 数量均为整个服务的总限额，多进程部署时平均分到每个工作进程（见 per_worker）
+    admission_max_concurrent: int = 32
+    admission_max_queue: int = 64
+    admission_max_per_client: int = 8
+    admission_queue_timeout: float = 30.0
+    # 检索接口（/api/search）单独的准入控制：同时执行数、排队上限、排队超时（秒），同样为服务总限额。
+    # 检索只占用计算线程池，不与评分请求（大部分时间在等待大模型）争用名额；
+    # 同时执行数应略大于 RAG_CPU_WORKERS × 工作进程数，超出的请求在这里排队或被拒绝，而不是堆积在线程池队列中
+    search_max_concurrent: int = 16
+    search_max_queue: int = 64
+    search_queue_timeout: float = 5.0
+    # 准入控制默认按已认证用户或来源地址区分客户端；前置网关认证后写入 X-Client-Id 时可设为 True 改用该头
+    trust_client_id_header: bool = False
+
+    # 多进程部署：工作进程数、每个进程的计算线程数（0 表示按核数平均分配）、
+    # 每个进程处理多少请求后平滑回收（0 表示不回收）、平滑关闭超时
+    web_workers: int = 1
+    worker_threads: int = 0
+    worker_max_requests: int = 0
+    worker_graceful_timeout: int = 30
+
+    # 异步接口中执行嵌入/检索/重排序的专用线程数
+    cpu_executor_workers: int = 4
+
+    # 回退评分：每次大模型调用评估的候选人数，以及并发批次数
+    fallback_batch_size: int = 4
+    fallback_max_workers: int = 4
+
+    # 异步评分任务：工作线程数、任务表（SQLite，多个工作进程共用）路径、任务租约时长（秒）；
+    # 执行任务的进程每隔租约的 1/3 续约一次，进程退出后租约过期的任务由其他进程重新执行；
+    # 运行中的任务最多每 job_progress_interval 秒写入一次已完成的评估（partial），任务结束时写入全部
+    job_workers: int = 2
+    job_db_path: str = "jobs.db"
+    job_lease_seconds: float = 60.0
+    job_progress_interval: float = 1.0
+
+    # 上传简历评分：每次大模型调用评估的简历数、同时进行的批次数、单次上传最多评分的简历数
+    upload_batch_size: int = 4
+    upload_max_concurrency: int = 4
+    upload_max_rows: int = 5000
+
+    # 评分结果分页：检索重排序后的完整名单在服务端缓存 TTL 秒（总大小上限 MB，为 0 时不分页），
+    # 下一页只评估名单中的下一段；名单长度为 0 时取检索候选池大小（不增加重排序开销）。
+    # 名单只缓存在进程内，多进程部署（WEB_WORKERS > 1）时不分页
+    ranked_cache_ttl_seconds: float = 600.0
+    ranked_cache_max_mb: float = 64.0
+    ranked_cache_depth: int = 0
+
+    # 请求追踪：Trace 导出文件（每行一个 OTLP/JSON 记录），为空时不导出
+    trace_export_path: str = ""
+
+    # 流量记录：把评分请求写入 JSONL 供压测回放（benchmarks.loadgen），为空时不记录；采样率为记录的比例
+    traffic_record_path: str = ""
+    traffic_record_sample_rate: float = 1.0
+
+    # 按需性能分析：开启后请求带 X-Profile: 1（或 ?profile=1）时分析该请求，并提供 /debug/profile、/debug/tracemalloc；
+    # 设置令牌后需在 X-Profile-Token 中提供；分析方式为 sampling（标准库，含线程池）、cprofile 或 pyinstrument
+    profiling_enabled: bool = False
+    profiling_token: str = ""
+    profiling_mode: str = "sampling"
+    profiling_interval_ms: float = 5.0
+    profiling_max_reports: int = 20
+
+    # 大模型调用限流（进程内共享）；0 表示不限制，llm_rate_limits 可按模型名覆盖。
+    # 速率、并发与排队上限均为整个服务的总限额，多进程部署时平均分到每个工作进程
+    # 例如 LLM_RATE_LIMITS='{"google/gemini-2.0-flash-exp:free": {"requests_per_minute": 10}}'
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+    # 同时在途的大模型调用数，默认与 admission_max_concurrent 相同：每个被放行的评分请求同一时间通常只有
+    # 一次大模型调用在途，上限低于放行数时多出的请求只能在限流器中排队，占着准入名额却无法推进。
+    # 服务商的配额由 requests/tokens_per_minute 控制，这里只防止突发的并发连接过多
+    llm_max_concurrency: int = 32
+    llm_max_queue: int = 500
+    llm_max_wait_seconds: float = 60.0
+    llm_rate_limits: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
     # 业务上下文
     job_description: str = "面向 AI 产品方向的简历初筛"
     scoring_dimensions: List[str] = field(
         default_factory=lambda: ["技术能力", "产品经验", "业务理解", "沟通协作"]
     )
 
+    def per_worker(self, total: float) -> int:
+        """把整个服务的限额平均分到每个工作进程（向上取整，至少为 1）；0 表示不限制，保持为 0"""
+        if total <= 0:
+            return 0
+        return max(1, math.ceil(total / max(1, self.web_workers)))
+
+    def rate_limits_for(self, model_name: str) -> Dict[str, Any]:
+        """某个模型在本工作进程中的限流参数（全局默认值 + 按模型覆盖，再按工作进程数平分）"""
+        limits: Dict[str, Any] = {
+            "requests_per_minute": self.llm_requests_per_minute,
+            "tokens_per_minute": self.llm_tokens_per_minute,
+            "max_concurrency": self.llm_max_concurrency,
+            "max_queue": self.llm_max_queue,
+            "max_wait": self.llm_max_wait_seconds,
+        }
+        limits.update(self.llm_rate_limits.get(model_name, {}))
+        for key in ("requests_per_minute", "tokens_per_minute", "max_concurrency", "max_queue"):
+            limits[key] = self.per_worker(limits[key])
+        return limits
+
 
 def get_config() -> AgentConfig:
     # 优先使用环境变量中的配置
@@ -42,6 +144,46 @@ def get_config() -> AgentConfig:
         qwen_model_name=os.getenv("Qwen_Model_name") or "qwen-max",
         qwen2_model_name=os.getenv("Qwen2_Model_Name") or "qwen2.5-72b-instruct",
         language=os.getenv("LANGUAGE") or "zh",
+        stream_max_workers=int(os.getenv("STREAM_MAX_WORKERS") or 4),
+        admission_max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT") or 32),
+        admission_max_queue=int(os.getenv("ADMISSION_MAX_QUEUE") or 64),
+        admission_max_per_client=int(os.getenv("ADMISSION_MAX_PER_CLIENT") or 8),
+        admission_queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT") or 30),
+        search_max_concurrent=int(os.getenv("SEARCH_MAX_CONCURRENT") or 16),
+        search_max_queue=int(os.getenv("SEARCH_MAX_QUEUE") or 64),
+        search_queue_timeout=float(os.getenv("SEARCH_QUEUE_TIMEOUT") or 5),
+        trust_client_id_header=(os.getenv("TRUST_CLIENT_ID_HEADER") or "").lower() in ("1", "true", "yes"),
+        web_workers=int(os.getenv("WEB_WORKERS") or 1),
+        worker_threads=int(os.getenv("WORKER_THREADS") or 0),
+        worker_max_requests=int(os.getenv("WORKER_MAX_REQUESTS") or 0),
+        worker_graceful_timeout=int(os.getenv("WORKER_GRACEFUL_TIMEOUT") or 30),
+        cpu_executor_workers=int(os.getenv("RAG_CPU_WORKERS") or 4),
+        fallback_batch_size=int(os.getenv("FALLBACK_BATCH_SIZE") or 4),
+        fallback_max_workers=int(os.getenv("FALLBACK_MAX_WORKERS") or 4),
+        job_workers=int(os.getenv("JOB_WORKERS") or 2),
+        job_db_path=os.getenv("JOB_DB_PATH") or "jobs.db",
+        job_lease_seconds=float(os.getenv("JOB_LEASE_SECONDS") or 60),
+        job_progress_interval=float(os.getenv("JOB_PROGRESS_INTERVAL") or 1),
+        upload_batch_size=int(os.getenv("UPLOAD_BATCH_SIZE") or 4),
+        upload_max_concurrency=int(os.getenv("UPLOAD_MAX_CONCURRENCY") or 4),
+        upload_max_rows=int(os.getenv("UPLOAD_MAX_ROWS") or 5000),
+        ranked_cache_ttl_seconds=float(os.getenv("RANKED_CACHE_TTL_SECONDS") or 600),
+        ranked_cache_max_mb=float(os.getenv("RANKED_CACHE_MAX_MB") or 64),
+        ranked_cache_depth=int(os.getenv("RANKED_CACHE_DEPTH") or 0),
+        trace_export_path=os.getenv("TRACE_EXPORT_PATH") or "",
+        traffic_record_path=os.getenv("TRAFFIC_RECORD_PATH") or "",
+        traffic_record_sample_rate=float(os.getenv("TRAFFIC_RECORD_SAMPLE_RATE") or 1.0),
+        profiling_enabled=(os.getenv("PROFILING_ENABLED") or "").lower() in ("1", "true", "yes"),
+        profiling_token=os.getenv("PROFILING_TOKEN") or "",
+        profiling_mode=os.getenv("PROFILING_MODE") or "sampling",
+        profiling_interval_ms=float(os.getenv("PROFILING_INTERVAL_MS") or 5.0),
+        profiling_max_reports=int(os.getenv("PROFILING_MAX_REPORTS") or 20),
+        llm_requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE") or 0),
+        llm_tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE") or 0),
+        llm_max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY") or 32),
+        llm_max_queue=int(os.getenv("LLM_MAX_QUEUE") or 500),
+        llm_max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS") or 60),
+        llm_rate_limits=json.loads(os.getenv("LLM_RATE_LIMITS") or "{}"),
     )
     
     # 记录关键配置供调试
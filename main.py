@@ -15,6 +15,11 @@ def main():
     """启动后端和前端服务"""
     print("启动简历筛选助手...")
     
+    # 多进程模式需要在主线程中管理工作进程和信号
+    if int(os.getenv("WEB_WORKERS") or 1) > 1:
+        run_backend()
+        return
+
     # 启动后端服务
     backend_thread = threading.Thread(target=run_backend)
     backend_thread.daemon = True
@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    动态微批处理：把并发调用方提交的小任务在一个很短的时间窗口内攒成一批，
+    执行一次批量前向计算，再把结果按调用方切分返回。
+
+    一批在累计 max_batch_size 条或等待超过 max_latency_ms 后立即执行；
+    调用方已取消的请求在执行前被丢弃。
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_latency_ms: float = 5.0,
+        name: str = "batch",
+    ):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency = max(0.0, max_latency_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[Tuple[List[Any], Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        # 统计信息
+        self._batches = 0
+        self._requests = 0
+        self._items = 0
+        self._max_batch = 0
+        self._busy_seconds = 0.0
+        self._cancelled = 0
+
+    def _ensure_worker(self) -> None:
+        # fork 之后子进程中没有父进程的线程，需要按进程重新启动
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+            self._worker.start()
+
+    def submit_many(self, items: List[Any]) -> Future:
+        """提交一组输入，返回的 Future 结果为与输入一一对应的输出列表"""
+        future: Future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        self._ensure_worker()
+        self._queue.put((list(items), future))
+        return future
+
+    def submit(self, item: Any) -> Future:
+        """提交单个输入，返回的 Future 结果为单个输出"""
+        inner = self.submit_many([item])
+        outer: Future = Future()
+
+        def _done(f: Future) -> None:
+            if f.cancelled():
+                outer.cancel()
+            elif f.exception() is not None:
+                outer.set_exception(f.exception())
+            else:
+                outer.set_result(f.result()[0])
+
+        inner.add_done_callback(_done)
+        # 调用方撤回时同时撤回批处理队列中的请求
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        return outer
+
+    def map(self, items: List[Any]) -> List[Any]:
+        """阻塞地批量处理一组输入"""
+        return self.submit_many(items).result()
+
+    def _collect(self) -> List[Tuple[List[Any], Future]]:
+        first = self._queue.get()
+        pending = [first]
+        count = len(first[0])
+        deadline = time.monotonic() + self.max_latency
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(request)
+            count += len(request[0])
+        return pending
+
+    def _loop(self) -> None:
+        while True:
+            pending = self._collect()
+            # 丢弃已被调用方取消的请求
+            active = []
+            for items, future in pending:
+                if future.set_running_or_notify_cancel():
+                    active.append((items, future))
+                else:
+                    with self._lock:
+                        self._cancelled += 1
+            if not active:
+                continue
+
+            flat = [item for items, _ in active for item in items]
+            start = time.monotonic()
+            try:
+                outputs = list(self.fn(flat))
+            except Exception as e:  # noqa: BLE001
+                for _, future in active:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self._batches += 1
+                    self._requests += len(active)
+                    self._items += len(flat)
+                    self._max_batch = max(self._max_batch, len(flat))
+                    self._busy_seconds += time.monotonic() - start
+
+            offset = 0
+            for items, future in active:
+                future.set_result(outputs[offset:offset + len(items)])
+                offset += len(items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_latency_ms": self.max_latency * 1000.0,
+                "batches_total": self._batches,
+                "requests_total": self._requests,
+                "items_total": self._items,
+                "cancelled_total": self._cancelled,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_seen": self._max_batch,
+                "busy_seconds_total": round(self._busy_seconds, 3),
+                "items_per_busy_second": round(self._items / self._busy_seconds, 1) if self._busy_seconds else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
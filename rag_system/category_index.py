@@ -0,0 +1,137 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryPositions:
+    """
+    各类别文档的位置（类别内升序）。
+
+    select 按类别组合缓存合并后的位置（最近使用的 cache_size 个组合），
+    同一组类别的重复查询不再每次拼接、排序全部所选文档的位置。
+    """
+
+    def __init__(self, positions: Dict[str, np.ndarray], cache_size: int = 64):
+        self.positions = positions
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, ...], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_labels(cls, labels: Sequence[str]) -> "CategoryPositions":
+        groups: Dict[str, List[int]] = {}
+        for position, label in enumerate(labels):
+            groups.setdefault(label, []).append(position)
+        return cls({label: np.asarray(positions, dtype=np.int64) for label, positions in groups.items()})
+
+    def labels(self, categories: Iterable[str]) -> Tuple[str, ...]:
+        """所选类别中存在的类别（去重、排序）"""
+        return tuple(sorted(label for label in set(categories) if label in self.positions))
+
+    def select(self, categories: Iterable[str]) -> np.ndarray:
+        """所选类别的文档位置，按 labels 的顺序逐个类别排列（类别内升序）；不存在的类别忽略"""
+        key = self.labels(categories)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        if not key:
+            selected = np.zeros(0, dtype=np.int64)
+        elif len(key) == 1:
+            selected = self.positions[key[0]]
+        else:
+            selected = np.concatenate([self.positions[label] for label in key])
+        with self._lock:
+            self._cache[key] = selected
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return selected
+
+
+class CategoryIndex:
+    """
+    按类别划分的向量检索。
+
+    默认在主索引上用 FAISS 的 ID 选择器过滤。build_subindexes 为 True 且主索引为扁平索引时，
+    另为每个类别建一个只含该类别向量的扁平子索引，过滤检索只扫描所选类别的向量，
+    代价是再占用一份与主索引相同大小的向量内存（见 subindex_bytes）。
+    下标均为文档在主索引中的位置（与 SimpleRAG.documents 的顺序一致）。
+    """
+
+    def __init__(self, labels: Sequence[str], index=None, build_subindexes: bool = False):
+        self.category_positions = CategoryPositions.from_labels(labels)
+        self.positions: Dict[str, np.ndarray] = self.category_positions.positions
+        self.index = index
+        self.subindexes: Dict[str, object] = {}
+        if index is not None and build_subindexes:
+            self.subindexes = self._build_subindexes(index, len(labels))
+
+    def _build_subindexes(self, index, count: int) -> Dict[str, object]:
+        import faiss
+
+        if not isinstance(index, faiss.IndexFlat) or index.ntotal != count:
+            return {}
+        vectors = index.reconstruct_n(0, index.ntotal)
+        subindexes = {}
+        for label, positions in self.positions.items():
+            subindex = faiss.IndexFlat(index.d, index.metric_type)
+            subindex.add(vectors[positions])
+            subindexes[label] = subindex
+        logger.debug("按类别建立向量子索引: %d 个类别", len(subindexes))
+        return subindexes
+
+    @property
+    def subindex_bytes(self) -> int:
+        return sum(subindex.ntotal * subindex.code_size for subindex in self.subindexes.values())
+
+    def positions_for(self, categories: Iterable[str]) -> np.ndarray:
+        """所选类别的文档位置（逐个类别排列）；不存在的类别忽略"""
+        return self.category_positions.select(categories)
+
+    def search(self, vectors: np.ndarray, k: int, categories: Sequence[str]) -> Optional[List[np.ndarray]]:
+        """
+        在所选类别中检索，返回每个查询向量的前 k 个文档位置（按相似度从高到低）；
+        无法按类别检索时（无子索引且 FAISS 不支持 ID 选择器）返回 None，由调用方退回到检索后过滤
+        """
+        labels = list(self.category_positions.labels(categories))
+        if not labels:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(vectors))]
+        if all(label in self.subindexes for label in labels):
+            return self._search_subindexes(vectors, k, labels)
+        return self._search_selected(vectors, k, labels)
+
+    def _search_subindexes(self, vectors: np.ndarray, k: int, labels: List[str]) -> List[np.ndarray]:
+        import faiss
+
+        distances, positions = [], []
+        for label in labels:
+            subindex = self.subindexes[label]
+            sub_distances, local = subindex.search(vectors, min(k, subindex.ntotal))
+            distances.append(sub_distances)
+            positions.append(np.where(local >= 0, self.positions[label][np.maximum(local, 0)], -1))
+        distances = np.concatenate(distances, axis=1)
+        positions = np.concatenate(positions, axis=1)
+        # 内积越大越相似，L2 距离越小越相似
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances = -distances
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        merged = np.take_along_axis(positions, order, axis=1)
+        return [row[row >= 0] for row in merged]
+
+    def _search_selected(self, vectors: np.ndarray, k: int, labels: List[str]) -> Optional[List[np.ndarray]]:
+        import faiss
+
+        try:
+            selector = faiss.IDSelectorBatch(self.positions_for(labels))
+            params_type = faiss.SearchParametersIVF if isinstance(self.index, faiss.IndexIVF) else faiss.SearchParameters
+            _, positions = self.index.search(vectors, k, params=params_type(sel=selector))
+        except (AttributeError, TypeError, RuntimeError) as e:
+            logger.debug("FAISS 不支持按 ID 过滤检索: %s", e)
+            return None
+        return [row[row >= 0] for row in positions]
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，大模型调用被直接跳过"""
+
+    # 熔断前已检索重排序好的候选人（由 SimpleRAG.score_ranked 附上），调用方据此返回检索结果而不必重新检索
+    ranked: Optional[List[Dict[str, Any]]] = None
+
+
+class CircuitBreaker:
+    """
+    大模型服务的熔断器。
+
+    连续失败 failure_threshold 次后打开，此后的调用立即抛出 CircuitOpenError；
+    打开期间由后台线程每隔 probe_interval 秒调用一次 probe，探测成功后自动关闭。
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        probe_interval: float = 15.0,
+        probe: Optional[Callable[[], Any]] = None,
+        name: str = "llm",
+    ):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._prober: Optional[threading.Thread] = None
+        # 统计信息
+        self._opened_total = 0
+        self._rejected_total = 0
+        self._last_error = ""
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """关闭状态才放行；打开/半开状态由后台探测负责恢复"""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            self._rejected_total += 1
+        self._ensure_prober()
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._state = STATE_CLOSED
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._last_error = repr(error)[:200]
+            if self._state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._opened_total += 1
+                logger.warning(
+                    "[熔断器] %s 连续失败 %d 次，已打开: %s", self.name, self._consecutive_failures, self._last_error
+                )
+        self._ensure_prober()
+
+    def _ensure_prober(self) -> None:
+        with self._lock:
+            if self._state == STATE_CLOSED or self.probe is None:
+                return
+            if self._prober is not None and self._prober.is_alive():
+                return
+            self._prober = threading.Thread(target=self._probe_loop, name=f"{self.name}-breaker-probe", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self._state == STATE_CLOSED:
+                    return
+                self._state = STATE_HALF_OPEN
+            try:
+                self.probe()
+            except Exception as e:  # noqa: BLE001
+                with self._lock:
+                    self._state = STATE_OPEN
+                    self._last_error = repr(e)[:200]
+                continue
+            self.record_success()
+            logger.info("[熔断器] %s 探测成功，已恢复", self.name)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "opened_total": self._opened_total,
+                "rejected_total": self._rejected_total,
+                "open_for_seconds": round(time.monotonic() - self._opened_at, 3) if self._state != STATE_CLOSED else 0.0,
+                "last_error": self._last_error,
+            }
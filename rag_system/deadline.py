@@ -0,0 +1,153 @@
+import functools
+import math
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+from typing import Any, Callable, Dict, List, Optional
+
+# 可降级的阶段
+STAGE_RERANK_DEPTH = "rerank_depth"  # 只对融合排名靠前的部分候选人重排序
+STAGE_RERANK = "rerank"  # 跳过重排序，直接按融合排名返回
+STAGE_LLM = "llm"  # 跳过大模型评估，仅返回检索重排序结果
+
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足以完成当前阶段"""
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（客户端断开连接或显式取消），后续阶段不再执行"""
+
+
+class StageLatency:
+    """各阶段耗时的指数滑动平均，用于判断剩余时间是否足够执行某个阶段"""
+
+    def __init__(self, defaults: Dict[str, float], alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._estimates: Dict[str, float] = dict(defaults)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            previous = self._estimates.get(stage)
+            if previous is None:
+                self._estimates[stage] = seconds
+            else:
+                self._estimates[stage] = (1 - self.alpha) * previous + self.alpha * seconds
+
+    def estimate(self, stage: str) -> float:
+        with self._lock:
+            return self._estimates.get(stage, 0.0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds, 4) for stage, seconds in self._estimates.items()}
+
+
+# 进程内共享的阶段耗时估计（初始值为经验值，运行后按实际耗时更新）
+stage_latency = StageLatency(defaults={
+    "retrieval": 0.1,  # 查询嵌入 + 向量检索 + BM25 + 融合
+    "rerank_per_pair": 0.01,  # 交叉编码器每个（查询, 文档）对
+    # 大模型评估每个候选人（一次调用评估一批候选人，输出随人数增长，按人数折算）
+    "llm_per_candidate": 2.0,
+})
+
+
+class Deadline:
+    """
+    单个请求的时间预算与取消信号。
+
+    各阶段在开始前检查剩余时间，不足时降级执行并记录到 degraded；
+    reserved 为需要留给后续阶段（大模型评估）的时间，检索/重排序只能使用其余部分。
+    budget_ms 为空时不限时，只用于传递取消：cancel() 之后各阶段在下一个检查点抛出 RequestCancelled，
+    尚未执行的批处理请求也会被撤回。
+    """
+
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0 if budget_ms else math.inf
+        self.reserved = 0.0
+        self.degraded: List[str] = []
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._on_cancel: List[Callable[[], Any]] = []
+
+    @classmethod
+    def from_ms(cls, budget_ms: Optional[float]) -> "Deadline":
+        """未设置预算时返回不限时的 Deadline（仍可取消）"""
+        return cls(budget_ms if budget_ms and budget_ms > 0 else None)
+
+    @property
+    def limited(self) -> bool:
+        return self.budget_ms is not None
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def available(self) -> float:
+        """当前阶段可用的时间（扣除为后续阶段预留的部分）"""
+        return max(0.0, self.remaining() - self.reserved)
+
+    def affords(self, stage: str, count: int = 1) -> bool:
+        """剩余时间是否足够执行该阶段（按历史平均耗时估计；count 为按单位计时的阶段的数量，如候选人数）"""
+        return self.remaining() >= stage_latency.estimate(stage) * count
+
+    def degrade(self, *stages: str) -> None:
+        with self._lock:
+            for stage in stages:
+                if stage not in self.degraded:
+                    self.degraded.append(stage)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        注册取消时的回调；已取消时立即执行。
+        返回注销函数，回调不再需要时（如等待的任务已完成）调用，避免长时间运行的请求不断累积回调
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._on_cancel.append(callback)
+                return functools.partial(self._remove_callback, callback)
+        callback()
+        return _noop
+
+    def _remove_callback(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            try:
+                self._on_cancel.remove(callback)
+            except ValueError:
+                pass
+
+    def check(self) -> None:
+        """阶段之间的检查点"""
+        if self._cancelled:
+            raise RequestCancelled("请求已取消")
+
+    def wait(self, future: Future) -> Any:
+        """等待批处理/线程池的结果；请求被取消时撤回尚未执行的任务并抛出 RequestCancelled"""
+        unregister = self.on_cancel(future.cancel)
+        try:
+            return future.result()
+        except CancelledError:
+            raise RequestCancelled("请求已取消") from None
+        finally:
+            unregister()
+
+
+def _noop() -> None:
+    pass
@@ -0,0 +1,75 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+
+# 各阶段名称
+STAGE_QUERY_EMBEDDING = "query_embedding"
+STAGE_DENSE_SEARCH = "dense_search"
+STAGE_BM25 = "bm25"
+STAGE_FUSION = "fusion"
+STAGE_RERANK = "rerank"
+STAGE_PROMPT_BUILD = "prompt_build"
+STAGE_LLM_CALL = "llm_call"
+STAGE_JSON_PARSE = "json_parse"
+
+# 当前请求的路由（由 Web 层设置），作为指标标签
+_route: contextvars.ContextVar[str] = contextvars.ContextVar("rag_route", default="")
+
+_listeners: List[Any] = []
+
+
+def set_route(route: str) -> contextvars.Token:
+    return _route.set(route)
+
+
+def reset_route(token: contextvars.Token) -> None:
+    _route.reset(token)
+
+
+def current_route() -> str:
+    return _route.get()
+
+
+def add_listener(listener: Any) -> None:
+    """
+    注册观察者。listener 可实现以下任意方法：
+    - on_stage(stage, seconds, route)：一个阶段结束
+    - on_event(name, amount, route, labels)：计数事件（缓存命中、token 用量、429、回退等）
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Any) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录一个阶段的耗时（无论成功与否）并通知观察者"""
+    if not _listeners:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        route = _route.get()
+        for listener in _listeners:
+            handler = getattr(listener, "on_stage", None)
+            if handler is not None:
+                handler(name, seconds, route)
+
+
+def event(name: str, amount: float = 1, **labels: Optional[str]) -> None:
+    """记录一个计数事件"""
+    if not _listeners or not amount:
+        return
+    route = _route.get()
+    for listener in _listeners:
+        handler = getattr(listener, "on_event", None)
+        if handler is not None:
+            handler(name, amount, route, labels)
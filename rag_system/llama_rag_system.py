@@ -2,11 +2,19 @@ import warnings
 from plistlib import loads
 
 import pandas as pd
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 import os
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
-from langchain_classic.retrievers import EnsembleRetriever, ContextualCompressionRetriever
+from langchain_classic.retrievers import ContextualCompressionRetriever
 from langchain_classic.retrievers.document_compressors import LLMChainExtractor
 from langchain_community.vectorstores import FAISS
 from llama_index.core.indices import vector_store
@@ -29,45 +37,159 @@ from llama_index.core.schema import NodeWithScore, TextNode
 from sentence_transformers import CrossEncoder
 import numpy as np
 
+# 大模型调用限流
+from rag_system.rate_limiter import (
+    RateLimiter,
+    RateLimitExceeded,
+    get_rate_limiter,
+    is_rate_limit_error,
+    retry_after_seconds,
+)
+from rag_system.circuit_breaker import CircuitBreaker, CircuitOpenError
+from rag_system.batching import MicroBatcher
+from rag_system.bm25_postings import BM25Postings
+from rag_system.category_index import CategoryIndex
+from rag_system import instrumentation, tracing
+from rag_system.instrumentation import (
+    STAGE_BM25,
+    STAGE_DENSE_SEARCH,
+    STAGE_FUSION,
+    STAGE_JSON_PARSE,
+    STAGE_LLM_CALL,
+    STAGE_PROMPT_BUILD,
+    STAGE_QUERY_EMBEDDING,
+    stage,
+)
+from rag_system.deadline import (
+    STAGE_LLM,
+    STAGE_RERANK,
+    STAGE_RERANK_DEPTH,
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+    stage_latency,
+)
+from rag_system.logging_utils import log_payload
+
 # 忽略一些警告
 warnings.filterwarnings("ignore")
 
+logger = logging.getLogger(__name__)
+
+# 无法在索引内按类别过滤时（如 BM25 不是 BM25Okapi），每路检索多取的倍数（取回后丢弃其他类别的文档）
+_CATEGORY_FETCH_FACTOR = 5
+
+
+def _filter_categories(docs: List[Any], categories: Optional[List[str]], k: int) -> List[Any]:
+    """检索后按类别过滤，保留前 k 个"""
+    if not categories:
+        return docs[:k]
+    wanted = set(categories)
+    return [doc for doc in docs if _category_of(doc) in wanted][:k]
+
+
+def _category_of(doc: Any) -> str:
+    return str(doc.metadata.get("category", "Unknown"))
 
 
 class SimpleRAG:
     #初始化
-    def __init__(self, csv_file_path: str, top_n: int = 20):
+    def __init__(
+        self,
+        csv_file_path: str,
+        top_n: int = 20,
+        rate_limiter: Optional[RateLimiter] = None,
+        cpu_workers: Optional[int] = None,
+    ):
         """
         初始化简化的RAG系统（完全使用LangChain）
+
+        rate_limiter 为空时使用按模型名共享的进程级限流器；
+        cpu_workers 为异步接口中执行嵌入/检索/重排序的专用线程数（默认读取 RAG_CPU_WORKERS）
         """
         self.csv_file_path = csv_file_path
         self.top_n = top_n
         self.documents = []
+        self.dataset_version = ""
         self.retriever = None
+        self.vectorstore = None
+        self.bm25_retriever = None
+        self.bm25_postings: Optional[BM25Postings] = None
+        self.category_index: Optional[CategoryIndex] = None
+        self.retrieval_k = top_n
+        self.retrieval_weights = [0.6, 0.4]  # 向量检索、BM25 在融合中的权重
         self.cross_encoder = None
+        self.rerank_model_name = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+        self.embed_batcher: Optional[MicroBatcher] = None
+        self.rerank_batcher: Optional[MicroBatcher] = None
 
         # 获取API配置
         self.api_key = os.getenv("Gemini_Api_Key")
         self.base_url = os.getenv("Gemini_Base_Url")
         self.model_name =os.getenv("Gemini_Model_Name") 
 
+        # 所有大模型调用都经过同一个限流器；429 时由限流器统一退避后重试
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.model_name)
+        self.max_output_tokens = int(os.getenv("LLM_MAX_OUTPUT_TOKENS") or 512)
+        self.rate_limit_retries = int(os.getenv("LLM_RATE_LIMIT_RETRIES") or 2)
+
+        # 异步接口中 CPU 密集的嵌入/检索/重排序放到专用线程池，不占用事件循环和默认线程池
+        self.cpu_workers = cpu_workers or int(os.getenv("RAG_CPU_WORKERS") or 4)
+        self._cpu_executor: Optional[ThreadPoolExecutor] = None
+        self._cpu_executor_lock = threading.Lock()
+
+        # 大模型服务熔断：连续失败后直接跳过大模型，后台探测恢复
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD") or 5),
+            probe_interval=float(os.getenv("LLM_BREAKER_PROBE_INTERVAL") or 15),
+            probe=self._probe_llm,
+        )
+
+        # 预热状态：第一次搜索的耗时（包含模型首次推理的额外开销）与累计搜索次数
+        self._search_stats_lock = threading.Lock()
+        self.searches_total = 0
+        self.first_search: Optional[Dict[str, float]] = None
+
         if not self.api_key:
-            print("警告: 未找到API Key，将使用本地模型")
-            print("请设置 OPENAI_API_KEY 环境变量或通过 .env 文件设置")
-            print("示例: OPENAI_API_KEY=sk-your-key-here")
-
-        # 初始化组件
-        self._init_components()
-        self._load_data()
-        self._build_retriever()
+            logger.warning("未找到API Key，将使用本地模型；请设置 OPENAI_API_KEY 环境变量或通过 .env 文件设置")
+
+        # 初始化组件（记录各步骤耗时，供基准测试和运行状态查询）
+        self.load_times: Dict[str, float] = {}
+        for name, step in (
+            ("init_components", self._init_components),
+            ("load_data", self._load_data),
+            ("build_retriever", self._build_retriever),
+        ):
+            start = time.perf_counter()
+            step()
+            self.load_times[name] = round(time.perf_counter() - start, 3)
         
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        批量计算查询嵌入，与 embed_query 的结果一致。
+        部分嵌入模型对查询使用单独的编码参数或指令前缀（与 embed_documents 不同），
+        HuggingFaceEmbeddings 设置了查询编码参数时按其批量编码，其他模型逐条调用 embed_query
+        """
+        embed = getattr(self.embeddings, "_embed", None)
+        query_kwargs = getattr(self.embeddings, "query_encode_kwargs", None)
+        if callable(embed) and query_kwargs is not None:
+            return embed(queries, query_kwargs or self.embeddings.encode_kwargs)
+        if type(self.embeddings).embed_query is HuggingFaceEmbeddings.embed_query:
+            # 该版本的 embed_query 即 embed_documents 的单条版本
+            return self.embeddings.embed_documents(queries)
+        return [self.embeddings.embed_query(query) for query in queries]
+
     def _init_components(self):
         """初始化必要的组件"""
         try:
             # 初始化LLM
             llm_kwargs = {
                 "temperature": 0.1,
-                "model_name": self.model_name
+                "model_name": self.model_name,
+                # 关闭客户端自带的429重试，统一交给共享限流器退避
+                "max_retries": int(os.getenv("LLM_CLIENT_MAX_RETRIES") or 0),
+                # 单次调用超时，避免服务商无响应时请求被无限期挂起
+                "timeout": float(os.getenv("LLM_TIMEOUT_SECONDS") or 60),
             }
 
             if self.api_key:
@@ -81,11 +203,9 @@ class SimpleRAG:
             hf_model = os.getenv("HF_EMBEDDING_MODEL") or "sentence-transformers/all-MiniLM-L6-v2"
             try:
                 self.embeddings = HuggingFaceEmbeddings(model_name=hf_model)
-                print(f"[embedding] 使用 HuggingFace 模型: {hf_model}")
+                logger.info("[embedding] 使用 HuggingFace 模型: %s", hf_model)
             except Exception as hf_exc:
-                import traceback
-                print(f"[embedding] HuggingFaceEmbeddings 初始化失败: {repr(hf_exc)}")
-                traceback.print_exc()
+                logger.error("[embedding] HuggingFaceEmbeddings 初始化失败: %r", hf_exc, exc_info=True)
                 # 可选远端回退：仅当显式开启 USE_REMOTE_EMBEDDING
                 use_remote = (os.getenv("USE_REMOTE_EMBEDDING") or "").lower() == "true"
                 if not use_remote:
@@ -98,33 +218,55 @@ class SimpleRAG:
                         if self.base_url:
                             embedding_kwargs["openai_api_base"] = self.base_url
                     self.embeddings = OpenAIEmbeddings(**embedding_kwargs)
-                    print(f"[embedding] 回退使用远端嵌入模型: {embedding_model}")
+                    logger.warning("[embedding] 回退使用远端嵌入模型: %s", embedding_model)
                 except Exception as embed_exc:
-                    print(f"[embedding] 远端嵌入初始化仍失败: {repr(embed_exc)}")
-                    traceback.print_exc()
+                    logger.error("[embedding] 远端嵌入初始化仍失败: %r", embed_exc, exc_info=True)
                     raise
                 
             # 尝试初始化交叉编码器（可选）
             try:
-                self.cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-                print("交叉编码器初始化成功")
+                self.cross_encoder = CrossEncoder(self.rerank_model_name)
+                logger.info("交叉编码器初始化成功: %s", self.rerank_model_name)
             except Exception as e:
-                print(f"交叉编码器初始化失败，将不使用重排序: {e}")
+                logger.warning("交叉编码器初始化失败，将不使用重排序: %s", e)
                 self.cross_encoder = None
 
+            # 并发请求的查询嵌入和重排序在短时间窗口内合并为一次批量前向计算
+            max_latency_ms = float(os.getenv("RAG_BATCH_MAX_LATENCY_MS") or 5)
+            self.embed_batcher = MicroBatcher(
+                self._embed_queries,
+                max_batch_size=int(os.getenv("RAG_EMBED_BATCH_SIZE") or 32),
+                max_latency_ms=max_latency_ms,
+                name="embed",
+            )
+            if self.cross_encoder is not None:
+                self.rerank_batcher = MicroBatcher(
+                    lambda pairs: [float(score) for score in self.cross_encoder.predict(pairs)],
+                    max_batch_size=int(os.getenv("RAG_RERANK_BATCH_SIZE") or 128),
+                    max_latency_ms=max_latency_ms,
+                    name="rerank",
+                )
+
         except Exception as e:
-            print(f"初始化组件失败: {e}")
+            logger.error("初始化组件失败: %s", e)
             raise
             
     #从csv数据中加载
     def _load_data(self):
         """加载CSV数据 - 按行进行chunk和embedding"""
-        print(f"正在加载数据: {self.csv_file_path}")
+        logger.info("正在加载数据: %s", self.csv_file_path)
 
         try:
+            # 数据集版本：文件内容的哈希，数据更新后缓存/请求合并的 key 随之变化
+            digest = hashlib.sha1()
+            with open(self.csv_file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self.dataset_version = digest.hexdigest()[:12]
+
             # 读取CSV文件
             df = pd.read_csv(self.csv_file_path)
-            print(f"成功读取 {len(df)} 行数据（每个人对应一行）")
+            logger.info("成功读取 %d 行数据（每个人对应一行）", len(df))
 
             # 转换为文档格式 - 每行对应一个文档
             from langchain_core.documents import Document
@@ -153,88 +295,408 @@ class SimpleRAG:
                 )
                 documents.append(doc)
                 
-                # 打印每个文档的信息
-                if idx < 5:  # 只打印前5个作为示例
-                    print(f"文档 {idx}: 类别={row.get('Category', 'Unknown')}, 内容长度={len(content)}")
+                # 记录前5个文档的信息作为示例
+                if idx < 5:
+                    logger.debug("文档 %s: 类别=%s, 内容长度=%d", idx, row.get('Category', 'Unknown'), len(content))
 
             self.documents = documents
-            print(f"成功创建 {len(self.documents)} 个文档（每个人对应一个文档）")
-            print(f"文档元数据示例: {documents[0].metadata if documents else '无文档'}")
+            logger.info("成功创建 %d 个文档（每个人对应一个文档）", len(self.documents))
+            logger.debug("文档元数据示例: %s", documents[0].metadata if documents else "无文档")
 
         except Exception as e:
-            print(f"加载数据失败: {e}")
+            logger.error("加载数据失败: %s", e)
             raise
             
     #建好检索器
     def _build_retriever(self):
         """构建检索器 - 按行进行embedding"""
-        print("正在构建检索器...")
+        logger.info("正在构建检索器...")
 
         try:
             if not self.documents:
                 raise ValueError("没有加载文档数据")
 
-            print(f"文档数量: {len(self.documents)}")
-            print(f"第一个文档内容预览: {self.documents[0].page_content[:200]}...")
-            print(f"第一个文档元数据: {self.documents[0].metadata}")
+            logger.info("文档数量: %d", len(self.documents))
+            logger.debug("第一个文档内容预览: %s...", self.documents[0].page_content[:200])
+            logger.debug("第一个文档元数据: %s", self.documents[0].metadata)
 
             # 为混合检索准备统一的k，至少为1
             k = max(1, min(self.top_n, len(self.documents)))
 
             # 1. 构建向量检索器 - 每个文档独立embedding
-            print("正在构建向量索引（按行embedding）...")
+            logger.info("正在构建向量索引（按行embedding）...")
             vectorstore = FAISS.from_documents(
                 documents=self.documents,
                 embedding=self.embeddings
             )
-            vector_retriever = vectorstore.as_retriever(
-                search_kwargs={"k": k}
-            )
-            print("向量索引构建完成")
+            self.vectorstore = vectorstore
+            logger.info("向量索引构建完成")
+
+            # 按类别过滤的向量检索：默认用 ID 选择器在主索引上过滤；RAG_CATEGORY_SUBINDEX=1 时另建
+            # 按类别划分的扁平子索引（再占用一份向量内存，见 /api/system）。
+            # 失败时按类别过滤退回到检索后过滤，不影响向量检索本身
+            try:
+                self.category_index = CategoryIndex(
+                    [_category_of(doc) for doc in self.documents],
+                    vectorstore.index,
+                    build_subindexes=(os.getenv("RAG_CATEGORY_SUBINDEX") or "0") == "1",
+                )
+                logger.info("类别索引构建完成: %d 个类别", len(self.category_index.positions))
+            except Exception as e:
+                logger.warning("构建类别索引失败: %s", e)
+                self.category_index = None
 
             # 2. 构建BM25检索器 - 每个文档独立索引
-            print("正在构建BM25检索器（按行索引）...")
+            logger.info("正在构建BM25检索器（按行索引）...")
             bm25_retriever = BM25Retriever.from_documents(
                 self.documents
             )
             bm25_retriever.k = k
-            print("BM25检索器构建完成")
-
-            # 3. 组合检索器
-            self.retriever = EnsembleRetriever(
-                retrievers=[vector_retriever, bm25_retriever],
-                weights=[0.6, 0.4]
+            self.bm25_retriever = bm25_retriever
+            self.bm25_postings = BM25Postings.from_vectorizer(
+                bm25_retriever.vectorizer, [_category_of(doc) for doc in bm25_retriever.docs]
             )
+            self.retrieval_k = k
+            logger.info("BM25检索器构建完成")
 
-            print("混合检索器构建完成")
-            print(f"检索器配置: 向量检索器k={min(8, len(self.documents))}, BM25检索器k={min(8, len(self.documents))}")
+            # 3. 混合检索在 search 中按 retrieval_weights 自行融合（以便批量计算查询嵌入），
+            # retriever 只用来表示检索器已就绪
+            self.retriever = bm25_retriever
+
+            logger.info("混合检索器构建完成: 向量检索与BM25检索 k=%d", k)
 
         except Exception as e:
-            print(f"构建检索器失败: {e}")
+            logger.error("构建检索器失败: %s", e, exc_info=True)
             # 回退到BM25
             self.retriever = BM25Retriever.from_documents(self.documents)
             self.retriever.k = min(8, len(self.documents))
-            print("回退到BM25检索器")
+            self.vectorstore = None
+            self.bm25_retriever = self.retriever
+            self.category_index = None
+            self.bm25_postings = BM25Postings.from_vectorizer(
+                self.retriever.vectorizer, [_category_of(doc) for doc in self.retriever.docs]
+            )
+            self.retrieval_k = self.retriever.k
+            logger.warning("回退到BM25检索器")
+
+    #BM25检索
+    def _bm25_search(self, query: str, k: int, categories: Optional[List[str]] = None) -> List[Any]:
+        """
+        与 BM25Retriever.invoke 相同，但可以按需指定返回数量；有倒排索引时只扫描查询词的倒排表，
+        指定 categories 时只扫描这些类别的倒排分段
+        """
+        tokens = self.bm25_retriever.preprocess_func(query)
+        docs = self.bm25_retriever.docs
+        if self.bm25_postings is not None:
+            return [docs[i] for i in self.bm25_postings.top_n(tokens, k, categories or None)]
+        if not categories:
+            return self.bm25_retriever.vectorizer.get_top_n(tokens, docs, n=k)
+        fetch_k = min(len(docs), k * _CATEGORY_FETCH_FACTOR)
+        return _filter_categories(self.bm25_retriever.vectorizer.get_top_n(tokens, docs, n=fetch_k), categories, k)
+
+    #向量检索
+    def _dense_search(self, embedding: List[float], k: int, categories: Optional[List[str]] = None) -> List[Any]:
+        """指定 categories 时只在这些类别的子索引中检索（或在主索引上按 ID 过滤）"""
+        if categories and self.category_index is not None:
+            positions = self.category_index.search(self._query_matrix([embedding]), k, categories)
+            if positions is not None:
+                return self._docs_at(positions[0])
+        fetch_k = min(len(self.documents), k * _CATEGORY_FETCH_FACTOR) if categories else k
+        dense = self.vectorstore.similarity_search_with_score_by_vector(embedding, k=fetch_k)
+        return _filter_categories([doc for doc, _ in dense], categories, k)
+
+    def _query_matrix(self, embeddings: List[List[float]]) -> np.ndarray:
+        """查询向量组成的矩阵，按向量库的设置做 L2 归一化"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _docs_at(self, positions: Any) -> List[Any]:
+        """主索引中的位置 -> 文档"""
+        id_map, docstore = self.vectorstore.index_to_docstore_id, self.vectorstore.docstore
+        return [docstore.search(id_map[i]) for i in positions if i != -1]
+
+    #混合检索
+    def _hybrid_retrieve(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+    ) -> List[Any]:
+        """
+        向量检索 + BM25，按加权倒数排名融合（与 EnsembleRetriever 一致，c=60）。
+
+        查询嵌入通过微批处理器计算，并发请求会被合并成一次批量前向计算；
+        请求被取消时尚未执行的嵌入请求会从批次中撤回。
+        指定 categories 时两路检索都只扫描这些类别的文档（类别子索引与 BM25 倒排分段）。
+
+        Returns:
+            [(文档, 融合分数)]，按分数从高到低排序
+        """
+        k = k or self.retrieval_k
+        start = time.monotonic()
+        ranked_lists = []
+        if self.vectorstore is not None:
+            with stage(STAGE_QUERY_EMBEDDING):
+                future = self.embed_batcher.submit(query)
+                embedding = deadline.wait(future) if deadline is not None else future.result()
+            with stage(STAGE_DENSE_SEARCH):
+                ranked_lists.append((self.retrieval_weights[0], self._dense_search(embedding, k, categories)))
+            with stage(STAGE_BM25):
+                ranked_lists.append((self.retrieval_weights[1], self._bm25_search(query, k, categories)))
+        else:
+            with stage(STAGE_BM25):
+                ranked_lists.append((1.0, self._bm25_search(query, k, categories)))
+
+        with stage(STAGE_FUSION):
+            ranked = self._fuse(ranked_lists)
+        stage_latency.record("retrieval", time.monotonic() - start)
+        return ranked
+
+    #加权倒数排名融合
+    @staticmethod
+    def _fuse(ranked_lists: List[Any]) -> List[Any]:
+        """[(权重, [文档])] -> [(文档, 融合分数)]，按分数从高到低排序"""
+        fused: Dict[Any, List[Any]] = {}
+        for weight, docs in ranked_lists:
+            for rank, doc in enumerate(docs, 1):
+                key = doc.metadata.get("id", doc.page_content)
+                entry = fused.setdefault(key, [doc, 0.0])
+                entry[1] += weight / (rank + 60)
+        return sorted((tuple(entry) for entry in fused.values()), key=lambda e: e[1], reverse=True)
+
+    #批量向量检索
+    def _dense_search_many(
+        self, embeddings: List[List[float]], k: int, categories: Optional[List[str]] = None
+    ) -> List[List[Any]]:
+        """
+        所有查询向量组成一个矩阵，一次 index.search 完成（扁平索引内部为一次矩阵乘法），
+        结果与逐条调用 similarity_search_with_score_by_vector 相同；指定 categories 时与逐条调用 _dense_search 相同
+        """
+        if categories:
+            if self.category_index is not None:
+                positions = self.category_index.search(self._query_matrix(embeddings), k, categories)
+                if positions is not None:
+                    return [self._docs_at(row) for row in positions]
+            return [self._dense_search(embedding, k, categories) for embedding in embeddings]
+        _, indices = self.vectorstore.index.search(self._query_matrix(embeddings), k)
+        return [self._docs_at(row) for row in indices]
+
+    #批量BM25检索
+    def _bm25_search_many(self, queries: List[str], k: int, categories: Optional[List[str]] = None) -> List[List[Any]]:
+        """逐条查询：倒排索引只扫描各查询词的倒排表，按查询共享全量打分反而更慢"""
+        return [self._bm25_search(query, k, categories) for query in queries]
+
+    #批量检索与重排序
+    @tracing.traced("search_batch")
+    def search_batch(
+        self,
+        queries: List[str],
+        top_ks: List[int],
+        use_rerank: bool = True,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+    ) -> List[List[Dict]]:
+        """
+        一次处理多个查询（如同时筛选多个岗位），结果与逐条调用 search 一致，但共享计算：
+        - 相同的查询只计算一次
+        - 所有查询嵌入一次批量计算，向量检索为一次矩阵检索
+        - 重排序的（查询, 简历）对去重后一次批量计算（数据集中有大量重复简历），
+          设置了 deadline 时与 search 一样按剩余时间缩小重排序范围或跳过
+
+        categories 不为空时所有查询都只检索这些类别的简历。
+
+        Returns:
+            与 queries 一一对应的结果列表
+        """
+        if len(queries) != len(top_ks):
+            raise ValueError("queries 与 top_ks 的长度不一致")
+        if not self.retriever:
+            raise ValueError("检索器未初始化")
+
+        # 相同的查询合并，候选池按其中最大的 top_k 计算
+        unique: Dict[str, int] = {}
+        for query, top_k in zip(queries, top_ks):
+            if not query or not query.strip():
+                raise ValueError("查询语句不能为空")
+            unique[query] = max(unique.get(query, 0), top_k)
+        unique_queries = list(unique)
+        pool_sizes = [max(self.retrieval_k, unique[query]) for query in unique_queries]
+        k = max(pool_sizes)
+        logger.debug("批量搜索: %d 个查询（去重后 %d 个）", len(queries), len(unique_queries))
+
+        start = time.monotonic()
+        ranked_lists: List[List[Any]] = [[] for _ in unique_queries]
+        if self.vectorstore is not None:
+            with stage(STAGE_QUERY_EMBEDDING):
+                future = self.embed_batcher.submit_many(unique_queries)
+                embeddings = deadline.wait(future) if deadline is not None else future.result()
+            with stage(STAGE_DENSE_SEARCH):
+                dense = self._dense_search_many(embeddings, k, categories)
+            for lists, docs, size in zip(ranked_lists, dense, pool_sizes):
+                lists.append((self.retrieval_weights[0], docs[:size]))
+            bm25_weight = self.retrieval_weights[1]
+        else:
+            bm25_weight = 1.0
+        if deadline is not None:
+            deadline.check()
+        with stage(STAGE_BM25):
+            sparse = self._bm25_search_many(unique_queries, k, categories)
+        for lists, docs, size in zip(ranked_lists, sparse, pool_sizes):
+            lists.append((bm25_weight, docs[:size]))
+
+        with stage(STAGE_FUSION):
+            formatted: Dict[str, List[Dict]] = {}
+            for query, lists in zip(unique_queries, ranked_lists):
+                formatted[query] = [
+                    {
+                        "id": doc.metadata.get("id", i),
+                        "category": doc.metadata.get("category", "Unknown"),
+                        "content": doc.page_content,
+                        "retrieval_score": float(fused_score),
+                        "preview": doc.page_content[:150] + "..." if len(doc.page_content) > 150 else doc.page_content,
+                    }
+                    for i, (doc, fused_score) in enumerate(self._fuse(lists))
+                ]
+        stage_latency.record("retrieval", (time.monotonic() - start) / len(unique_queries))
+
+        if deadline is not None:
+            deadline.check()
+        if use_rerank and self.cross_encoder is not None:
+            self._rerank_many(formatted, deadline, unique)
+
+        results = {}
+        for query, documents in formatted.items():
+            if use_rerank and self.cross_encoder is not None and len(documents) > 1:
+                documents = sorted(documents, key=lambda x: x.get("rerank_score", 0), reverse=True)
+            results[query] = documents
+        self._record_search((time.monotonic() - start) / len(unique_queries))
+        # 相同查询的调用方各自拿到独立的结果
+        return [[dict(doc) for doc in results[query][:top_k]] for query, top_k in zip(queries, top_ks)]
+
+    #批量重排序
+    def _rerank_many(
+        self,
+        formatted: Dict[str, List[Dict]],
+        deadline: Optional[Deadline] = None,
+        top_ks: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        对所有查询的候选人一次批量计算交叉编码器分数，相同的（查询, 简历文本）只计算一次。
+        设置了 deadline 时按剩余时间缩小各查询的重排序范围（截断 formatted 中的名单，至少保留各自的 top_k），
+        连每个查询的 top_k 都来不及时跳过重排序
+        """
+        if deadline is not None and deadline.limited and not self._limit_rerank_depth(formatted, top_ks or {}, deadline):
+            return
+        pair_index: Dict[Any, int] = {}
+        pairs = []
+        for query, documents in formatted.items():
+            if len(documents) <= 1:
+                continue
+            for doc in documents:
+                pair = (query, doc["content"][:500])  # 与 _rerank_results 相同的文本长度限制
+                if pair not in pair_index:
+                    pair_index[pair] = len(pairs)
+                    pairs.append(pair)
+        if not pairs:
+            return
+        try:
+            start = time.monotonic()
+            with stage(instrumentation.STAGE_RERANK):
+                future = self.rerank_batcher.submit_many(pairs)
+                scores = deadline.wait(future) if deadline is not None else future.result()
+            stage_latency.record("rerank_per_pair", (time.monotonic() - start) / len(pairs))
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            logger.warning("批量重排序失败: %s", e)
+            return
+        for query, documents in formatted.items():
+            if len(documents) <= 1:
+                continue
+            for doc in documents:
+                doc["rerank_score"] = float(scores[pair_index[(query, doc["content"][:500])]])
             
+    def _limit_rerank_depth(self, formatted: Dict[str, List[Dict]], top_ks: Dict[str, int], deadline: Deadline) -> bool:
+        """
+        _rerank_many 的重排序范围：剩余时间内能计算的（查询, 简历）对按名单长度比例分给各查询，
+        每个查询至少覆盖自己的 top_k。返回 False 表示连这些都来不及，跳过重排序
+        """
+        lengths = {query: len(documents) for query, documents in formatted.items() if len(documents) > 1}
+        total = sum(lengths.values())
+        floor = sum(max(top_ks.get(query, 1), 2) for query in lengths)
+        affordable = self._rerank_depth(total, floor, deadline) if total else total
+        if affordable >= total:
+            return True
+        if affordable == 0:
+            logger.info("剩余时间不足，跳过批量重排序")
+            deadline.degrade(STAGE_RERANK)
+            return False
+        logger.info("剩余时间不足，批量重排序只覆盖 %d/%d 个候选人", affordable, total)
+        deadline.degrade(STAGE_RERANK_DEPTH)
+        for query, length in lengths.items():
+            depth = max(top_ks.get(query, 1), length * affordable // total)
+            formatted[query] = formatted[query][:depth]
+        return True
+
+    #按剩余时间决定重排序深度
+    def _rerank_depth(self, count: int, top_k: int, deadline: Deadline) -> int:
+        """
+        返回在剩余时间内能重排序的候选人数：全部、至少覆盖 top_k 的前若干个，
+        或 0（连 top_k 个都来不及，跳过重排序）
+        """
+        per_pair = stage_latency.estimate("rerank_per_pair")
+        if per_pair <= 0:
+            return count
+        affordable = int(deadline.available() / per_pair)
+        if affordable >= count:
+            return count
+        if affordable >= max(top_k, 2):
+            return affordable
+        return 0
+
     #用cross encoder对结果精排序
-    def _rerank_results(self, query: str, documents: List[Dict], top_k: int = 5) -> List[Dict]:
-        """使用交叉编码器重排序结果"""
+    def _rerank_results(
+        self,
+        query: str,
+        documents: List[Dict],
+        top_k: int = 5,
+        deadline: Optional[Deadline] = None,
+        min_results: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        使用交叉编码器重排序结果；设置了 deadline 时按剩余时间缩小重排序范围或跳过。
+        min_results 为缩小范围时至少要覆盖的结果数（默认为 top_k），用于只需保证前几个结果的较长名单
+        """
         if not self.cross_encoder or len(documents) <= 1:
             return documents[:top_k]
 
+        if deadline is not None and deadline.limited:
+            floor = min(top_k, min_results) if min_results else top_k
+            depth = self._rerank_depth(len(documents), floor, deadline)
+            if depth == 0:
+                logger.info("剩余时间不足，跳过重排序")
+                deadline.degrade(STAGE_RERANK)
+                return documents[:top_k]
+            if depth < len(documents):
+                logger.info("剩余时间不足，仅对融合排名前 %d 个结果重排序", depth)
+                deadline.degrade(STAGE_RERANK_DEPTH)
+                documents = documents[:depth]
+
         try:
-            print(f"使用交叉编码器对 {len(documents)} 个结果进行重排序...")
+            logger.debug("使用交叉编码器对 %d 个结果进行重排序", len(documents))
 
             # 准备输入
             pairs = [(query, doc["content"][:500]) for doc in documents]  # 限制文本长度
 
-            # 计算分数
-            scores = self.cross_encoder.predict(pairs)
-
-            # 打印重排序前的分数
-            print("\n=== 重排序前分数 ===")
-            for i, (doc, score) in enumerate(zip(documents, scores)):
-                print(f"文档 {i+1} (ID: {doc['id']}): {score:.3f}")
+            # 计算分数（与其他并发请求合并为一次批量前向计算）
+            start = time.monotonic()
+            with stage(instrumentation.STAGE_RERANK):
+                future = self.rerank_batcher.submit_many(pairs)
+                scores = deadline.wait(future) if deadline is not None else future.result()
+            stage_latency.record("rerank_per_pair", (time.monotonic() - start) / len(pairs))
 
             # 添加分数到文档
             for i, doc in enumerate(documents):
@@ -243,20 +705,44 @@ class SimpleRAG:
             # 按重排序分数排序
             reranked = sorted(documents, key=lambda x: x.get("rerank_score", 0), reverse=True)
 
-            # 打印重排序后的结果
-            print("\n=== 重排序后结果 ===")
-            for i, doc in enumerate(reranked[:top_k]):
-                print(f"排名 {i+1} (ID: {doc['id']}): {doc['rerank_score']:.3f}")
-
-            print("重排序完成")
+            # 重排序前后的分数（仅在 DEBUG 且被采样的请求中记录）
+            if log_payload(logger):
+                logger.debug(
+                    "重排序分数",
+                    extra={
+                        "before": [(doc["id"], round(doc["rerank_score"], 3)) for doc in documents],
+                        "after": [(doc["id"], round(doc["rerank_score"], 3)) for doc in reranked[:top_k]],
+                    },
+                )
             return reranked[:top_k]
 
+        except RequestCancelled:
+            raise
         except Exception as e:
-            print(f"重排序失败: {e}")
+            logger.warning("重排序失败: %s", e)
             return documents[:top_k]
             
+    #对外部文本计算相关度
+    def score_relevance(self, query: str, texts: List[str], deadline: Optional[Deadline] = None) -> Optional[List[float]]:
+        """用交叉编码器计算查询与一组外部文本（如上传的简历）的相关度；没有交叉编码器时返回 None"""
+        if not self.cross_encoder or not texts:
+            return None
+        pairs = [(query, text[:500]) for text in texts]  # 与 _rerank_results 相同的文本长度限制
+        with stage(instrumentation.STAGE_RERANK):
+            future = self.rerank_batcher.submit_many(pairs)
+            return deadline.wait(future) if deadline is not None else future.result()
+
     #执行检索和重排序
-    def search(self, query: str, top_k: int = 5, use_rerank: bool = True) -> List[Dict]:
+    @tracing.traced("search")
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        use_rerank: bool = True,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+        min_results: Optional[int] = None,
+    ) -> List[Dict]:
         """
         搜索相关文档
 
@@ -264,6 +750,9 @@ class SimpleRAG:
             query: 查询语句
             top_k: 返回结果数量
             use_rerank: 是否使用重排序
+            deadline: 请求的时间预算，剩余时间不足时缩小或跳过重排序；请求被取消时抛出 RequestCancelled
+            categories: 只返回这些类别的文档（为空时不过滤）
+            min_results: 时间不足缩小重排序范围时至少覆盖的结果数（默认为 top_k）
 
         Returns:
             搜索结果列表
@@ -274,102 +763,80 @@ class SimpleRAG:
         if not self.retriever:
             raise ValueError("检索器未初始化")
 
-        print(f"搜索: '{query}'")
+        logger.debug("搜索: %r", query)
 
+        started = time.perf_counter()
         try:
-            # 执行检索
-            retrieved_docs = self.retriever.invoke(query)
+            # 执行检索（候选池至少覆盖 top_k）
+            retrieved = self._hybrid_retrieve(
+                query, k=max(self.retrieval_k, top_k), deadline=deadline, categories=categories
+            )
 
-            if not retrieved_docs:
-                print("未找到相关结果")
+            if not retrieved:
+                logger.info("未找到相关结果")
                 return []
 
-            print(f"检索到 {len(retrieved_docs)} 个结果")
-            
-            # 打印检索到的原始结果
-            print("\n=== 检索器返回的原始结果 ===")
-            for i, doc in enumerate(retrieved_docs):
-                print(f"\n--- 结果 {i+1} ---")
-                print(f"ID: {doc.metadata.get('id', 'N/A')}")
-                print(f"类别: {doc.metadata.get('category', 'Unknown')}")
-                print(f"行索引: {doc.metadata.get('row_index', 'N/A')}")
-                print(f"内容预览: {doc.page_content[:200]}...")
-                print("-" * 50)
-
             # 格式化结果
             formatted_results = []
-            for i, doc in enumerate(retrieved_docs):
+            for i, (doc, fused_score) in enumerate(retrieved):
                 result = {
                     "id": doc.metadata.get("id", i),
                     "category": doc.metadata.get("category", "Unknown"),
                     "content": doc.page_content,
-                    "retrieval_score": 1.0 - (i * 0.1),  # 简单递减分数
+                    "retrieval_score": float(fused_score),  # 加权倒数排名融合分数
                     "preview": doc.page_content[:150] + "..." if len(doc.page_content) > 150 else doc.page_content
                 }
                 formatted_results.append(result)
 
-            # 打印格式化后的检索结果
-            print("\n=== 格式化后的检索结果 ===")
-            for i, result in enumerate(formatted_results):
-                print(f"\n--- 格式化结果 {i+1} ---")
-                print(f"ID: {result['id']}")
-                print(f"类别: {result['category']}")
-                print(f"检索分数: {result['retrieval_score']:.3f}")
-                print(f"内容预览: {result['preview']}")
-                print("-" * 50)
+            # 检索结果预览（仅在 DEBUG 且被采样的请求中记录）
+            if log_payload(logger):
+                logger.debug(
+                    "检索结果",
+                    extra={
+                        "query": query,
+                        "retrieved": [
+                            {
+                                "id": result["id"],
+                                "category": result["category"],
+                                "retrieval_score": round(result["retrieval_score"], 3),
+                                "preview": result["preview"],
+                            }
+                            for result in formatted_results
+                        ],
+                    },
+                )
 
             # 可选的重新排序
-            final_results = formatted_results[:top_k]
+            if deadline is not None:
+                deadline.check()
             if use_rerank and len(formatted_results) > 1:
-                print("\n=== 开始重排序 ===")
-                final_results = self._rerank_results(query, formatted_results, top_k)
+                final_results = self._rerank_results(query, formatted_results, top_k, deadline, min_results)
             else:
-                print(f"\n=== 跳过重排序，直接返回前 {top_k} 个结果 ===")
                 final_results = formatted_results[:top_k]
 
-            # 打印最终结果
-            print("\n=== 最终返回结果 ===")
-            for i, result in enumerate(final_results):
-                print(f"\n--- 最终结果 {i+1} ---")
-                print(f"ID: {result['id']}")
-                print(f"类别: {result['category']}")
-                if 'rerank_score' in result:
-                    print(f"重排序分数: {result['rerank_score']:.3f}")
-                else:
-                    print(f"检索分数: {result['retrieval_score']:.3f}")
-                print(f"内容预览: {result['preview']}")
-                print("-" * 50)
-
             # 确保返回结果数量正确
             final_results = final_results[:top_k]
 
-            print(f"返回 {len(final_results)} 个结果")
+            logger.debug("检索到 %d 个结果，返回 %d 个", len(formatted_results), len(final_results))
             return final_results
 
+        except RequestCancelled:
+            raise
         except Exception as e:
-            print(f"搜索失败: {e}")
+            logger.error("搜索失败: %s", e)
             return []
+        finally:
+            self._record_search(time.perf_counter() - started)
+
+    def _record_search(self, seconds: float) -> None:
+        with self._search_stats_lock:
+            self.searches_total += 1
+            if self.first_search is None:
+                self.first_search = {"at": round(time.time(), 3), "ms": round(seconds * 1000, 1)}
             
-    #让大模型对候选人进行评分
-    def score_candidates(self, query: str, requirements: str, top_k: int = 5) -> List[Dict]:
-        """
-        对候选人进行评分
-    
-        Args:
-            query: 查询语句
-            requirements: 岗位要求
-            top_k: 候选人数量
-    
-        Returns:
-            评分结果列表，每个元素包含结构化信息
-        """
-        # 检索候选人
-        candidates = self.search(query, top_k=top_k, use_rerank=True)
-    
-        if not candidates:
-            return []
-    
-        # 构建提示词
+    #构建评估提示词
+    def _build_prompt(self, requirements: str, candidates: List[Dict]) -> str:
+        """根据岗位要求和候选人列表构建评估提示词"""
         prompt = f"""
 你是一个专业的HR专家，请根据以下岗位要求对候选人进行评估。
     
@@ -412,72 +879,505 @@ class SimpleRAG:
   }
 ]
 """
-    
+        return prompt
+
+    #评估失败时的默认结果
+    def _default_evaluations(self, candidates: List[Dict], strengths: str) -> List[Dict]:
+        """为每个候选人生成默认（零分）评估结果"""
+        return [{
+            "candidate_id": f"候选人{i+1}",
+            "technical_score": 0,
+            "experience_score": 0,
+            "overall_score": 0,
+            "years_experience": "未知",
+            "skills": "未知",
+            "strengths": strengths,
+            "weaknesses": "",
+            "recommendation": "否",
+            "candidate_info": candidate
+        } for i, candidate in enumerate(candidates)]
+
+    #解析大模型返回的评估结果
+    def _parse_evaluation(self, result_text: str, candidates: List[Dict]) -> List[Dict]:
+        """从大模型输出中提取JSON评估结果，并与候选人信息关联"""
+        import json
+        import re
+
+        # 提取JSON部分
+        json_match = re.search(r'\[[\s\S]*\]', result_text)
+        if json_match:
+            json_text = json_match.group(0)
+            try:
+                parsed_result = json.loads(json_text)
+                return self._attach_candidates(parsed_result, candidates)
+            except json.JSONDecodeError:
+                logger.warning("JSON解析失败")
+                if log_payload(logger):
+                    logger.debug("JSON解析失败的原文", extra={"json_text": json_text})
+
+        # 如果解析失败，返回原始文本和候选人信息
+        return self._default_evaluations(candidates, result_text)
+
+    #按 candidate_id 将评估结果与候选人关联
+    def _attach_candidates(self, parsed_result: List, candidates: List[Dict]) -> List[Dict]:
+        """
+        为每个评估结果设置 candidate_info。candidate_id 可以是提示词中的"候选人N"编号，也可以是候选人的ID；
+        大模型漏掉或打乱了部分候选人时仍能对应到正确的候选人，无法对应的评估结果被丢弃。
+        所有结果都没有 candidate_id 时才按顺序对应
+        """
+        import re
+
+        evaluations = [r for r in parsed_result if isinstance(r, dict)]
+        if not any(str(r.get("candidate_id", "")).strip() for r in evaluations):
+            for candidate_result, candidate in zip(evaluations, candidates):
+                candidate_result['candidate_info'] = candidate
+            return evaluations[:len(candidates)]
+
+        by_id = {str(candidate.get('id')): i for i, candidate in enumerate(candidates)}
+        attached, seen = [], set()
+        for candidate_result in evaluations:
+            key = str(candidate_result.get("candidate_id", "")).strip()
+            position = by_id.get(key)
+            if position is None:
+                label = re.fullmatch(r'(?:候选人)?\s*(\d+)', key)
+                if label and 1 <= int(label.group(1)) <= len(candidates):
+                    position = int(label.group(1)) - 1
+            if position is None or position in seen:
+                logger.warning("无法对应评估结果的 candidate_id: %r", key)
+                continue
+            seen.add(position)
+            candidate_result['candidate_info'] = candidates[position]
+            attached.append(candidate_result)
+        return attached
+
+    #估算一次调用消耗的token数
+    def _estimate_tokens(self, prompt: str) -> int:
+        """按约4个字符一个token估算输入，加上输出上限"""
+        return len(prompt) // 4 + self.max_output_tokens
+
+    #大模型是否可用（熔断器未打开）
+    def llm_available(self) -> bool:
+        return self.circuit_breaker.allow_request()
+
+    #熔断器打开后的后台探测
+    def _probe_llm(self):
+        """用一个极短的请求探测大模型服务是否恢复"""
+        self.llm.invoke("ping", max_tokens=1)
+
+    #按剩余时间计算本次大模型调用的排队上限和请求超时
+    def _llm_call_limits(self, deadline: Optional[Deadline], count: int = 1):
+        """
+        返回 (最长排队秒数, 调用参数)；count 为本次评估的候选人数，
+        剩余时间不足以评估这些候选人时抛出 DeadlineExceeded
+        """
+        if deadline is None or not deadline.limited:
+            return None, {}
+        if not deadline.affords("llm_per_candidate", count):
+            raise DeadlineExceeded(f"剩余 {deadline.remaining():.1f} 秒，不足以完成 {count} 个候选人的大模型评估")
+        remaining = deadline.remaining()
+        return max(0.0, remaining - stage_latency.estimate("llm_per_candidate") * count), {"timeout": remaining}
+
+    #大模型调用开始前的检查（_invoke_llm 与 _ainvoke_llm 共用）
+    def _begin_llm_call(self, prompt: str) -> int:
+        """熔断器打开时抛出 CircuitOpenError，否则返回本次调用预估的token数"""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("大模型服务暂不可用（熔断中）")
+        return self._estimate_tokens(prompt)
+
+    #处理一次失败的大模型调用（_invoke_llm 与 _ainvoke_llm 共用）
+    def _handle_llm_error(self, error: Exception, attempt: int, deadline: Optional[Deadline]) -> None:
+        """
+        超出时间预算时抛出 DeadlineExceeded；其他非429错误计入熔断后重新抛出；
+        429 且还有重试次数时把 Retry-After 反馈给限流器后返回，由调用方重新排队
+        """
+        if deadline is not None and deadline.expired():
+            # 超出请求自身的时间预算，不代表服务故障，不计入熔断
+            raise DeadlineExceeded(f"大模型评估超出时间预算: {error}") from error
+        if not is_rate_limit_error(error):
+            # 429 说明服务可用，只是超额；其余错误计入熔断
+            self.circuit_breaker.record_failure(error)
+            raise error
+        instrumentation.event("llm_rate_limited")
+        if attempt >= self.rate_limit_retries:
+            raise error
+        self.rate_limiter.penalize(retry_after_seconds(error))
+        logger.warning("大模型返回速率限制，第 %d 次排队重试: %s", attempt + 1, error)
+
+    def _handle_quota_timeout(self, error: RateLimitExceeded, deadline: Optional[Deadline]) -> None:
+        """限流器排队失败：剩余时间内等不到额度时改为抛出 DeadlineExceeded，否则由调用方重新抛出"""
+        if deadline is not None and error.retry_after >= deadline.remaining():
+            raise DeadlineExceeded(f"剩余时间内无法获得大模型调用额度: {error}") from error
+
+    #记录一次成功的大模型调用
+    def _record_llm_success(self, response, estimated: int, started: float, count: int = 1) -> None:
+        self.circuit_breaker.record_success()
+        self.rate_limiter.record_success()
+        stage_latency.record("llm_per_candidate", (time.monotonic() - started) / max(1, count))
+        usage = getattr(response, "usage_metadata", None) or {}
+        if usage.get("total_tokens"):
+            self.rate_limiter.record_usage(estimated, usage["total_tokens"])
+        instrumentation.event("llm_tokens", usage.get("input_tokens", 0), direction="in")
+        instrumentation.event("llm_tokens", usage.get("output_tokens", 0), direction="out")
+
+    #经过熔断器和限流器调用大模型
+    def _invoke_llm(self, prompt: str, deadline: Optional[Deadline] = None, count: int = 1):
+        """
+        通过熔断器和共享限流器调用大模型。
+
+        熔断器打开时立即抛出 CircuitOpenError；
+        收到429时把 Retry-After 反馈给限流器（暂停并降速），再排队重试；
+        限流器排队已满时抛出 RateLimitExceeded；
+        设置了 deadline 时排队和请求都不超过剩余时间，来不及时抛出 DeadlineExceeded
+        （count 为本次评估的候选人数，用于估计调用耗时）。
+        """
+        estimated = self._begin_llm_call(prompt)
+        for attempt in range(self.rate_limit_retries + 1):
+            max_wait, call_kwargs = self._llm_call_limits(deadline, count)
+            try:
+                with self.rate_limiter.acquire(estimated, max_wait=max_wait):
+                    if deadline is not None:
+                        # 排队期间请求可能已被取消，拿到额度后先检查再发起调用
+                        deadline.check()
+                    started = time.monotonic()
+                    try:
+                        with stage(STAGE_LLM_CALL):
+                            response = self.llm.invoke(prompt, **call_kwargs)
+                    except Exception as e:
+                        self._handle_llm_error(e, attempt, deadline)
+                        continue
+            except RateLimitExceeded as e:
+                self._handle_quota_timeout(e, deadline)
+                raise
+            self._record_llm_success(response, estimated, started, count)
+            return response
+
+    #让大模型评估给定的候选人
+    @tracing.traced("evaluate_candidates")
+    def evaluate_candidates(
+        self, requirements: str, candidates: List[Dict], deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """
+        使用大模型评估已检索到的候选人
+
+        Args:
+            requirements: 岗位要求
+            candidates: search() 返回的候选人列表
+            deadline: 请求的时间预算，来不及评估时抛出 DeadlineExceeded
+
+        Returns:
+            评分结果列表，每个元素的 candidate_info 为对应的候选人
+        """
+        if not candidates:
+            return []
+
+        with stage(STAGE_PROMPT_BUILD):
+            prompt = self._build_prompt(requirements, candidates)
+
         # 调用LLM
         try:
-            print("正在评估候选人...")
-            response = self.llm.invoke(prompt)
+            logger.debug("正在评估 %d 个候选人", len(candidates))
+            response = self._invoke_llm(prompt, deadline, len(candidates))
             result_text = response.content if hasattr(response, 'content') else str(response)
-            print("评估完成")
-            
-            # 尝试解析JSON结果
-            import json
-            import re
-            
-            # 提取JSON部分
-            json_match = re.search(r'\[[\s\S]*\]', result_text)
-            if json_match:
-                json_text = json_match.group(0)
-                try:
-                    parsed_result = json.loads(json_text)
-                    # 将候选人信息与评分结果关联
-                    for i, candidate_result in enumerate(parsed_result):
-                        if i < len(candidates):
-                            candidate_result['candidate_info'] = candidates[i]
-                    return parsed_result
-                except json.JSONDecodeError:
-                    print(f"JSON解析失败: {json_text}")
-                    pass
-            
-            # 如果解析失败，返回原始文本和候选人信息
-            return [{
-                "candidate_id": f"候选人{i+1}",
-                "technical_score": 0,
-                "experience_score": 0,
-                "overall_score": 0,
-                "years_experience": "未知",
-                "skills": "未知",
-                "strengths": result_text,
-                "weaknesses": "",
-                "recommendation": "否",
-                "candidate_info": candidate
-            } for i, candidate in enumerate(candidates)]
-    
+            logger.debug("评估完成")
+            with stage(STAGE_JSON_PARSE):
+                return self._parse_evaluation(result_text, candidates)
+
+        except (RateLimitExceeded, CircuitOpenError, DeadlineExceeded, RequestCancelled):
+            # 被限流器削峰或熔断的请求交给上层处理，而不是返回零分结果
+            raise
         except Exception as e:
-            print(f"评估失败: {e}")
+            logger.error("评估失败: %s", e)
             # 返回默认结果
-            return [{
-                "candidate_id": f"候选人{i+1}",
-                "technical_score": 0,
-                "experience_score": 0,
-                "overall_score": 0,
-                "years_experience": "未知",
-                "skills": "未知",
-                "strengths": f"评估失败: {e}",
-                "weaknesses": "",
-                "recommendation": "否",
-                "candidate_info": candidate
-            } for i, candidate in enumerate(candidates)]
+            return self._default_evaluations(candidates, f"评估失败: {e}")
+
+    #让大模型对候选人进行评分
+    def score_candidates(
+        self, query: str, requirements: str, top_k: int = 5, deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """
+        对候选人进行评分
+    
+        Args:
+            query: 查询语句
+            requirements: 岗位要求
+            top_k: 候选人数量
+            deadline: 请求的时间预算，不足时依次缩小重排序、跳过重排序、跳过大模型评估
+    
+        Returns:
+            评分结果列表，每个元素包含结构化信息
+        """
+        return self.score_ranked(query, requirements, top_k, top_k, deadline)[0]
+
+    #检索较长的名单，只评估其中前 top_k 个
+    def score_ranked(
+        self,
+        query: str,
+        requirements: str,
+        top_k: int,
+        pool_size: int,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        与 score_candidates 相同，但检索重排序 max(top_k, pool_size) 个候选人，只评估前 top_k 个，
+        返回 (评分结果, 完整的重排序名单)，名单供分页时继续评估后面的候选人；
+        时间不足时重排序范围只需覆盖前 top_k 个（名单随之变短）。categories 不为空时只检索这些类别的简历。
+        评估时熔断抛出的 CircuitOpenError 带有已检索的名单（ranked 属性）
+        """
+        self._reserve_for_llm(deadline, top_k)
+        # 检索候选人
+        ranked = self.search(
+            query,
+            top_k=max(top_k, pool_size),
+            use_rerank=True,
+            deadline=deadline,
+            categories=categories,
+            min_results=top_k,
+        )
+        candidates = ranked[:top_k]
+
+        if not candidates:
+            return [], ranked
+
+        if deadline is not None:
+            deadline.reserved = 0.0
+            if STAGE_LLM in deadline.degraded:
+                return self._skip_llm_evaluations(candidates, deadline), ranked
+        try:
+            return self.evaluate_candidates(requirements, candidates, deadline), ranked
+        except DeadlineExceeded as e:
+            logger.info("跳过大模型评估: %s", e)
+            return self._skip_llm_evaluations(candidates, deadline), ranked
+        except CircuitOpenError as e:
+            e.ranked = ranked
+            raise
+
+    #为大模型评估预留时间
+    def _reserve_for_llm(self, deadline: Optional[Deadline], count: int) -> None:
+        """
+        剩余时间足够检索 + 评估 count 个候选人时，为评估预留其平均耗时，检索/重排序只使用其余时间；
+        否则直接放弃评估，把全部时间留给检索与重排序
+        """
+        if deadline is None or not deadline.limited:
+            return
+        llm_seconds = stage_latency.estimate("llm_per_candidate") * count
+        if deadline.remaining() >= stage_latency.estimate("retrieval") + llm_seconds:
+            deadline.reserved = llm_seconds
+        else:
+            deadline.degrade(STAGE_LLM)
+
+    #时间不足时跳过大模型评估
+    def _skip_llm_evaluations(self, candidates: List[Dict], deadline: Deadline) -> List[Dict]:
+        """按重排序顺序返回零分评估结果，并记录大模型评估已降级"""
+        deadline.degrade(STAGE_LLM)
+        return self._default_evaluations(candidates, "剩余时间不足，跳过大模型评估，仅按检索重排序结果返回")
+
+    #异步接口使用的专用线程池
+    def _get_cpu_executor(self) -> ThreadPoolExecutor:
+        """延迟创建，保证 fork 出的子进程各自拥有自己的线程池"""
+        with self._cpu_executor_lock:
+            if self._cpu_executor is None:
+                self._cpu_executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.cpu_workers), thread_name_prefix="rag-cpu"
+                )
+            return self._cpu_executor
+
+    async def _run_cpu(self, fn, *args, **kwargs):
+        """在专用线程池中执行同步函数（保留当前上下文变量）"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._get_cpu_executor(), functools.partial(ctx.run, fn, *args, **kwargs)
+        )
+
+    #异步检索
+    async def asearch(
+        self,
+        query: str,
+        top_k: int = 5,
+        use_rerank: bool = True,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+        min_results: Optional[int] = None,
+    ) -> List[Dict]:
+        """search 的协程版本，检索与重排序在专用线程池中执行"""
+        return await self._run_cpu(
+            self.search,
+            query,
+            top_k=top_k,
+            use_rerank=use_rerank,
+            deadline=deadline,
+            categories=categories,
+            min_results=min_results,
+        )
+
+    #异步批量检索
+    async def asearch_batch(
+        self,
+        queries: List[str],
+        top_ks: List[int],
+        use_rerank: bool = True,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+    ) -> List[List[Dict]]:
+        """search_batch 的协程版本"""
+        return await self._run_cpu(
+            self.search_batch, queries, top_ks, use_rerank=use_rerank, deadline=deadline, categories=categories
+        )
+
+    async def ascore_relevance(
+        self, query: str, texts: List[str], deadline: Optional[Deadline] = None
+    ) -> Optional[List[float]]:
+        """score_relevance 的协程版本"""
+        return await self._run_cpu(self.score_relevance, query, texts, deadline=deadline)
+
+    #异步调用大模型
+    async def _ainvoke_llm(self, prompt: str, deadline: Optional[Deadline] = None, count: int = 1):
+        """_invoke_llm 的协程版本：排队与等待响应期间都不占用线程"""
+        estimated = self._begin_llm_call(prompt)
+        for attempt in range(self.rate_limit_retries + 1):
+            max_wait, call_kwargs = self._llm_call_limits(deadline, count)
+            try:
+                async with self.rate_limiter.aacquire(estimated, max_wait=max_wait):
+                    if deadline is not None:
+                        deadline.check()
+                    started = time.monotonic()
+                    try:
+                        with stage(STAGE_LLM_CALL):
+                            response = await self.llm.ainvoke(prompt, **call_kwargs)
+                    except Exception as e:
+                        self._handle_llm_error(e, attempt, deadline)
+                        continue
+            except RateLimitExceeded as e:
+                self._handle_quota_timeout(e, deadline)
+                raise
+            self._record_llm_success(response, estimated, started, count)
+            return response
+
+    #异步评估候选人
+    @tracing.traced("evaluate_candidates")
+    async def aevaluate_candidates(
+        self, requirements: str, candidates: List[Dict], deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """evaluate_candidates 的协程版本"""
+        if not candidates:
+            return []
+
+        with stage(STAGE_PROMPT_BUILD):
+            prompt = self._build_prompt(requirements, candidates)
+        try:
+            response = await self._ainvoke_llm(prompt, deadline, len(candidates))
+            result_text = response.content if hasattr(response, 'content') else str(response)
+            with stage(STAGE_JSON_PARSE):
+                return self._parse_evaluation(result_text, candidates)
+        except (RateLimitExceeded, CircuitOpenError, DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            logger.error("评估失败: %s", e)
+            return self._default_evaluations(candidates, f"评估失败: {e}")
+
+    #异步评分
+    async def ascore_candidates(
+        self, query: str, requirements: str, top_k: int = 5, deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """score_candidates 的协程版本"""
+        return (await self.ascore_ranked(query, requirements, top_k, top_k, deadline))[0]
+
+    async def ascore_ranked(
+        self,
+        query: str,
+        requirements: str,
+        top_k: int,
+        pool_size: int,
+        deadline: Optional[Deadline] = None,
+        categories: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """score_ranked 的协程版本"""
+        self._reserve_for_llm(deadline, top_k)
+        ranked = await self.asearch(
+            query,
+            top_k=max(top_k, pool_size),
+            use_rerank=True,
+            deadline=deadline,
+            categories=categories,
+            min_results=top_k,
+        )
+        candidates = ranked[:top_k]
+        if not candidates:
+            return [], ranked
+        if deadline is not None:
+            deadline.reserved = 0.0
+            if STAGE_LLM in deadline.degraded:
+                return self._skip_llm_evaluations(candidates, deadline), ranked
+        try:
+            return await self.aevaluate_candidates(requirements, candidates, deadline), ranked
+        except DeadlineExceeded as e:
+            logger.info("跳过大模型评估: %s", e)
+            return self._skip_llm_evaluations(candidates, deadline), ranked
+        except CircuitOpenError as e:
+            e.ranked = ranked
+            raise
+
+    #索引信息
+    def _index_info(self) -> Dict:
+        """向量索引的类型、规模与占用字节数，以及 BM25 索引的规模"""
+        info: Dict[str, Any] = {"vector": None, "bm25": None}
+        if self.vectorstore is not None:
+            index = self.vectorstore.index
+            info["vector"] = {
+                "type": type(index).__name__,
+                "vectors": index.ntotal,
+                "dimensions": index.d,
+                # 扁平索引每个向量占 code_size 字节（float32 为 4 * d）
+                "size_bytes": index.ntotal * getattr(index, "code_size", index.d * 4),
+            }
+        if self.bm25_retriever is not None:
+            bm25 = self.bm25_retriever.vectorizer
+            info["bm25"] = {
+                "type": type(bm25).__name__,
+                "documents": len(self.bm25_retriever.docs),
+                "vocabulary": len(getattr(bm25, "idf", {})),
+                "avg_doc_tokens": round(getattr(bm25, "avgdl", 0.0), 1),
+                "postings": self.bm25_postings.size if self.bm25_postings is not None else None,
+            }
+        if self.category_index is not None:
+            info["categories"] = {
+                "count": len(self.category_index.positions),
+                # 子索引为可选项（RAG_CATEGORY_SUBINDEX=1），占用的内存不计入 vector.size_bytes
+                "subindexes": len(self.category_index.subindexes),
+                "subindex_bytes": self.category_index.subindex_bytes,
+            }
+        return info
 
     #简单的系统信息
     def get_system_info(self) -> Dict:
         """获取系统信息"""
+        with self._search_stats_lock:
+            warm_up = {
+                "warm": self.first_search is not None,
+                "first_search": self.first_search,
+                "searches_total": self.searches_total,
+            }
         return {
             "documents_count": len(self.documents),
+            "dataset_version": self.dataset_version,
             "has_retriever": self.retriever is not None,
             "has_cross_encoder": self.cross_encoder is not None,
             "has_api_key": bool(self.api_key),
-            "model": self.model_name
+            "model": self.model_name,
+            "embedding_model": getattr(self.embeddings, "model_name", None) or getattr(self.embeddings, "model", None),
+            "rerank_model": self.rerank_model_name if self.cross_encoder is not None else None,
+            "index": self._index_info(),
+            "retrieval_k": self.retrieval_k,
+            "load_times": dict(self.load_times),
+            "warm_up": warm_up,
+            "cpu_executor_started": self._cpu_executor is not None,
+            "llm_rate_limiter": self.rate_limiter.stats(),
+            "llm_circuit_breaker": self.circuit_breaker.stats(),
+            "cpu_workers": self.cpu_workers,
+            "embed_batcher": self.embed_batcher.stats() if self.embed_batcher else None,
+            "rerank_batcher": self.rerank_batcher.stats() if self.rerank_batcher else None,
+            "stage_latency_estimates": stage_latency.stats(),
         }
 
 
@@ -0,0 +1,110 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+# 当前请求的ID与是否记录详细载荷（由 Web 层按请求设置）
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_payload_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("payload_sampled", default=None)
+
+# LogRecord 自带的属性，其余属性视为 extra 中的结构化字段
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def payload_sample_rate() -> float:
+    return float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE") or 0.01)
+
+
+def sample_payload() -> contextvars.Token:
+    """按采样率决定当前请求是否记录详细载荷（检索结果预览、重排序分数等）"""
+    return _payload_sampled.set(random.random() < payload_sample_rate())
+
+
+def reset_payload_sample(token: contextvars.Token) -> None:
+    _payload_sampled.reset(token)
+
+
+def log_payload(logger: logging.Logger) -> bool:
+    """
+    是否需要构造并记录详细载荷：DEBUG 未开启时直接返回 False，调用方无需做任何格式化；
+    开启时只有被采样的请求才记录
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    sampled = _payload_sampled.get()
+    if sampled is None:
+        return random.random() < payload_sample_rate()
+    return sampled
+
+
+class RequestIdFilter(logging.Filter):
+    """为每条日志附加当前请求ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 中的字段作为独立字段输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+_configured = False
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """
+    配置根日志（每个进程一次）。
+
+    LOG_LEVEL 默认为 INFO：热路径上的逐条检索结果、重排序分数等只在 DEBUG 下输出，
+    INFO 下不产生任何格式化开销；LOG_FORMAT 为 json（默认）或 text；
+    LOG_PAYLOAD_SAMPLE_RATE 为 DEBUG 下记录详细载荷的请求比例（默认 0.01）。
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    level = (level or os.getenv("LOG_LEVEL") or "INFO").upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT") or "json").lower()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(_TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,293 @@
+import asyncio
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, closing, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from rag_system import instrumentation
+
+
+class RateLimitExceeded(Exception):
+    """限流器排队已满或预计等待超时，请求被直接拒绝（而不是打到服务商触发429）"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(exception: BaseException) -> bool:
+    """判断是否为速率限制错误"""
+    error_str = str(exception).lower()
+    return "429" in error_str or "rate limit" in error_str or "rate-limit" in error_str
+
+
+def retry_after_seconds(exception: BaseException) -> Optional[float]:
+    """尽量从服务商返回的异常中取出 Retry-After（秒）"""
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        match = re.search(r"retry[- ]after[^0-9]*([0-9.]+)", str(exception), re.IGNORECASE)
+        value = match.group(1) if match else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _TokenBucket:
+    """按分钟配额匀速补充的令牌桶，rate_per_minute <= 0 表示不限制"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, factor: float) -> None:
+        if self.rate_per_minute <= 0:
+            return
+        elapsed = now - self.updated
+        self.level = min(self.capacity, self.level + elapsed * self.rate_per_minute * factor / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, factor: float) -> float:
+        if self.rate_per_minute <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / (self.rate_per_minute * factor)
+
+    def take(self, amount: float) -> None:
+        if self.rate_per_minute > 0:
+            self.level = min(self.capacity, self.level - min(amount, self.capacity))
+
+
+class RateLimiter:
+    """
+    进程内共享的大模型调用限流器：请求数/分钟、token数/分钟两个令牌桶，加上并发上限。
+
+    - 排队人数超过 max_queue 或预计等待超过 max_wait 时直接抛出 RateLimitExceeded（削峰）
+    - 收到 429 时调用 penalize()：在 Retry-After 期间暂停放行，并把速率减半；暂停结束后速率随时间
+      线性恢复（从最低值恢复到满速约需 recovery_seconds 秒），每次成功调用再额外加快恢复
+    """
+
+    # 从最低速率（10%）恢复到满速所需的秒数
+    recovery_seconds = 60.0
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 0,
+        max_queue: int = 100,
+        max_wait: float = 60.0,
+        name: str = "",
+    ):
+        # 模型名，作为排队指标的标签
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._rate_factor = 1.0
+        self._blocked_until = 0.0
+        self._recovered_at = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+        # 统计信息
+        self._acquired = 0
+        self._shed = 0
+        self._throttled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def configure(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 0,
+        max_queue: int = 100,
+        max_wait: float = 60.0,
+    ) -> None:
+        """更新限额（保留统计信息）"""
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self.max_wait = max_wait
+            self._requests = _TokenBucket(requests_per_minute)
+            self._tokens = _TokenBucket(tokens_per_minute)
+
+    def _try_acquire(self, tokens: float) -> float:
+        """尝试占用一次调用额度；成功返回0，否则返回建议等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._recover_locked(now)
+            self._requests.refill(now, self._rate_factor)
+            self._tokens.refill(now, self._rate_factor)
+            wait = max(
+                self._blocked_until - now,
+                self._requests.wait_time(1, self._rate_factor),
+                self._tokens.wait_time(tokens, self._rate_factor),
+            )
+            if wait <= 0 and self.max_concurrency > 0 and self._in_flight >= self.max_concurrency:
+                wait = 0.05
+            if wait > 0:
+                return wait
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._in_flight += 1
+            self._acquired += 1
+            return 0.0
+
+    def _max_wait(self, max_wait: Optional[float]) -> float:
+        return self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+
+    def _enter_queue(self, tokens: float, max_wait: float) -> float:
+        """登记排队；队列已满或预计等待过长时直接拒绝。返回首次建议等待时间"""
+        wait = self._try_acquire(tokens)
+        if wait <= 0:
+            return 0.0
+        with self._lock:
+            waiting = self._waiting
+            shed = waiting >= self.max_queue or wait > max_wait
+            if shed:
+                self._shed += 1
+            else:
+                self._waiting += 1
+        if shed:
+            instrumentation.event("llm_queue_shed", model=self.name)
+            raise RateLimitExceeded(f"大模型调用限流：排队 {waiting} 个，预计等待 {wait:.1f} 秒", retry_after=wait)
+        instrumentation.event("llm_queue", 1, model=self.name)
+        return wait
+
+    def _leave_queue(self, waited: float) -> None:
+        with self._lock:
+            self._waiting -= 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        instrumentation.event("llm_queue", -1, model=self.name)
+        instrumentation.event("llm_queue_wait", waited, model=self.name)
+
+    def _waits(self, tokens: float, max_wait: Optional[float]) -> Iterator[float]:
+        """
+        排队等待调用额度（acquire 与 aacquire 共用）：逐次产出需要休眠的秒数，由调用方休眠后继续迭代；
+        迭代正常结束即已获得额度，超过最长等待时抛出 RateLimitExceeded。
+        调用方中途退出时需关闭迭代器（见 closing），以便及时退出排队
+        """
+        max_wait = self._max_wait(max_wait)
+        wait = self._enter_queue(tokens, max_wait)
+        if wait <= 0:
+            return
+        start = time.monotonic()
+        try:
+            while wait > 0:
+                if time.monotonic() - start + wait > max_wait:
+                    with self._lock:
+                        self._shed += 1
+                    instrumentation.event("llm_queue_shed", model=self.name)
+                    raise RateLimitExceeded("大模型调用限流：等待超时", retry_after=wait)
+                yield min(wait, 0.25)
+                wait = self._try_acquire(tokens)
+        finally:
+            self._leave_queue(time.monotonic() - start)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    @contextmanager
+    def acquire(self, tokens: float = 0, max_wait: Optional[float] = None) -> Iterator["RateLimiter"]:
+        """阻塞直到获得调用额度，退出上下文时释放并发名额；max_wait 可进一步缩短本次的最长等待"""
+        with closing(self._waits(tokens, max_wait)) as waits:
+            for delay in waits:
+                time.sleep(delay)
+        try:
+            yield self
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aacquire(self, tokens: float = 0, max_wait: Optional[float] = None) -> AsyncIterator["RateLimiter"]:
+        """acquire 的协程版本：排队期间不占用线程"""
+        with closing(self._waits(tokens, max_wait)) as waits:
+            for delay in waits:
+                await asyncio.sleep(delay)
+        try:
+            yield self
+        finally:
+            self._release()
+
+    def _recover_locked(self, now: float) -> None:
+        """暂停结束后按经过的时间恢复速率（不依赖是否有成功调用）"""
+        if self._rate_factor < 1.0 and now > self._blocked_until:
+            elapsed = now - max(self._recovered_at, self._blocked_until)
+            self._rate_factor = min(1.0, self._rate_factor + elapsed * 0.9 / self.recovery_seconds)
+        self._recovered_at = now
+
+    def record_success(self) -> None:
+        """调用成功：加快速率恢复"""
+        with self._lock:
+            self._recover_locked(time.monotonic())
+            self._rate_factor = min(1.0, self._rate_factor + 0.05)
+
+    def record_usage(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """用实际消耗的token修正预估值"""
+        with self._lock:
+            self._tokens.take(actual_tokens - estimated_tokens)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """服务商返回429：暂停放行并降低速率（默认暂停5秒）"""
+        with self._lock:
+            now = time.monotonic()
+            self._recover_locked(now)
+            self._throttled += 1
+            pause = retry_after if retry_after is not None else 5.0
+            self._blocked_until = max(self._blocked_until, now + pause)
+            self._rate_factor = max(0.1, self._rate_factor / 2)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._recover_locked(time.monotonic())
+            return {
+                "queue_depth": self._waiting,
+                "in_flight": self._in_flight,
+                "acquired_total": self._acquired,
+                "shed_total": self._shed,
+                "throttled_total": self._throttled,
+                "wait_seconds_total": round(self._wait_total, 3),
+                "wait_seconds_max": round(self._wait_max, 3),
+                "rate_factor": round(self._rate_factor, 3),
+                "blocked_for_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+            }
+
+
+# 按模型名共享的限流器
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: Optional[str]) -> RateLimiter:
+    """获取某个模型的进程级限流器（未配置过则为不限速率的默认值）"""
+    key = model_name or ""
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(name=key)
+        return _limiters[key]
+
+
+def all_rate_limiters() -> Dict[str, RateLimiter]:
+    """按模型名列出本进程内的全部限流器（供指标导出）"""
+    with _limiters_lock:
+        return dict(_limiters)
+
+
+def configure_rate_limiter(model_name: Optional[str], **limits: Any) -> RateLimiter:
+    """按配置设置某个模型的限额"""
+    limiter = get_rate_limiter(model_name)
+    limiter.configure(**limits)
+    return limiter
@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from rag_system import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# OTLP 中的 SpanKind 与状态码
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+# 当前请求的 Trace 与当前 Span（线程池任务复制上下文后同样可见）
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("rag_trace", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("rag_span", default=None)
+
+
+class Span:
+    """一个计时区间，字段与 OpenTelemetry 的 Span 对应"""
+
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str = "", kind: int = SPAN_KIND_INTERNAL, start_ns: Optional[int] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self, trace_id: str) -> Dict[str, Any]:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns if self.end_ns is not None else time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": _STATUS_ERROR, "message": self.error} if self.error else {"code": _STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Trace:
+    """一个请求（或后台任务）内的所有 Span；检索/重排序在线程池中执行，添加 Span 需要加锁"""
+
+    def __init__(self, name: str, kind: int = SPAN_KIND_SERVER, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, kind=kind, attributes=attributes)
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return [self.root] + self._spans
+
+    def timings(self) -> Dict[str, float]:
+        """
+        按名称汇总已结束 Span 的耗时（毫秒），total 为请求开始至今的耗时。
+        同名 Span 嵌套时（例如 search 内部再调用带 search Span 的函数）只计最外层，避免重复累加
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = list(self._spans)
+        by_id = {span.span_id: span for span in spans}
+        for span in spans:
+            if span.end_ns is None or _has_ancestor_named(span, span.name, by_id):
+                continue
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms()
+        timings = {name: round(ms, 2) for name, ms in totals.items()}
+        timings["total"] = round(self.root.duration_ms(), 2)
+        return timings
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头的值，例如 search;dur=35.2, llm_call;dur=812.4, total;dur=860.1"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings().items())
+
+
+def _has_ancestor_named(span: Span, name: str, by_id: Dict[str, Span]) -> bool:
+    parent = by_id.get(span.parent_id)
+    while parent is not None:
+        if parent.name == name:
+            return True
+        parent = by_id.get(parent.parent_id)
+    return False
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def trace(name: str, kind: int = SPAN_KIND_SERVER, **attributes: Any) -> Iterator[Trace]:
+    """开始一个 Trace（每个请求或后台任务一个），结束时导出"""
+    current = Trace(name, kind=kind, attributes=attributes)
+    trace_token = _trace.set(current)
+    span_token = _span.set(current.root)
+    try:
+        yield current
+    except BaseException as e:
+        current.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.root.end()
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+        export(current)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """在当前 Trace 中记录一个子 Span；不在任何 Trace 中时不做任何事"""
+    current = _trace.get()
+    if current is None:
+        yield None
+        return
+    parent = _span.get()
+    child = Span(name, parent_id=parent.span_id if parent is not None else "", attributes=attributes)
+    token = _span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end()
+        _span.reset(token)
+        current.add(child)
+
+
+def traced(name: str):
+    """把函数（同步或协程）的执行记录为一个 Span"""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class _StageListener:
+    """把 instrumentation.stage 记录的阶段作为当前 Span 的子 Span"""
+
+    def on_stage(self, stage: str, seconds: float, route: str) -> None:
+        current = _trace.get()
+        if current is None:
+            return
+        parent = _span.get()
+        end_ns = time.time_ns()
+        child = Span(stage, parent_id=parent.span_id if parent is not None else "",
+                     start_ns=end_ns - int(seconds * 1e9), attributes={"rag.stage": stage})
+        child.end(end_ns)
+        current.add(child)
+
+
+# 导出：每个 Trace 写为一行 OTLP/JSON（与 OpenTelemetry Collector 的 file exporter 格式相同，
+# 可直接用 otlpjsonfile receiver 导入）；未配置路径时不导出
+_service_name = "rag-backend"
+_listener: Optional[_StageListener] = None
+_exporter: Optional["_TraceExporter"] = None
+_exporter_lock = threading.Lock()
+
+
+class _TraceExporter:
+    """
+    在后台线程中序列化并追加写入 Trace，trace() 结束时（通常在事件循环上）只把 Trace 放入队列；
+    队列满时丢弃而不是拖慢请求。
+
+    写入线程在第一次 submit 时按进程启动：install() 通常在预加载的主进程中调用，
+    fork 出的工作进程中没有父进程的线程，需要各自启动（与 MicroBatcher 相同）
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        self.max_pending = max_pending
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_pending)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+
+    def _ensure_writer(self) -> "queue.Queue[Trace]":
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                # fork 前父进程队列中的 Trace 由父进程写入，子进程使用新的队列
+                self._queue = queue.Queue(maxsize=self.max_pending)
+                self._dropped = 0
+                self._thread_pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._write_loop, args=(self._queue,), name="trace-exporter", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def submit(self, current: Trace) -> None:
+        pending = self._ensure_writer()
+        try:
+            pending.put_nowait(current)
+        except queue.Full:
+            self._dropped += 1
+
+    def _write_loop(self, pending: "queue.Queue[Trace]") -> None:
+        while True:
+            traces = [pending.get()]
+            # 一次写入队列中已有的所有 Trace
+            while len(traces) < 1000:
+                try:
+                    traces.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = [_otlp_line(current) for current in traces]
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning("写入 Trace 失败: %s", e)
+            if self._dropped:
+                logger.warning("Trace 导出队列已满，丢弃 %d 条 Trace", self._dropped)
+                self._dropped = 0
+
+
+def install(export_path: str = "", service_name: str = "rag-backend") -> None:
+    """注册阶段监听（每个进程一次）并设置导出文件"""
+    global _listener, _exporter, _service_name
+    _service_name = service_name
+    with _exporter_lock:
+        if not export_path:
+            _exporter = None
+        elif _exporter is None or _exporter.path != export_path:
+            _exporter = _TraceExporter(export_path)
+    if _listener is None:
+        _listener = _StageListener()
+        instrumentation.add_listener(_listener)
+
+
+def _otlp_line(current: Trace) -> str:
+    record = {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": _service_name}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "rag_system"},
+                "spans": [span.to_otlp(current.trace_id) for span in current.spans()],
+            }],
+        }]
+    }
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def export(current: Trace) -> None:
+    exporter = _exporter
+    if exporter is not None:
+        exporter.submit(current)
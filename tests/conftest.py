@@ -0,0 +1,21 @@
+import os
+import sys
+import types
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+try:
+    import rag_system.llama_rag_system  # noqa: F401
+except ImportError:
+    # 未安装检索依赖（langchain、pandas 等）时用占位模块代替，使 app.service / app.jobs 可以导入；
+    # 依赖 SimpleRAG 本身的测试会被跳过
+    _placeholder = types.ModuleType("rag_system.llama_rag_system")
+
+    class SimpleRAG:
+        def __init__(self, *args, **kwargs):
+            raise RuntimeError("未安装检索依赖，无法创建 SimpleRAG")
+
+    _placeholder.SimpleRAG = SimpleRAG
+    sys.modules["rag_system.llama_rag_system"] = _placeholder
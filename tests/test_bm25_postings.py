@@ -0,0 +1,139 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from rag_system.bm25_postings import BM25Postings, top_indices
+
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:
+
+    class BM25Okapi:
+        """rank_bm25.BM25Okapi 的最小实现（未安装 rank_bm25 时作为对照），公式与计算顺序相同"""
+
+        def __init__(self, corpus, k1=1.5, b=0.75, epsilon=0.25):
+            self.k1, self.b, self.epsilon = k1, b, epsilon
+            self.corpus_size = len(corpus)
+            self.doc_freqs, self.doc_len, self.idf = [], [], {}
+            nd, num_doc = {}, 0
+            for document in corpus:
+                self.doc_len.append(len(document))
+                num_doc += len(document)
+                frequencies = {}
+                for word in document:
+                    frequencies[word] = frequencies.get(word, 0) + 1
+                self.doc_freqs.append(frequencies)
+                for word in frequencies:
+                    nd[word] = nd.get(word, 0) + 1
+            self.avgdl = num_doc / self.corpus_size
+            idf_sum, negative = 0.0, []
+            for word, freq in nd.items():
+                idf = math.log(self.corpus_size - freq + 0.5) - math.log(freq + 0.5)
+                self.idf[word] = idf
+                idf_sum += idf
+                if idf < 0:
+                    negative.append(word)
+            eps = self.epsilon * idf_sum / len(self.idf)
+            for word in negative:
+                self.idf[word] = eps
+
+        def get_scores(self, query):
+            score = np.zeros(self.corpus_size)
+            doc_len = np.array(self.doc_len)
+            for q in query:
+                q_freq = np.array([(doc.get(q) or 0) for doc in self.doc_freqs])
+                score += (self.idf.get(q) or 0) * (
+                    q_freq * (self.k1 + 1) / (q_freq + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl))
+                )
+            return score
+
+
+_CATEGORIES = ["Data Science", "Java Developer", "HR", "Testing"]
+# 常见词出现在大部分文档中（倒排表超过分段阈值），其余词只出现在少数文档中
+_COMMON = ["python", "sql", "team", "project", "experience"]
+_RARE = [f"skill{i}" for i in range(200)]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(7)
+    documents, labels = [], []
+    for _ in range(800):
+        words = rng.choices(_COMMON, k=rng.randint(3, 12)) + rng.choices(_RARE, k=rng.randint(1, 8))
+        documents.append(words)
+        labels.append(rng.choice(_CATEGORIES))
+    return documents, labels
+
+
+@pytest.fixture(scope="module")
+def vectorizer(corpus):
+    return BM25Okapi(corpus[0])
+
+
+@pytest.fixture(scope="module")
+def postings(vectorizer, corpus):
+    return BM25Postings.from_vectorizer(vectorizer, corpus[1])
+
+
+_QUERIES = [
+    ["python", "sql"],
+    ["skill3", "skill42", "team"],
+    ["python", "python", "skill7"],  # 重复的查询词重复计分
+    ["unknown", "skill199"],
+    ["missing"],
+]
+
+
+def test_partitions_long_postings_only(postings):
+    assert postings.postings["python"][2] is not None
+    assert postings.postings["skill3"][2] is None
+
+
+# 倒排表与 get_scores 的计算顺序相同，得分逐位一致
+@pytest.mark.parametrize("tokens", _QUERIES)
+def test_scores_match_bm25okapi(vectorizer, postings, tokens):
+    np.testing.assert_array_equal(postings.get_scores(tokens), vectorizer.get_scores(tokens))
+
+
+@pytest.mark.parametrize("tokens", _QUERIES)
+@pytest.mark.parametrize("categories", [["HR"], ["Testing", "Data Science"], ["HR", "不存在的类别"], []])
+def test_category_scores_match_filtered_full_scores(vectorizer, postings, tokens, categories):
+    positions = postings.positions_for(categories)
+    expected = vectorizer.get_scores(tokens)[positions]
+    np.testing.assert_array_equal(postings.get_scores(tokens, categories), expected)
+
+
+@pytest.mark.parametrize("categories", [None, ["Java Developer"], ["HR", "Testing"]])
+def test_top_n_matches_brute_force(vectorizer, postings, corpus, categories):
+    tokens = ["python", "skill3", "skill17"]
+    scores = vectorizer.get_scores(tokens)
+    allowed = range(len(scores)) if categories is None else [
+        i for i, label in enumerate(corpus[1]) if label in categories
+    ]
+    # 同分时按文档下标排序
+    expected = sorted(allowed, key=lambda i: (-scores[i], i))[:10]
+    assert list(postings.top_n(tokens, 10, categories)) == expected
+
+
+def test_positions_for_orders_by_category(postings, corpus):
+    positions = postings.positions_for(["Testing", "HR"])
+    labels = [corpus[1][i] for i in positions]
+    assert labels == sorted(labels)
+    assert set(positions) == {i for i, label in enumerate(corpus[1]) if label in ("HR", "Testing")}
+
+
+def test_other_vectorizers_are_not_supported():
+    class BM25Plus:
+        doc_freqs = [{"a": 1}]
+
+    assert BM25Postings.from_vectorizer(BM25Plus()) is None
+
+
+def test_top_indices_breaks_ties_by_key():
+    scores = np.array([1.0, 3.0, 3.0, 2.0, 3.0])
+    assert list(top_indices(scores, 3)) == [1, 2, 4]
+    assert list(top_indices(scores, 3, keys=np.array([9, 8, 7, 6, 5]))) == [4, 2, 1]
+    assert list(top_indices(scores, 0)) == []
+    assert list(top_indices(scores, 10)) == [1, 2, 4, 3, 0]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from rag_system.category_index import CategoryIndex, CategoryPositions
+
+faiss = pytest.importorskip("faiss")
+
+_LABELS = ["HR", "Testing", "Data Science", "Java Developer"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((600, 16)).astype("float32")
+    labels = [_LABELS[i] for i in rng.integers(0, len(_LABELS), len(vectors))]
+    queries = rng.standard_normal((5, 16)).astype("float32")
+    return vectors, labels, queries
+
+
+def _flat_index(vectors, metric):
+    index = faiss.IndexFlat(vectors.shape[1], metric)
+    index.add(vectors)
+    return index
+
+
+def _brute_force(vectors, labels, queries, k, categories, metric):
+    """在所选类别的向量中逐个计算相似度，返回每个查询的前 k 个位置"""
+    allowed = np.array([i for i, label in enumerate(labels) if label in categories], dtype=np.int64)
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        distances = -(queries @ vectors[allowed].T)
+    else:
+        distances = ((queries[:, None, :] - vectors[allowed][None, :, :]) ** 2).sum(axis=2)
+    return [allowed[np.argsort(row, kind="stable")[:k]] for row in distances]
+
+
+@pytest.mark.parametrize("metric", ["l2", "ip"])
+@pytest.mark.parametrize("build_subindexes", [False, True])
+@pytest.mark.parametrize("categories", [["HR"], ["Testing", "Java Developer"], ["HR", "不存在的类别"]])
+def test_search_matches_brute_force(data, metric, build_subindexes, categories):
+    vectors, labels, queries = data
+    metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    category_index = CategoryIndex(labels, _flat_index(vectors, metric), build_subindexes=build_subindexes)
+    assert bool(category_index.subindexes) == build_subindexes
+
+    results = category_index.search(queries, 10, categories)
+    expected = _brute_force(vectors, labels, queries, 10, categories, metric)
+    assert results is not None
+    for got, want in zip(results, expected):
+        assert list(got) == list(want)
+
+
+def test_search_with_more_k_than_documents(data):
+    vectors, labels, queries = data
+    category_index = CategoryIndex(labels, _flat_index(vectors, faiss.METRIC_L2), build_subindexes=True)
+    count = labels.count("HR")
+    results = category_index.search(queries, count + 50, ["HR"])
+    for row in results:
+        assert sorted(row) == [i for i, label in enumerate(labels) if label == "HR"]
+
+
+def test_unknown_categories_return_empty_results(data):
+    vectors, labels, queries = data
+    category_index = CategoryIndex(labels, _flat_index(vectors, faiss.METRIC_L2))
+    results = category_index.search(queries, 5, ["不存在的类别"])
+    assert [len(row) for row in results] == [0] * len(queries)
+
+
+def test_subindexes_only_for_flat_indexes(data):
+    vectors, labels, _ = data
+    quantizer = faiss.IndexFlatL2(vectors.shape[1])
+    ivf = faiss.IndexIVFFlat(quantizer, vectors.shape[1], 4)
+    ivf.train(vectors)
+    ivf.add(vectors)
+    assert CategoryIndex(labels, ivf, build_subindexes=True).subindexes == {}
+    flat = CategoryIndex(labels, _flat_index(vectors, faiss.METRIC_L2), build_subindexes=True)
+    assert flat.subindex_bytes == vectors.nbytes
+
+
+def test_category_positions_select_is_cached_per_combination():
+    positions = CategoryPositions.from_labels(["a", "b", "a", "c", "b"])
+    selected = positions.select(["b", "a", "x"])
+    assert list(selected) == [0, 2, 1, 4]
+    assert positions.select(["a", "b"]) is selected
+    assert list(positions.select([])) == []
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from rag_system.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure(RuntimeError("boom"))
+    assert breaker.allow_request() and breaker.state == STATE_CLOSED
+    breaker.record_failure(RuntimeError("boom"))
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow_request()
+    stats = breaker.stats()
+    assert stats["opened_total"] == 1 and stats["rejected_total"] == 1 and "boom" in stats["last_error"]
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure(RuntimeError("boom"))
+    breaker.record_success()
+    breaker.record_failure(RuntimeError("boom"))
+    assert breaker.state == STATE_CLOSED
+
+
+def test_probe_closes_the_breaker_after_recovery():
+    attempts = []
+    probing = threading.Event()
+    release = threading.Event()
+
+    def probe():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("still down")
+        probing.set()
+        release.wait(5)
+
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=0.01, probe=probe)
+    breaker.record_failure(RuntimeError("boom"))
+    assert breaker.state == STATE_OPEN
+    # 第一次探测失败后保持打开，第二次探测期间为半开
+    assert probing.wait(5)
+    assert breaker.state == STATE_HALF_OPEN and not breaker.allow_request()
+    release.set()
+    assert _wait_for(lambda: breaker.state == STATE_CLOSED)
+    assert breaker.allow_request()
+    assert len(attempts) == 2
+
+
+def test_without_probe_stays_open_until_success():
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=0.01)
+    breaker.record_failure(RuntimeError("boom"))
+    time.sleep(0.05)
+    assert breaker.state == STATE_OPEN
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from rag_system.deadline import (
+    STAGE_LLM,
+    STAGE_RERANK,
+    STAGE_RERANK_DEPTH,
+    Deadline,
+    RequestCancelled,
+    StageLatency,
+    stage_latency,
+)
+
+
+@pytest.fixture
+def estimates(monkeypatch):
+    """固定各阶段的耗时估计（进程内共享的滑动平均会被其他调用更新）"""
+    values = {"retrieval": 0.01, "rerank_per_pair": 0.1, "llm_per_candidate": 0.5}
+    monkeypatch.setattr(stage_latency, "_estimates", dict(values))
+    return values
+
+
+def test_unlimited_deadline():
+    deadline = Deadline.from_ms(0)
+    assert not deadline.limited and not deadline.expired()
+    assert deadline.affords("llm_per_candidate", 1000)
+
+
+def test_affords_scales_with_count(estimates):
+    deadline = Deadline(1200)
+    assert deadline.affords("llm_per_candidate", 2)
+    assert not deadline.affords("llm_per_candidate", 3)
+    deadline.reserved = 1.0
+    assert deadline.available() == pytest.approx(0.2, abs=0.05)
+
+
+def test_degrade_keeps_first_occurrence_order():
+    deadline = Deadline()
+    deadline.degrade(STAGE_LLM, STAGE_RERANK)
+    deadline.degrade(STAGE_RERANK, STAGE_RERANK_DEPTH)
+    assert deadline.degraded == [STAGE_LLM, STAGE_RERANK, STAGE_RERANK_DEPTH]
+
+
+def test_stage_latency_moving_average():
+    latency = StageLatency({"llm_per_candidate": 2.0}, alpha=0.5)
+    latency.record("llm_per_candidate", 1.0)
+    latency.record("rerank_per_pair", 0.02)
+    assert latency.estimate("llm_per_candidate") == 1.5
+    assert latency.estimate("rerank_per_pair") == 0.02
+    assert latency.estimate("unknown") == 0.0
+
+
+def test_cancel_runs_callbacks_once():
+    deadline = Deadline()
+    calls = []
+    deadline.on_cancel(lambda: calls.append("first"))
+    unregister = deadline.on_cancel(lambda: calls.append("removed"))
+    unregister()
+    deadline.cancel()
+    deadline.cancel()
+    # 已取消时注册的回调立即执行
+    deadline.on_cancel(lambda: calls.append("late"))
+    assert calls == ["first", "late"]
+    with pytest.raises(RequestCancelled):
+        deadline.check()
+
+
+def test_wait_unregisters_its_callback():
+    deadline = Deadline()
+    for _ in range(100):
+        future = Future()
+        future.set_result(1)
+        assert deadline.wait(future) == 1
+    assert deadline._on_cancel == []
+
+
+def test_cancel_withdraws_pending_work():
+    deadline = Deadline()
+    future = Future()
+    threading.Timer(0.05, deadline.cancel).start()
+    with pytest.raises(RequestCancelled):
+        deadline.wait(future)
+    assert future.cancelled()
+
+
+# 20 个候选人、top_k=2：重排序全部候选人需 2 秒，评估 2 个候选人需 1 秒
+@pytest.mark.parametrize(
+    "budget_ms, degraded",
+    [
+        (None, set()),
+        (10_000, set()),
+        (1_500, {STAGE_RERANK_DEPTH}),  # 预留 1 秒给大模型，剩余时间只够重排序前 5 个
+        (1_100, {STAGE_RERANK}),  # 剩余时间不够重排序 top_k 个
+        (500, {STAGE_LLM, STAGE_RERANK_DEPTH}),  # 不够评估，全部时间留给重排序
+        (100, {STAGE_LLM, STAGE_RERANK}),
+    ],
+)
+def test_score_candidates_degrades_by_budget(stub_rag, estimates, budget_ms, degraded):
+    deadline = Deadline.from_ms(budget_ms)
+    start = time.monotonic()
+    results = stub_rag.score_candidates("Python 数据分析", "Python, SQL", top_k=2, deadline=deadline)
+    assert set(deadline.degraded) == degraded
+    assert len(results) == 2
+    # 跳过评估时为零分结果，否则为模拟服务返回的评估
+    expected = "剩余时间不足" if STAGE_LLM in degraded else "关键词重合"
+    assert all(expected in result["strengths"] for result in results)
+    if budget_ms:
+        assert time.monotonic() - start < budget_ms / 1000 + 0.5
+
+
+@pytest.fixture
+def stub_rag(monkeypatch):
+    """
+    使用模拟大模型服务（benchmarks.stub_llm）的 SimpleRAG：检索直接返回固定名单，
+    重排序按简历长度打分，只有大模型调用走真实的 HTTP 客户端
+    """
+    pytest.importorskip("langchain_openai")
+    pytest.importorskip("pandas")
+    from langchain_openai import ChatOpenAI
+
+    from benchmarks.stub_llm import serve_in_thread
+    from rag_system.batching import MicroBatcher
+    from rag_system.llama_rag_system import SimpleRAG
+    from rag_system.rate_limiter import RateLimiter
+
+    documents = [
+        {"id": i, "category": "Data Science", "content": f"Skills: Python, SQL; {i} years " + "x" * i,
+         "retrieval_score": 1.0 / (i + 1), "preview": ""}
+        for i in range(20)
+    ]
+    with serve_in_thread(latency="fixed:0.05") as base_url:
+
+        def init_components(self):
+            self.llm = ChatOpenAI(
+                model_name="stub", openai_api_key="stub", openai_api_base=base_url, max_retries=0, timeout=10
+            )
+            self.cross_encoder = object()
+            self.rerank_batcher = MicroBatcher(lambda pairs: [float(len(text)) for _, text in pairs], name="rerank")
+
+        monkeypatch.setattr(SimpleRAG, "_init_components", init_components)
+        monkeypatch.setattr(SimpleRAG, "_load_data", lambda self: None)
+        monkeypatch.setattr(SimpleRAG, "_build_retriever", lambda self: None)
+        rag = SimpleRAG("unused.csv", rate_limiter=RateLimiter())
+        rag.search = lambda query, top_k=5, deadline=None, min_results=None, **kwargs: rag._rerank_results(
+            query, [dict(doc) for doc in documents], top_k, deadline, min_results
+        )
+        yield rag
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from app import service
+from config import AgentConfig
+from rag_system.llama_rag_system import SimpleRAG
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(SimpleRAG, "_parse_evaluation"), reason="未安装检索依赖（langchain、pandas 等）"
+)
+
+
+def _candidates(n):
+    return [{"id": f"r{i}", "category": "上传简历", "content": f"resume {i}"} for i in range(n)]
+
+
+def _evaluation(candidate_id, score):
+    return {"candidate_id": candidate_id, "overall_score": score, "strengths": f"评分 {score}"}
+
+
+@pytest.fixture
+def rag():
+    # 只用到解析评估结果的方法，不加载数据和模型
+    return SimpleRAG.__new__(SimpleRAG)
+
+
+def test_parse_matches_position_labels_when_one_is_dropped(rag):
+    candidates = _candidates(4)
+    text = json.dumps([_evaluation("候选人1", 1), _evaluation("候选人3", 3), _evaluation("候选人4", 4)])
+    parsed = rag._parse_evaluation(text, candidates)
+    assert [(r["candidate_info"]["id"], r["overall_score"]) for r in parsed] == [("r0", 1), ("r2", 3), ("r3", 4)]
+
+
+def test_parse_matches_candidate_ids_in_any_order(rag):
+    candidates = _candidates(3)
+    text = "评估如下：" + json.dumps([_evaluation("r2", 3), _evaluation("r0", 1), _evaluation("unknown", 9)])
+    parsed = rag._parse_evaluation(text, candidates)
+    # 无法对应的评估结果被丢弃，而不是按顺序套到别的候选人上
+    assert [(r["candidate_info"]["id"], r["overall_score"]) for r in parsed] == [("r2", 3), ("r0", 1)]
+
+
+def test_parse_falls_back_to_order_without_ids(rag):
+    candidates = _candidates(2)
+    text = json.dumps([{"overall_score": 5}, {"overall_score": 6}, {"overall_score": 7}])
+    parsed = rag._parse_evaluation(text, candidates)
+    assert [r["candidate_info"]["id"] for r in parsed] == ["r0", "r1"]
+
+
+def test_upload_scoring_marks_the_dropped_resume(rag, monkeypatch):
+    """大模型漏掉一批中间的一份简历时，只有这份简历报错，其余简历的评分不错位"""
+    calls = []
+
+    async def aevaluate_candidates(requirements, candidates, deadline=None):
+        calls.append([candidate["id"] for candidate in candidates])
+        evaluations = [
+            _evaluation(f"候选人{i}", int(candidate["id"]))
+            for i, candidate in enumerate(candidates, 1)
+            if "DROP" not in candidate["content"]
+        ]
+        return rag._parse_evaluation(json.dumps(evaluations), candidates)
+
+    async def ascore_relevance(query, texts):
+        return [0.0] * len(texts)
+
+    rag.aevaluate_candidates = aevaluate_candidates
+    rag.ascore_relevance = ascore_relevance
+    rag.llm_available = lambda: True
+    monkeypatch.setattr(service, "rag_system", rag)
+
+    async def rows():
+        for index in range(5):
+            text = "DROP me" if index == 2 else f"resume {index}"
+            yield {"index": index, "id": str(index), "category": "上传简历", "text": text}
+
+    async def collect():
+        cfg = AgentConfig(api_key="", upload_batch_size=5, upload_max_concurrency=1)
+        return [event async for event in service.ascore_resumes("dev", "Python", rows(), cfg, top_n=5)]
+
+    events = asyncio.run(collect())
+    results = {index: result for event, (index, result) in (e for e in events if e[0] == "result")}
+    errors = [payload["index"] for event, payload in events if event == "error"]
+    assert errors == [2]
+    assert {index: (r["candidate_info"]["id"], service._summary_score(r)) for index, r in results.items()} == {
+        0: ("0", 0), 1: ("1", 1), 3: ("3", 3), 4: ("4", 4)
+    }
+    # 只为漏掉的简历重试一次
+    assert calls == [["0", "1", "2", "3", "4"], ["2"]]
@@ -0,0 +1,195 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app import jobs
+from app.jobs import JOB_CANCELLED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobManager, JobStore
+from config import AgentConfig
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_claim_is_exclusive(store):
+    store.create("job1", {"job_title": "岗位"})
+    assert store.queued() == ["job1"]
+    assert store.claim("job1", "worker-a", 60)
+    assert not store.claim("job1", "worker-b", 60)
+    job = store.get("job1")
+    assert job["status"] == JOB_RUNNING and job["owner"] == "worker-a"
+    assert store.queued() == []
+
+
+def test_updates_require_the_owner(store):
+    store.create("job1", {})
+    store.claim("job1", "worker-a", 60)
+    assert store.update("job1", owner="worker-a", partial=[[0, {"score": 1}]], total=3)
+    assert not store.update("job1", owner="worker-b", total=5)
+    job = store.get("job1")
+    assert job["partial"] == [[0, {"score": 1}]] and job["total"] == 3
+
+
+def test_cancel_stops_queued_and_running_jobs(store):
+    store.create("queued", {})
+    store.create("running", {})
+    store.claim("running", "worker-a", 60)
+    assert store.cancel("queued") and store.cancel("running")
+    assert not store.claim("queued", "worker-a", 60)
+    # 运行中的进程在续约或写入进度时发现任务已取消
+    assert store.renew("worker-a", ["running"], 60) == ["running"]
+    assert not store.update("running", owner="worker-a", status=JOB_SUCCEEDED)
+    assert store.get("running")["status"] == JOB_CANCELLED
+    # 已结束的任务不能再取消
+    assert not store.cancel("running")
+    assert not store.cancel("missing")
+
+
+def test_expired_leases_are_requeued(store):
+    store.create("alive", {})
+    store.create("dead", {})
+    store.claim("alive", "worker-a", 60)
+    store.claim("dead", "worker-b", -1)
+    store.update("dead", owner="worker-b", partial=[[0, {}]], total=1)
+    assert store.requeue_expired() == ["dead"]
+    job = store.get("dead")
+    assert job["status"] == JOB_QUEUED and job["owner"] is None and job["partial"] == [] and job["total"] == 0
+    assert store.renew("worker-a", ["alive"], 60) == []
+    assert store.requeue_expired() == []
+
+
+def test_old_tables_are_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, "
+            "partial TEXT NOT NULL DEFAULT '[]', total INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+    store = JobStore(path)
+    store.create("job1", {})
+    assert store.claim("job1", "worker-a", 60)
+
+
+class FakeStream:
+    """stream_score_from_dataset 的替身：产出候选人列表后逐个产出评估，可在中途暂停"""
+
+    def __init__(self, count: int = 3):
+        self.count = count
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+        self.calls = []
+
+    def __call__(self, job_title, requirements, top_n, cfg, deadline=None, categories=None):
+        self.calls.append(job_title)
+        yield "candidates", [{"id": i} for i in range(self.count)]
+        self.started.set()
+        results = []
+        for rank in range(self.count):
+            self.proceed.wait(5)
+            deadline.check()
+            result = {"id": rank, "overall_score": rank}
+            results.append((rank, result))
+            yield "evaluation", (rank, result)
+        yield "summary", results
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    def create(stream):
+        monkeypatch.setattr(jobs, "stream_score_from_dataset", stream)
+        cfg = AgentConfig(api_key="", job_db_path=str(tmp_path / "jobs.db"), job_workers=2, job_lease_seconds=30)
+        return JobManager(cfg)
+
+    return create
+
+
+def test_job_runs_to_completion(manager):
+    stream = FakeStream()
+    job_manager = manager(stream)
+    job_id = job_manager.submit("岗位", "要求", 3, categories=["HR"])
+    assert _wait_for(lambda: job_manager.get(job_id)["status"] == JOB_SUCCEEDED)
+    job = job_manager.get(job_id)
+    assert job["request"] == {"job_title": "岗位", "requirements": "要求", "top_n": 3, "categories": ["HR"]}
+    assert job["total"] == 3 and len(job["partial"]) == 3
+    assert job["result"] == [[rank, {"id": rank, "overall_score": rank}] for rank in range(3)]
+
+
+def test_progress_writes_are_throttled(manager, monkeypatch):
+    stream = FakeStream(count=50)
+    job_manager = manager(stream)
+    job_manager.cfg.job_progress_interval = 60
+    writes = []
+    update = job_manager.store.update
+
+    def counting_update(job_id, owner=None, **fields):
+        if "partial" in fields:
+            writes.append(len(fields["partial"]))
+        return update(job_id, owner=owner, **fields)
+
+    monkeypatch.setattr(job_manager.store, "update", counting_update)
+    job_id = job_manager.submit("岗位", "要求", 50)
+    assert _wait_for(lambda: job_manager.get(job_id)["status"] == JOB_SUCCEEDED)
+    # 间隔内不写入进度，任务结束时一次写入全部评估
+    assert writes == [50]
+    assert len(job_manager.get(job_id)["partial"]) == 50
+
+
+def test_cancel_running_job(manager):
+    stream = FakeStream()
+    stream.proceed.clear()
+    job_manager = manager(stream)
+    job_id = job_manager.submit("岗位", "要求", 3)
+    assert stream.started.wait(5)
+    assert job_manager.cancel(job_id)["status"] == JOB_CANCELLED
+    stream.proceed.set()
+    assert _wait_for(lambda: not job_manager._pending)
+    job = job_manager.get(job_id)
+    assert job["status"] == JOB_CANCELLED and job["result"] is None and job["partial"] == []
+    # 已取消的任务保持原状态
+    assert job_manager.cancel(job_id)["status"] == JOB_CANCELLED
+    assert job_manager.cancel("missing") is None
+
+
+def test_resume_requeues_jobs_of_exited_workers(manager, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.create("queued", {"job_title": "排队中", "requirements": "", "top_n": 2})
+    store.create("orphaned", {"job_title": "进程已退出", "requirements": "", "top_n": 2})
+    store.claim("orphaned", "exited-worker", -1)
+    store.create("other", {"job_title": "其他进程运行中", "requirements": "", "top_n": 2})
+    store.claim("other", "live-worker", 60)
+
+    stream = FakeStream(count=2)
+    job_manager = manager(stream)
+    job_manager.resume_unfinished()
+    assert _wait_for(lambda: all(job_manager.get(j)["status"] == JOB_SUCCEEDED for j in ("queued", "orphaned")))
+    assert job_manager.get("other")["status"] == JOB_RUNNING
+    assert sorted(stream.calls) == sorted(["排队中", "进程已退出"])
+
+
+def test_get_job_manager_starts_heartbeat_and_resumes(manager, tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.create("queued", {"job_title": "排队中", "requirements": "", "top_n": 1})
+    stream = FakeStream(count=1)
+    cfg = manager(stream).cfg
+    monkeypatch.setattr(jobs, "job_manager", None)
+    job_manager = jobs.get_job_manager(cfg)
+    assert job_manager._heartbeat is not None and job_manager._heartbeat.is_alive()
+    assert _wait_for(lambda: job_manager.get("queued")["status"] == JOB_SUCCEEDED)
+    assert jobs.get_job_manager(cfg) is job_manager
+    # fork 前在父进程中创建的实例不会在子进程中复用
+    monkeypatch.setattr(job_manager, "pid", -1)
+    assert jobs.get_job_manager(cfg) is not job_manager
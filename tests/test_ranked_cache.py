@@ -0,0 +1,98 @@
+import pytest
+
+from app import ranked_cache
+from app.ranked_cache import CursorExpired, RankedListCache, decode_cursor, encode_cursor, get_ranked_cache
+from config import AgentConfig
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ranked_cache, "time", clock)
+    return clock
+
+
+def _candidates(count: int, size: int = 100):
+    return [{"id": i, "content": "x" * size, "preview": ""} for i in range(count)]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("abc123", 40)) == ("abc123", 40)
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "abc.", ".10", "abc.-1", "abc.x"])
+def test_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_expired_is_a_lookup_error():
+    assert issubclass(CursorExpired, LookupError)
+
+
+def test_pages_are_copies(clock):
+    cache = RankedListCache(ttl_seconds=60, max_bytes=1 << 20)
+    list_id = cache.put(("岗位", "要求"), "岗位", "要求", "v1", _candidates(10))
+    entry = cache.get(list_id)
+    page = entry.page(4, 3)
+    assert [c["id"] for c in page] == [4, 5, 6]
+    page[0]["overall_score"] = 9
+    assert "overall_score" not in cache.get(list_id).candidates[4]
+    assert cache.has_more(list_id, 9)
+    assert not cache.has_more(list_id, 10)
+
+
+def test_same_key_reuses_list_id(clock):
+    cache = RankedListCache(ttl_seconds=60, max_bytes=1 << 20)
+    first = cache.put(("岗位", "要求", "v1"), "岗位", "要求", "v1", _candidates(3))
+    second = cache.put(("岗位", "要求", "v1"), "岗位", "要求", "v1", _candidates(5))
+    assert first == second
+    assert len(cache.get(first).candidates) == 5
+    assert cache.stats()["entries"] == 1
+    assert cache.put(("岗位", "要求", "v2"), "岗位", "要求", "v2", _candidates(3)) != first
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = RankedListCache(ttl_seconds=30, max_bytes=1 << 20)
+    list_id = cache.put("key", "岗位", "要求", "v1", _candidates(3))
+    clock.now += 29
+    assert cache.get(list_id) is not None
+    clock.now += 1
+    assert not cache.has_more(list_id, 0)
+    assert cache.get(list_id) is None
+    stats = cache.stats()
+    assert stats["entries"] == 0 and stats["size_bytes"] == 0 and stats["expired_total"] == 1
+
+
+def test_least_recently_used_lists_are_evicted(clock):
+    one_list = ranked_cache._estimate_bytes(_candidates(4))
+    cache = RankedListCache(ttl_seconds=60, max_bytes=one_list * 2)
+    first = cache.put("first", "a", "", "v1", _candidates(4))
+    second = cache.put("second", "b", "", "v1", _candidates(4))
+    cache.get(first)
+    third = cache.put("third", "c", "", "v1", _candidates(4))
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+    assert cache.stats()["evicted_total"] == 1
+
+
+def test_oversized_lists_are_not_cached(clock):
+    cache = RankedListCache(ttl_seconds=60, max_bytes=1000)
+    assert cache.put("key", "岗位", "要求", "v1", _candidates(50)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_disabled_for_multiple_workers(monkeypatch):
+    monkeypatch.setattr(ranked_cache, "_cache", None)
+    assert get_ranked_cache(AgentConfig(api_key="", web_workers=2)) is None
+    assert get_ranked_cache(AgentConfig(api_key="", ranked_cache_max_mb=0)) is None
+    cache = get_ranked_cache(AgentConfig(api_key="", web_workers=1))
+    assert cache is not None and get_ranked_cache(AgentConfig(api_key="")) is cache
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+
+import pytest
+
+from rag_system import rate_limiter
+from rag_system.rate_limiter import RateLimiter, RateLimitExceeded, is_rate_limit_error, retry_after_seconds
+
+
+class FakeClock:
+    """可控的 time 模块替身：sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_unlimited_by_default(clock):
+    limiter = RateLimiter()
+    for _ in range(100):
+        with limiter.acquire(tokens=10_000):
+            pass
+    stats = limiter.stats()
+    assert stats["acquired_total"] == 100 and stats["in_flight"] == 0 and clock.slept == []
+
+
+def test_requests_per_minute_bucket_waits_for_refill(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    for _ in range(60):
+        with limiter.acquire():
+            pass
+    start = clock.now
+    with limiter.acquire():
+        pass
+    # 每秒补充一个令牌
+    assert clock.now - start == pytest.approx(1.0)
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0 and stats["wait_seconds_max"] == pytest.approx(1.0)
+
+
+def test_token_bucket_and_usage_correction(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    with limiter.acquire(tokens=300):
+        pass
+    # 实际只用了 100 个 token，退回 200 个
+    limiter.record_usage(300, 100)
+    with limiter.acquire(tokens=500):
+        pass
+    assert clock.slept == []
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        with limiter.acquire(tokens=300, max_wait=1):
+            pass
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+
+
+def test_sheds_when_queue_is_full_or_wait_is_too_long(clock):
+    limiter = RateLimiter(requests_per_minute=1, max_queue=0)
+    with limiter.acquire():
+        pass
+    with pytest.raises(RateLimitExceeded, match="排队 0 个"):
+        with limiter.acquire():
+            pass
+    limiter.configure(requests_per_minute=1, max_queue=10, max_wait=5)
+    with limiter.acquire():
+        pass
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        with limiter.acquire():
+            pass
+    assert excinfo.value.retry_after == pytest.approx(60.0)
+    assert limiter.stats()["shed_total"] == 2
+
+
+def test_concurrency_limit(clock):
+    limiter = RateLimiter(max_concurrency=1)
+    with limiter.acquire():
+        assert limiter.stats()["in_flight"] == 1
+        with pytest.raises(RateLimitExceeded, match="等待超时"):
+            with limiter.acquire(max_wait=0.2):
+                pass
+    assert limiter.stats()["in_flight"] == 0
+    with limiter.acquire(max_wait=0.2):
+        pass
+
+
+def test_penalize_pauses_then_recovers(clock):
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter.penalize(retry_after=2)
+    stats = limiter.stats()
+    assert stats["throttled_total"] == 1 and stats["rate_factor"] == 0.5 and stats["blocked_for_seconds"] == 2.0
+    start = clock.now
+    with limiter.acquire():
+        pass
+    assert clock.now - start >= 2.0
+
+    limiter.penalize()
+    limiter.penalize()
+    assert limiter.stats()["rate_factor"] == pytest.approx(0.125)
+    # 暂停结束后随时间线性恢复
+    clock.now += 5 + RateLimiter.recovery_seconds
+    assert limiter.stats()["rate_factor"] == 1.0
+
+
+def test_success_speeds_up_recovery(clock):
+    limiter = RateLimiter()
+    limiter.penalize(retry_after=0)
+    before = limiter.stats()["rate_factor"]
+    limiter.record_success()
+    assert limiter.stats()["rate_factor"] == pytest.approx(before + 0.05)
+
+
+def test_async_acquire_and_cancellation_leave_the_queue():
+    limiter = RateLimiter(requests_per_minute=60, max_wait=30)
+
+    async def scenario():
+        for _ in range(60):
+            async with limiter.aacquire():
+                pass
+        waiter = asyncio.create_task(_hold(limiter))
+        await asyncio.sleep(0.05)
+        assert limiter.stats()["queue_depth"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0 and stats["acquired_total"] == 60
+
+
+async def _hold(limiter):
+    async with limiter.aacquire():
+        pass
+
+
+def test_sync_waiters_share_the_queue():
+    limiter = RateLimiter(requests_per_minute=600, max_concurrency=1, max_wait=5)
+    order = []
+
+    def worker(name):
+        with limiter.acquire():
+            order.append(name)
+
+    with limiter.acquire():
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for _ in range(100):
+            if limiter.stats()["queue_depth"] == 3:
+                break
+            threading.Event().wait(0.01)
+        assert limiter.stats()["queue_depth"] == 3
+    for thread in threads:
+        thread.join(timeout=5)
+    assert sorted(order) == [0, 1, 2]
+    assert limiter.stats()["in_flight"] == 0 and limiter.stats()["queue_depth"] == 0
+
+
+def test_rate_limit_error_helpers():
+    class Response:
+        headers = {"retry-after": "3"}
+
+    class ProviderError(Exception):
+        response = Response()
+
+    assert is_rate_limit_error(ProviderError("Error code: 429"))
+    assert is_rate_limit_error(Exception("Rate limit reached"))
+    assert not is_rate_limit_error(Exception("500 internal error"))
+    assert retry_after_seconds(ProviderError("429")) == 3.0
+    assert retry_after_seconds(Exception("429, retry after 1.5 seconds")) == 1.5
+    assert retry_after_seconds(Exception("429")) is None
+
+
+def test_limiters_are_shared_per_model():
+    limiter = rate_limiter.configure_rate_limiter("test-model", requests_per_minute=10)
+    assert rate_limiter.get_rate_limiter("test-model") is limiter
+    assert limiter.name == "test-model"
+    assert rate_limiter.all_rate_limiters()["test-model"] is limiter
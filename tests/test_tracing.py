@@ -0,0 +1,64 @@
+import json
+import os
+import time
+
+import pytest
+
+from rag_system import tracing
+
+
+def _read_traces(path: str, timeout: float = 5.0):
+    """等待导出线程写入，返回各行的 (Span 名称, 进程号)"""
+    end = time.monotonic() + timeout
+    while True:
+        records = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        if records or time.monotonic() > end:
+            break
+        time.sleep(0.01)
+    result = []
+    for record in records:
+        resource = record["resourceSpans"][0]
+        pid = next(a["value"]["intValue"] for a in resource["resource"]["attributes"] if a["key"] == "process.pid")
+        result.append((resource["scopeSpans"][0]["spans"][0]["name"], int(pid)))
+    return result
+
+
+@pytest.fixture
+def exporter_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "_exporter", None)
+    return str(tmp_path / "traces.jsonl")
+
+
+def test_exports_one_line_per_trace(exporter_path):
+    tracing.install(exporter_path)
+    with tracing.trace("request"):
+        with tracing.span("search"):
+            pass
+    assert _read_traces(exporter_path) == [("request", os.getpid())]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="需要 fork")
+def test_forked_worker_exports_its_traces(tmp_path, exporter_path):
+    # 与预加载多进程模式相同：主进程中 install（并已导出过 Trace）后再 fork 工作进程
+    tracing.install(exporter_path)
+    with tracing.trace("master"):
+        pass
+    assert _read_traces(exporter_path) == [("master", os.getpid())]
+
+    child_path = str(tmp_path / "child.jsonl")
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            tracing.install(child_path)
+            with tracing.trace("worker"):
+                pass
+            status = 0 if _read_traces(child_path) == [("worker", os.getpid())] else 1
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert _read_traces(child_path) == [("worker", pid)]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+from app import upload
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _rows(data: bytes, fmt: str = "csv", chunk_size: int = 7):
+    async def collect():
+        return [row async for row in upload.iter_rows(_chunks(data, chunk_size), fmt)]
+
+    return asyncio.run(collect())
+
+
+_CSV = (
+    "\ufeffid,Category,Resume\n"
+    'c1,Data Science,"Python, SQL\nand 5 years of 数据分析"\n'
+    "c2,HR,招聘与培训\n"
+    "\n"
+    'c3,Testing,"He said ""ship it"""\n'
+    "c4,Testing,\n"
+).encode("utf-8")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1024])
+def test_csv_rows_do_not_depend_on_chunk_boundaries(chunk_size):
+    # chunk_size 为 1 时多字节字符和 BOM 都被拆开
+    rows = _rows(_CSV, chunk_size=chunk_size)
+    assert rows == [
+        {"index": 0, "id": "c1", "category": "Data Science", "text": "Python, SQL\nand 5 years of 数据分析"},
+        {"index": 1, "id": "c2", "category": "HR", "text": "招聘与培训"},
+        {"index": 2, "id": "c3", "category": "Testing", "text": 'He said "ship it"'},
+        {"index": 3, "error": "缺少简历文本（resume/resume_text/text/content 列）"},
+    ]
+
+
+def test_csv_single_column_and_default_fields():
+    rows = _rows("简历\nfirst resume\nsecond resume".encode("utf-8"))
+    assert rows == [
+        {"index": 0, "id": 0, "category": "上传简历", "text": "first resume"},
+        {"index": 1, "id": 1, "category": "上传简历", "text": "second resume"},
+    ]
+
+
+def test_csv_unbalanced_quote_at_end_of_file():
+    with pytest.raises(ValueError, match="引号不配对"):
+        _rows(b'Resume\n"never closed\nmore text\n')
+
+
+def test_csv_record_size_limit(monkeypatch):
+    monkeypatch.setattr(upload, "MAX_RECORD_CHARS", 50)
+    with pytest.raises(ValueError, match="单条记录超过"):
+        _rows(b'Resume\n"' + b"x\n" * 40 + b'"\n')
+    with pytest.raises(ValueError, match="单行超过"):
+        _rows(b"Resume\n" + b"x" * 200 + b"\n", chunk_size=64)
+
+
+def test_jsonl_rows_report_errors_without_stopping():
+    lines = [
+        json.dumps({"candidate_id": 7, "category": "HR", "resume_text": " 招聘 "}, ensure_ascii=False),
+        "",
+        "{not json",
+        json.dumps("纯文本简历", ensure_ascii=False),
+        json.dumps([1, 2]),
+        json.dumps({"note": "只有一个字段"}, ensure_ascii=False),
+        json.dumps({"id": 1, "category": "HR"}),
+    ]
+    rows = _rows("\n".join(lines).encode("utf-8"), fmt="jsonl")
+    assert rows[0] == {"index": 0, "id": 7, "category": "HR", "text": "招聘"}
+    assert rows[1]["index"] == 1 and rows[1]["error"].startswith("JSON 解析失败")
+    assert rows[2] == {"index": 2, "id": 2, "category": "上传简历", "text": "纯文本简历"}
+    assert rows[3] == {"index": 3, "error": "记录必须是对象或字符串"}
+    assert rows[4] == {"index": 4, "id": 4, "category": "上传简历", "text": "只有一个字段"}
+    assert rows[5] == {"index": 5, "error": "缺少简历文本（resume/resume_text/text/content 列）"}
+
+
+def test_unsupported_format():
+    with pytest.raises(ValueError, match="不支持的格式"):
+        _rows(b"", fmt="xlsx")
+
+
+@pytest.mark.parametrize(
+    "content_type, fmt, expected",
+    [
+        ("text/csv", None, "csv"),
+        ("application/x-ndjson", None, "jsonl"),
+        ("application/json", None, "jsonl"),
+        ("", None, "csv"),
+        ("application/json", "CSV", "csv"),
+    ],
+)
+def test_detect_format(content_type, fmt, expected):
+    assert upload.detect_format(content_type, fmt) == expected